@@ -0,0 +1,90 @@
+import asyncio
+import os
+import weakref
+from typing import Awaitable, Callable
+
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+# Sterowniki asynchroniczne dla baz obsługiwanych przez aplikację
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+_engines: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncEngine]" = weakref.WeakKeyDictionary()
+_writers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GroupCommitWriter]" = weakref.WeakKeyDictionary()
+
+
+class GroupCommitWriter:
+    # Zapisy z równoległych żądań wykonywane kolejno w jednej transakcji - jeden commit na partię
+    # zamiast na żądanie. Każde żądanie dostaje wynik swojej operacji (wołanej w transakcji);
+    # błąd transakcji dotyczy całej partii.
+    def __init__(self, engine: AsyncEngine, max_batch: int):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self._pending: list[tuple[Callable[[AsyncConnection], Awaitable], asyncio.Future]] = []
+        self._drain_task: asyncio.Task | None = None
+
+    async def run(self, operation: Callable[[AsyncConnection], Awaitable]):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((operation, future))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain())
+        return await future
+
+    async def execute(self, stmt, parameters: list[dict], consume: Callable):
+        async def operation(connection: AsyncConnection):
+            return consume(await connection.execute(stmt, parameters))
+        return await self.run(operation)
+
+    async def _drain(self):
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            try:
+                async with self.engine.begin() as connection:
+                    results = [await operation(connection) for operation, _ in batch]
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+def async_database_url(url: URL) -> URL:
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'.")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def get_async_engine(url: URL) -> AsyncEngine:
+    # Jeden silnik na pętlę zdarzeń - połączenia asyncpg/aiosqlite są związane z pętlą.
+    # url to adres silnika Flask-SQLAlchemy (db.engine.url), więc ścieżki SQLite są już rozwiązane.
+    loop = asyncio.get_running_loop()
+    engine = _engines.get(loop)
+    if engine is None:
+        async_url = async_database_url(url)
+        pool_options = {}
+        if async_url.get_backend_name() != "sqlite":
+            pool_options = {
+                "pool_size": int(os.getenv("ASYNC_DB_POOL_SIZE", 20)),
+                "max_overflow": int(os.getenv("ASYNC_DB_MAX_OVERFLOW", 10)),
+            }
+        engine = _engines[loop] = create_async_engine(async_url, pool_pre_ping=True, **pool_options)
+    return engine
+
+
+def get_group_commit_writer(url: URL) -> GroupCommitWriter:
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None:
+        writer = _writers[loop] = GroupCommitWriter(get_async_engine(url), int(os.getenv("ASYNC_DB_MAX_BATCH", 100)))
+    return writer
+
+
+async def dispose_async_engine():
+    _writers.pop(asyncio.get_running_loop(), None)
+    engine = _engines.pop(asyncio.get_running_loop(), None)
+    if engine is not None:
+        await engine.dispose()
@@ -0,0 +1,110 @@
+import os
+from datetime import date
+from typing import Callable
+
+import numpy as np
+
+from app.api.batch_simulation_service import BatchScenarios, iter_water_simulation_batch
+from app.api.rainfall_archive import RainfallSeries
+from app.api.simulation_request_service import (SimulationRequestError, archived_rainfall, controller_options,
+                                                parse_controllers, parse_user_data)
+from app.api.simulation_service import UserData, run_controller_simulation
+
+BATCH_SCENARIO_FIELDS = ("tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size")
+
+
+def _max_backtest_scenarios() -> int:
+    return int(os.getenv("BACKTEST_MAX_SCENARIOS", 1000))
+
+
+def parse_scenarios(scenarios: list[dict]) -> list[UserData]:
+    user_data = []
+    for index, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict) or not all(field in scenario for field in BATCH_SCENARIO_FIELDS):
+            raise SimulationRequestError(
+                f"Scenario {index} must contain: {', '.join(BATCH_SCENARIO_FIELDS)}", 400)
+        try:
+            user_data.append(UserData(location="batch", initial_water_level=scenario.get("initial_water_level"),
+                                      **{field: scenario[field] for field in BATCH_SCENARIO_FIELDS}))
+        except (TypeError, ValueError) as e:
+            raise SimulationRequestError(f"Scenario {index}: {e}", 400)
+    return user_data
+
+
+def _totals(pumped_up, pumped_out, saved, final_level) -> dict:
+    return {
+        "total_pumped_up_water": round(float(pumped_up), 2),
+        "total_pumped_out_water": round(float(pumped_out), 2),
+        "total_saved_water": round(float(saved), 2),
+        "final_water_amount": round(float(final_level), 2),
+    }
+
+
+def batch_totals(scenarios: list[UserData], controllers: list[str], rainfall: list[tuple[date, float]],
+                 params: dict, advance: Callable[[], None] | None = None) -> dict:
+    # Sumy na scenariusz dla każdego regulatora. PI liczony wektorowo dla wszystkich scenariuszy naraz
+    # (advance() raz na dzień), pozostałe regulatory scenariusz po scenariuszu (advance() na dzień i scenariusz).
+    results = {}
+    for name in controllers:
+        if name == "pi":
+            # Wycinek archiwum to już tablica - bez budowania listy krotek
+            rainfall_mm = (rainfall.rainfall_mm() if isinstance(rainfall, RainfallSeries)
+                           else [rainfall_mm for _, rainfall_mm in rainfall])
+            batch = BatchScenarios.from_user_data(scenarios)
+            pumped_up = np.zeros(len(scenarios))
+            pumped_out = np.zeros(len(scenarios))
+            saved = np.zeros(len(scenarios))
+            final_level = np.zeros(len(scenarios))
+            for final_level, _, saved_today, pumped_today, overflow_today in iter_water_simulation_batch(
+                    batch, rainfall_mm):
+                pumped_up += pumped_today
+                pumped_out += overflow_today
+                saved += saved_today
+                if advance is not None:
+                    advance()
+            totals = [_totals(*values) for values in zip(pumped_up, pumped_out, saved, final_level)]
+        else:
+            options = controller_options(params, name)
+            progress = None if advance is None else (lambda day, days: advance())
+            totals = []
+            for user_data in scenarios:
+                records = run_controller_simulation(name, user_data, rainfall, horizon=None, progress=progress,
+                                                    **options)
+                totals.append(_totals(
+                    sum(r["pumped_up_water"] for r in records),
+                    sum(r["pumped_out_water"] for r in records),
+                    sum(r["saved_water"] for r in records),
+                    records[-1]["water_amount"],
+                ))
+        results[f"{name}_controller_totals"] = totals
+    return results
+
+
+def run_backtest(data: dict) -> dict:
+    # POST /api/backtest: odtworzenie zakresu archiwum opadów dla jednego zbiornika (pola jak w
+    # /api/simulation) albo listy 'scenarios'. Domyślnie tylko PI - ścieżka wektorowa; większe
+    # przebiegi (wiele scenariuszy, wolne regulatory) to zadanie w tle z tym samym polem 'archive'.
+    if "location" not in data:
+        raise SimulationRequestError("Backtest needs the archived 'location'.", 400)
+    if "scenarios" in data:
+        scenarios = data["scenarios"]
+        if not isinstance(scenarios, list) or not scenarios:
+            raise SimulationRequestError("'scenarios' must be a non-empty list.", 400)
+        if len(scenarios) > _max_backtest_scenarios():
+            raise SimulationRequestError(
+                f"Backtest has {len(scenarios)} scenarios, the limit is {_max_backtest_scenarios()}; "
+                f"submit larger runs to /api/jobs.", 400)
+        user_data = parse_scenarios(scenarios)
+    else:
+        user_data = [parse_user_data(data)]
+    controllers = parse_controllers({"controllers": ["pi"], **data})
+    rainfall = archived_rainfall({"archive": {}, **data})
+
+    return {
+        "location": rainfall.location,
+        "start": rainfall.start.isoformat(),
+        "end": rainfall.end.isoformat(),
+        "days": len(rainfall),
+        "scenarios": len(user_data),
+        **batch_totals(user_data, controllers, rainfall, data),
+    }
@@ -0,0 +1,150 @@
+from datetime import date
+from typing import Iterator
+
+import numpy as np
+
+from app.api.simulation_service import UserData
+
+# Kolumny wyniku - te same wielkości co w run_water_simulation, bez zaokrągleń
+BATCH_RESULT_DTYPE = np.dtype([
+    ("water_amount", np.float64),
+    ("rainfall_amount", np.float64),
+    ("daily_consumption", np.float64),
+    ("saved_water", np.float64),
+    ("pumped_up_water", np.float64),
+    ("pumped_out_water", np.float64),
+])
+
+# Parametry regulatora PI - zgodne z run_water_simulation
+PI_KP = 0.8
+PI_KI = 0.1
+
+
+class BatchScenarios:
+    # Parametry wielu scenariuszy jako tablice NumPy o długości n_scenarios.
+    # initial_water_level = NaN oznacza "brak" (start od poziomu minimalnego).
+    def __init__(self, tank_capacity, min_water_level, daily_water_usage, rooftop_size,
+                 initial_water_level=None):
+        arrays = np.broadcast_arrays(
+            np.asarray(tank_capacity, dtype=np.float64),
+            np.asarray(min_water_level, dtype=np.float64),
+            np.asarray(daily_water_usage, dtype=np.float64),
+            np.asarray(rooftop_size, dtype=np.float64),
+            np.asarray(np.nan if initial_water_level is None else initial_water_level, dtype=np.float64),
+        )
+        if arrays[0].ndim > 1:
+            raise ValueError("Scenario parameters must be scalars or 1-D arrays.")
+        (self.tank_capacity, self.min_water_level, self.daily_water_usage,
+         self.rooftop_size, self.initial_water_level) = (np.atleast_1d(a).copy() for a in arrays)
+
+    @classmethod
+    def from_user_data(cls, scenarios: list[UserData]) -> "BatchScenarios":
+        return cls(
+            tank_capacity=[u.tank_capacity for u in scenarios],
+            min_water_level=[u.min_water_level for u in scenarios],
+            daily_water_usage=[u.daily_water_usage for u in scenarios],
+            rooftop_size=[u.rooftop_size for u in scenarios],
+            initial_water_level=[np.nan if u.initial_water_level is None else u.initial_water_level
+                                 for u in scenarios],
+        )
+
+    def __len__(self):
+        return len(self.tank_capacity)
+
+    def __repr__(self):
+        return f"BatchScenarios(n_scenarios={len(self)})"
+
+
+def _rainfall_matrix(rainfall_mm, n_scenarios: int) -> np.ndarray:
+    rainfall = np.asarray(rainfall_mm, dtype=np.float64)
+    if rainfall.ndim == 1:
+        # Wspólna seria opadów dla wszystkich scenariuszy
+        return np.broadcast_to(rainfall, (n_scenarios, rainfall.shape[0]))
+    if rainfall.ndim == 2 and rainfall.shape[0] == n_scenarios:
+        return rainfall
+    raise ValueError("rainfall_mm must be a 1-D series or an (n_scenarios, n_days) array.")
+
+
+def iter_water_simulation_batch(scenarios: BatchScenarios, rainfall_mm) -> Iterator[tuple[np.ndarray, ...]]:
+    # Krok po kroku (dzień po dniu) dla wszystkich scenariuszy naraz. Kolejność operacji
+    # zmiennoprzecinkowych jest identyczna jak w run_water_simulation, więc wyniki są równe bitowo.
+    rainfall = _rainfall_matrix(rainfall_mm, len(scenarios))
+
+    min_water_level = scenarios.min_water_level
+    daily_consumption = scenarios.daily_water_usage
+    roof_surface = scenarios.rooftop_size
+    max_water_level = scenarios.tank_capacity * 0.95
+
+    current_water_level = np.where(np.isnan(scenarios.initial_water_level),
+                                   min_water_level, scenarios.initial_water_level)
+    current_water_level = np.maximum(0, np.minimum(current_water_level, max_water_level))
+    integral_error = np.zeros(len(scenarios))
+
+    for day_index in range(rainfall.shape[1]):
+        # 1. Zużycie wody
+        current_water_level = np.maximum(0, current_water_level - daily_consumption)
+
+        # 2. Zbieranie deszczówki
+        rainwater_collected_liters = rainfall[:, day_index] * roof_surface
+        current_water_level = current_water_level + rainwater_collected_liters
+
+        # 3. Obsługa przepełnienia
+        overflow = np.where(current_water_level > max_water_level, current_water_level - max_water_level, 0.0)
+        current_water_level = np.minimum(current_water_level, max_water_level)
+
+        # 4. Regulator PI tylko tam, gdzie poziom spadł poniżej minimum
+        below_min = current_water_level < min_water_level
+        error = np.where(below_min, min_water_level - current_water_level, 0.0)
+        integral_error = np.where(below_min, integral_error + error, 0.0)
+
+        pi_controlled_pump_amount = PI_KP * error + PI_KI * integral_error
+        amount_to_attempt_pumping = np.maximum(0, pi_controlled_pump_amount)
+        space_available_in_tank = max_water_level - current_water_level
+        actual_pumped = np.maximum(0, np.minimum(amount_to_attempt_pumping, space_available_in_tank))
+        actual_pumped = np.where(below_min, actual_pumped, 0.0)
+
+        current_water_level = current_water_level + actual_pumped
+
+        # Anti-windup
+        unfulfilled = amount_to_attempt_pumping > actual_pumped
+        integral_error = np.where(below_min & unfulfilled,
+                                  integral_error - (amount_to_attempt_pumping - actual_pumped),
+                                  integral_error)
+
+        current_water_level = np.minimum(current_water_level, max_water_level)
+
+        yield current_water_level, rainfall[:, day_index], rainwater_collected_liters, actual_pumped, overflow
+
+
+def run_water_simulation_batch(scenarios: BatchScenarios, rainfall_mm) -> np.ndarray:
+    # Zwraca tablicę strukturalną (n_scenarios, n_days) o typie BATCH_RESULT_DTYPE.
+    # Długość horyzontu to długość serii opadów - ewentualne przycięcie robi wywołujący.
+    n_days = np.shape(rainfall_mm)[-1]
+    results = np.empty((len(scenarios), n_days), dtype=BATCH_RESULT_DTYPE)
+    results["daily_consumption"] = scenarios.daily_water_usage[:, None]
+
+    for day_index, (level, rainfall, saved, pumped, overflow) in enumerate(
+            iter_water_simulation_batch(scenarios, rainfall_mm)):
+        results["water_amount"][:, day_index] = level
+        results["rainfall_amount"][:, day_index] = rainfall
+        results["saved_water"][:, day_index] = saved
+        results["pumped_up_water"][:, day_index] = pumped
+        results["pumped_out_water"][:, day_index] = overflow
+    return results
+
+
+def batch_scenario_records(results: np.ndarray, dates: list[date], scenario_index: int) -> list[dict]:
+    # Jeden scenariusz w formacie run_water_simulation (zaokrąglenia jak w wersji skalarnej)
+    row = results[scenario_index]
+    return [
+        {
+            "date": forecast_date.isoformat() if isinstance(forecast_date, date) else str(forecast_date),
+            "water_amount": round(float(day["water_amount"]), 2),
+            "rainfall_amount": round(float(day["rainfall_amount"]), 2),
+            "daily_consumption": round(float(day["daily_consumption"]), 2),
+            "saved_water": round(float(day["saved_water"]), 2),
+            "pumped_up_water": round(float(day["pumped_up_water"]), 2),
+            "pumped_out_water": round(float(day["pumped_out_water"]), 2),
+        }
+        for forecast_date, day in zip(dates, row)
+    ]
@@ -0,0 +1,173 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+from app.api.batch_simulation_service import BatchScenarios, iter_water_simulation_batch
+from app.api.rainfall_archive import RainfallSeries
+from app.api.simulation_request_service import (SimulationRequestError, archived_rainfall, parse_controllers,
+                                                parse_horizon, parse_user_data)
+from app.api.simulation_service import UserData
+from app.api.weather_data_service import fetch_rainfall_forecast
+
+ENSEMBLE_SOURCES = ("forecast", "archive")
+ENSEMBLE_CONTROLLERS = ("pi",)  # Tylko PI ma jądro wektorowe (batch_simulation_service)
+DEFAULT_PERCENTILES = (10, 50, 90)
+BAND_FIELDS = ("water_amount", "pumped_up_water", "pumped_out_water")
+DAYS_PER_YEAR = 365
+
+
+def _max_members() -> int:
+    return int(os.getenv("ENSEMBLE_MAX_MEMBERS", 20000))
+
+
+def forecast_traces(forecast: list[tuple[date, float]], members: int, rng: np.random.Generator,
+                    spread: float = 0.5, wet_day_miss: float = 0.15) -> np.ndarray:
+    # Zaburzenia prognozy: mnożnikowy błąd log-normalny ilości opadu (średnia 1, rozrzut rośnie
+    # z wyprzedzeniem prognozy) oraz opad w dni prognozowane jako suche z prawdopodobieństwem
+    # rosnącym od wet_day_miss, o średniej równej średniemu opadowi dni mokrych prognozy.
+    # Wynik (dni, członkowie) - wiersz to dzień, zgodnie z dostępem jądra wektorowego.
+    rainfall = np.array([rainfall_mm for _, rainfall_mm in forecast], dtype=np.float64)
+    days = len(rainfall)
+    growth = np.sqrt(1.0 + np.arange(days) / 7.0)[:, None]
+    sigma = spread * growth
+    traces = rainfall[:, None] * rng.lognormal(-sigma ** 2 / 2, sigma, size=(days, members))
+
+    wet = rainfall > 0
+    wet_mean = rainfall[wet].mean() if wet.any() else 1.0
+    dry_rain = rng.exponential(wet_mean, size=(days, members))
+    missed = (~wet)[:, None] & (rng.random((days, members)) < np.minimum(1.0, wet_day_miss * growth))
+    return np.where(missed, dry_rain, traces)
+
+
+def archive_traces(series: RainfallSeries, start: date, days: int, members: int, rng: np.random.Generator,
+                   block_days: int = 30, jitter_days: int = 15) -> np.ndarray:
+    # Sezonowy bootstrap blokowy z archiwum: horyzont dzielony na bloki po block_days, każdy blok
+    # każdego członka to ten sam fragment roku (± jitter_days) z losowego roku archiwum. Zachowuje
+    # sezonowość i korelację opadów w obrębie bloku. Wynik (dni, członkowie).
+    pool = series.rainfall_mm()
+    block_days = max(1, min(block_days, days))
+    if len(pool) < DAYS_PER_YEAR + block_days:
+        raise SimulationRequestError(
+            f"Archive range has {len(pool)} days; the ensemble needs at least {DAYS_PER_YEAR + block_days}.", 400)
+
+    n_blocks = -(-days // block_days)
+    block_dates = [start + timedelta(days=block * block_days) for block in range(n_blocks)]
+    # Przesunięcie dnia roku względem początku archiwum (dryf 1 dzień na 4 lata pokrywa jitter)
+    base = np.array([(block_date - series.start).days % DAYS_PER_YEAR for block_date in block_dates])
+    last_offset = len(pool) - block_days
+    years = (last_offset - base) // DAYS_PER_YEAR + 1
+
+    offsets = (base + DAYS_PER_YEAR * (rng.random((members, n_blocks)) * years).astype(np.int64)
+               + rng.integers(-jitter_days, jitter_days + 1, size=(members, n_blocks)))
+    offsets = np.clip(offsets, 0, last_offset)
+    # (bloki, dni bloku, członkowie) -> (dni, członkowie)
+    windows = pool[offsets.T[:, None, :] + np.arange(block_days)[None, :, None]]
+    return windows.reshape(n_blocks * block_days, members)[:days]
+
+
+def simulate_ensemble(user_data: UserData, traces: np.ndarray, percentiles=DEFAULT_PERCENTILES) -> dict:
+    # Wszyscy członkowie naraz jądrem wektorowym PI; pasma percentyli liczone dzień po dniu
+    days, members = traces.shape
+    scenarios = BatchScenarios(
+        tank_capacity=np.full(members, user_data.tank_capacity),
+        min_water_level=user_data.min_water_level,
+        daily_water_usage=user_data.daily_water_usage,
+        rooftop_size=user_data.rooftop_size,
+        initial_water_level=np.nan if user_data.initial_water_level is None else user_data.initial_water_level,
+    )
+    daily = {field: np.empty((days, members)) for field in BAND_FIELDS}
+    # traces.T to widok (członkowie, dni) - kolumna dnia jest ciągłym wierszem traces
+    for day_index, (level, _, _, pumped, overflow) in enumerate(iter_water_simulation_batch(scenarios, traces.T)):
+        daily["water_amount"][day_index] = level
+        daily["pumped_up_water"][day_index] = pumped
+        daily["pumped_out_water"][day_index] = overflow
+
+    totals = {
+        "pumped_up_water": daily["pumped_up_water"].sum(axis=0),
+        "pumped_out_water": daily["pumped_out_water"].sum(axis=0),
+        "saved_water": traces.sum(axis=0) * user_data.rooftop_size,
+        "final_water_amount": daily["water_amount"][-1],
+    }
+    return {
+        "bands": {field: _percentile_bands(values, percentiles, axis=1) for field, values in daily.items()},
+        "totals": {field: _percentile_bands(values, percentiles, axis=0) for field, values in totals.items()},
+    }
+
+
+def _percentile_bands(values: np.ndarray, percentiles, axis: int) -> dict:
+    bands = np.round(np.percentile(values, percentiles, axis=axis), 2)
+    return {f"p{percentile:g}": band.tolist() for percentile, band in zip(percentiles, bands)}
+
+
+def _parse_int(data: dict, field: str, default: int, low: int, high: int) -> int:
+    value = data.get(field, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise SimulationRequestError(f"'{field}' must be an integer between {low} and {high}.", 400)
+    return value
+
+
+def _parse_percentiles(data: dict) -> tuple:
+    percentiles = data.get("percentiles", DEFAULT_PERCENTILES)
+    if (not isinstance(percentiles, (list, tuple)) or not percentiles
+            or not all(isinstance(p, (int, float)) and not isinstance(p, bool) and 0 <= p <= 100 for p in percentiles)):
+        raise SimulationRequestError("'percentiles' must be a non-empty list of numbers between 0 and 100.", 400)
+    return tuple(sorted(set(percentiles)))
+
+
+def run_ensemble_request(data: dict) -> dict:
+    # POST /api/ensemble: N losowych przebiegów opadów (ziarno 'seed' - ten sam wynik przy powtórzeniu)
+    # z prognozy dla 'location' albo z archiwum ('source': 'archive'), pasma percentyli poziomu wody,
+    # dopompowania z sieci i przelewu oraz percentyle sum na członka.
+    user_data = parse_user_data(data)
+    controllers = parse_controllers({"controllers": list(ENSEMBLE_CONTROLLERS), **data})
+    if not set(controllers) <= set(ENSEMBLE_CONTROLLERS):
+        raise SimulationRequestError(
+            f"Ensemble runs support only the vectorized controller(s): {', '.join(ENSEMBLE_CONTROLLERS)}", 400)
+    source = data.get("source", "forecast")
+    if source not in ENSEMBLE_SOURCES:
+        raise SimulationRequestError(f"Unknown source '{source}', expected one of: {', '.join(ENSEMBLE_SOURCES)}", 400)
+    members = _parse_int(data, "members", 1000, 1, _max_members())
+    seed = data.get("seed")
+    if seed is None:
+        # Bez ziarna losujemy je i zwracamy - przebieg da się odtworzyć
+        seed = int(np.random.SeedSequence().entropy % 2 ** 32)
+    elif isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+        raise SimulationRequestError("'seed' must be a non-negative integer.", 400)
+    percentiles = _parse_percentiles(data)
+    rng = np.random.default_rng(seed)
+
+    try:
+        if source == "forecast":
+            horizon = parse_horizon(data)
+            forecast = fetch_rainfall_forecast(user_data.location, days=horizon)
+            if not forecast:
+                raise SimulationRequestError("Could not retrieve rainfall forecast data.", 500)
+            spread = float(data.get("spread", 0.5))
+            if spread < 0:
+                raise ValueError("'spread' must not be negative.")
+            start = forecast[0][0]
+            traces = forecast_traces(forecast, members, rng, spread=spread)
+        else:
+            horizon = parse_horizon(data, default=DAYS_PER_YEAR)
+            series = archived_rainfall({"archive": {}, **data})
+            start = date.fromisoformat(data["start"]) if "start" in data else series.end + timedelta(days=1)
+            traces = archive_traces(series, start, horizon, members, rng,
+                                    block_days=_parse_int(data, "block_days", 30, 1, DAYS_PER_YEAR))
+    except SimulationRequestError:
+        raise
+    except ConnectionError as e:
+        raise SimulationRequestError(f"External API connection error: {str(e)}", 503)
+    except (TypeError, ValueError) as e:
+        raise SimulationRequestError(f"Data processing error: {str(e)}", 400)
+
+    days = traces.shape[0]
+    return {
+        "source": source,
+        "members": members,
+        "seed": seed,
+        "days": days,
+        "percentiles": list(percentiles),
+        "dates": [(start + timedelta(days=day)).isoformat() for day in range(days)],
+        **simulate_ensemble(user_data, traces, percentiles),
+    }
@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+_thread_pool = None
+_process_pool = None
+_lock = threading.Lock()
+
+
+def _init_process_worker():
+    # Symulacje logują przez current_app - proces roboczy potrzebuje kontekstu aplikacji
+    from flask import Flask
+    Flask("worker").app_context().push()
+
+
+def process_pool_workers() -> int:
+    return int(os.getenv("PROCESS_POOL_WORKERS", os.getenv("SWEEP_WORKERS", os.cpu_count() or 1)))
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("SIMULATION_EXECUTOR_WORKERS", 8)),
+                thread_name_prefix="simulation",
+            )
+        return _thread_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    # "spawn" - fork procesu z wątkami Flask/SQLAlchemy potrafi zakleszczyć dziecko
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=process_pool_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+            )
+        return _process_pool
+
+
+def shutdown_executors():
+    # Serwer ASGI (uvicorn) kończy się ponownym SIGTERM, bez handlerów atexit -
+    # bez jawnego zamknięcia procesy robocze zostałyby osierocone
+    global _thread_pool, _process_pool
+    with _lock:
+        pools, _thread_pool, _process_pool = (_thread_pool, _process_pool), None, None
+    for pool in pools:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
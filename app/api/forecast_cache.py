@@ -0,0 +1,211 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from app.api.metrics import register_collector, stats_families
+
+
+class _Flight:
+    # Jedno trwające pobranie prognozy. Czekają na nie wątki (event) i korutyny (future na własnej
+    # pętli), więc żądanie synchroniczne i asynchroniczne o ten sam klucz dzielą jedno zapytanie.
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def future(self) -> asyncio.Future:
+        # Wołane pod blokadą cache, póki lot jest w rejestrze - finish() go nie przegapi
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiters.append((loop, future))
+        return future
+
+    def finish(self):
+        self.event.set()
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def _resolve(self, future: asyncio.Future):
+        # Anulowany czekający nie przerywa pobierania dla pozostałych
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(self.result)
+
+
+class ForecastCache:
+    # TTL + LRU cache with single-flight coalescing: concurrent misses for the same
+    # key share one upstream call. Expired entries are kept (until evicted or older
+    # than max_stale) so they can be served when the upstream fails.
+    def __init__(self, ttl: float, max_entries: int, serve_stale: bool = True, max_stale: float = 86400,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.serve_stale = serve_stale
+        self.max_stale = max_stale
+        self._clock = clock
+        self._entries: "OrderedDict[tuple, tuple[float, object]]" = OrderedDict()
+        # Jeden rejestr trwających pobrań dla get_or_fetch i get_or_fetch_async
+        self._inflight: dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale_served": 0, "errors": 0, "evictions": 0}
+
+    def _join(self, key: tuple) -> tuple[tuple | None, _Flight | None, bool]:
+        # Pod blokadą: (świeży wpis, lot, czy ten wywołujący pobiera)
+        entry = self._fresh_entry(key)
+        if entry is not None:
+            return entry, None, False
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self._stats["coalesced"] += 1
+            return None, flight, False
+        self._stats["misses"] += 1
+        flight = self._inflight[key] = _Flight()
+        return None, flight, True
+
+    def _settle(self, key: tuple, flight: _Flight, result=None, error: BaseException | None = None):
+        with self._lock:
+            if error is None:
+                flight.result = self._store_result(key, result)
+            elif not isinstance(error, Exception):
+                # Anulowane pobieranie - czekający dostają błąd połączenia, bez starego wpisu
+                flight.error = ConnectionError("Forecast fetch cancelled.")
+            else:
+                self._stats["errors"] += 1
+                stale = self._stale_entry(key)
+                if stale is not None:
+                    self._stats["stale_served"] += 1
+                    flight.result = stale
+                else:
+                    flight.error = error
+            self._inflight.pop(key, None)
+        flight.finish()
+
+    def get_or_fetch(self, key: tuple, fetch: Callable[[], object]):
+        with self._lock:
+            entry, flight, owner = self._join(key)
+        if entry is not None:
+            return entry[1]
+
+        if owner:
+            try:
+                result = fetch()
+            except BaseException as e:
+                self._settle(key, flight, error=e)
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                self._settle(key, flight, result)
+        else:
+            flight.event.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    async def get_or_fetch_async(self, key: tuple, fetch: Callable[[], Awaitable[object]]):
+        # Wariant dla pętli asyncio: czekający nie blokują wątku. Wpisy, statystyki i trwające
+        # pobrania są wspólne z get_or_fetch.
+        with self._lock:
+            entry, flight, owner = self._join(key)
+            waiter = None if owner or entry is not None else flight.future()
+        if entry is not None:
+            return entry[1]
+
+        if not owner:
+            return await waiter
+
+        try:
+            result = await fetch()
+        except BaseException as e:
+            self._settle(key, flight, error=e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self._settle(key, flight, result)
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _store_result(self, key: tuple, result):
+        # Pusta prognoza (np. "days": []) nie trafia do cache - inaczej miasto byłoby bez danych do końca TTL;
+        # zamiast niej wcześniejszy (przeterminowany) wpis, jeśli jest, a następne żądanie pyta dostawcę ponownie
+        if result:
+            self._store(key, result)
+            return result
+        stale = self._stale_entry(key)
+        if stale is not None:
+            self._stats["stale_served"] += 1
+            return stale
+        return result
+
+    def _fresh_entry(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() - entry[0] < self.ttl:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+        return None
+
+    def _stale_entry(self, key: tuple):
+        if not self.serve_stale:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or self._clock() - entry[0] > self.ttl + self.max_stale:
+            return None
+        return entry[1]
+
+    def _store(self, key: tuple, value):
+        self._entries[key] = (self._clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, key: tuple | None = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "serve_stale": self.serve_stale,
+            }
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+forecast_cache = ForecastCache(
+    ttl=float(os.getenv("FORECAST_CACHE_TTL", 3600)),
+    max_entries=int(os.getenv("FORECAST_CACHE_SIZE", 64)),
+    serve_stale=_env_flag("FORECAST_CACHE_SERVE_STALE", "true"),
+    max_stale=float(os.getenv("FORECAST_CACHE_MAX_STALE", 86400)),
+)
+
+
+@register_collector
+def _forecast_cache_metrics() -> list[tuple]:
+    return stats_families("forecast_cache", forecast_cache.stats(), counters={
+        "hits": "Forecast cache hits.",
+        "misses": "Forecast cache misses (provider requests).",
+        "coalesced": "Forecast requests that waited for an identical in-flight fetch.",
+        "stale_served": "Expired forecasts served because the provider failed.",
+        "errors": "Forecast fetches that failed.",
+        "evictions": "Forecast cache evictions.",
+    }, gauges={"size": "Forecasts in the cache."})
@@ -0,0 +1,178 @@
+import os
+from bisect import bisect_right
+
+import numpy as np
+
+# Punkty liczone jednocześnie przy budowie siatki (ogranicza zużycie pamięci)
+_GRID_CHUNK_SIZE = 1024
+
+
+class ControlSurface:
+    # Wyjście regulatora policzone z góry na siatce (uchyb poziomu x opad). Węzły bez aktywnej
+    # reguły mają NaN: komórka z samymi NaN zwraca 0 (bez pompowania), częściowo pokryta - None,
+    # a wywołujący liczy wtedy dokładnie.
+    def __init__(self, error_axis: np.ndarray, rainfall_axis: np.ndarray, values: np.ndarray):
+        self.error_axis = np.asarray(error_axis, dtype=float)
+        self.rainfall_axis = np.asarray(rainfall_axis, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.max_error = None
+        # Listy Pythona - szybszy dostęp skalarny niż indeksowanie tablic NumPy
+        self._error_points = self.error_axis.tolist()
+        self._rainfall_points = self.rainfall_axis.tolist()
+        self._rows = self.values.tolist()
+
+    @staticmethod
+    def _locate(points: list[float], value: float) -> tuple[int, float]:
+        value = min(max(value, points[0]), points[-1])
+        i = min(bisect_right(points, value) - 1, len(points) - 2)
+        return i, (value - points[i]) / (points[i + 1] - points[i])
+
+    def interpolate(self, level_error: float, rainfall_mm: float) -> float | None:
+        i, t = self._locate(self._error_points, level_error)
+        j, u = self._locate(self._rainfall_points, rainfall_mm)
+
+        v00 = self._rows[i][j]
+        v01 = self._rows[i][j + 1]
+        v10 = self._rows[i + 1][j]
+        v11 = self._rows[i + 1][j + 1]
+        # NaN != NaN - szybki test na narożniki, w których żadna reguła nie zadziałała
+        missing = (v00 != v00) + (v01 != v01) + (v10 != v10) + (v11 != v11)
+        if missing == 4:
+            return 0.0  # Cała komórka poza regułami - regulator nie pompuje
+        if missing:
+            return None
+
+        return (v00 * (1 - t) * (1 - u) + v01 * (1 - t) * u
+                + v10 * t * (1 - u) + v11 * t * u)
+
+    def __repr__(self):
+        return (f"ControlSurface(grid={self.values.shape}, "
+                f"max_error={self.max_error})")
+
+
+def _rule_firing(node, memberships: dict, rule) -> np.ndarray:
+    # skfuzzy jest już załadowany (istnieje ControlSystem) - import lokalny nie spowalnia startu aplikacji
+    from skfuzzy.control.term import Term, TermAggregate
+    if isinstance(node, Term):
+        return memberships[(node.parent.label, node.label)]
+    if isinstance(node, TermAggregate):
+        if node.kind == 'not':
+            return 1. - _rule_firing(node.term1, memberships, rule)
+        term1 = _rule_firing(node.term1, memberships, rule)
+        term2 = _rule_firing(node.term2, memberships, rule)
+        if node.kind == 'and':
+            return rule.and_func(term1, term2)
+        return rule.or_func(term1, term2)
+    raise ValueError(f"Unsupported rule antecedent: {node!r}")
+
+
+def evaluate_control_system(system, inputs: dict[str, np.ndarray], output_label: str) -> np.ndarray:
+    # Wektorowe wnioskowanie Mamdaniego (min/max + środek ciężkości) dla wielu punktów
+    # naraz, na tych samych regułach i funkcjach przynależności co ControlSystem.
+    memberships = {}
+    for antecedent in system.antecedents:
+        universe = antecedent.universe
+        values = np.clip(np.asarray(inputs[antecedent.label], dtype=float), universe.min(), universe.max())
+        for term in antecedent.terms.values():
+            memberships[(antecedent.label, term.label)] = np.interp(values, universe, term.mf)
+
+    consequent = next(c for c in system.consequents if c.label == output_label)
+    cuts = {}
+    for rule in system.rules:
+        firing = _rule_firing(rule.antecedent, memberships, rule)
+        for weighted_term in rule.consequent:
+            term = weighted_term.term
+            if term.parent is not consequent:
+                continue
+            activation = firing * weighted_term.weight
+            previous = cuts.get(term.label)
+            cuts[term.label] = activation if previous is None else consequent.accumulation_method(activation, previous)
+
+    x = consequent.universe
+    points = len(next(iter(memberships.values())))
+    result = np.full(points, np.nan)
+    if not cuts or len(x) < 2:
+        return result
+
+    dx = np.diff(x)
+    for start in range(0, points, _GRID_CHUNK_SIZE):
+        stop = min(start + _GRID_CHUNK_SIZE, points)
+        output_mf = np.zeros((stop - start, len(x)))
+        for label, cut in cuts.items():
+            np.maximum(output_mf, np.minimum(cut[start:stop, None], consequent.terms[label].mf[None, :]), out=output_mf)
+
+        # Dokładne pole i moment funkcji odcinkowo liniowej (jak skfuzzy.defuzz centroid)
+        y1 = output_mf[:, :-1]
+        y2 = output_mf[:, 1:]
+        area = (dx * (y1 + y2) / 2).sum(axis=1)
+        moment = (dx / 6 * (y1 * (2 * x[:-1] + x[1:]) + y2 * (x[:-1] + 2 * x[1:]))).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[start:stop] = np.where(area > 0, moment / area, np.nan)
+    return result
+
+
+def _input_universe(system, label: str) -> np.ndarray:
+    return next(a.universe for a in system.antecedents if a.label == label)
+
+
+def _surface_axes(controller, grid_points: int) -> tuple[np.ndarray, np.ndarray]:
+    error_max = float(_input_universe(controller.system, 'uchyb_poziomu_wody').max())
+    rainfall_max = float(_input_universe(controller.system, 'prognoza_opadow').max())
+
+    # Węzły funkcji przynależności trafiają do siatki - interpolacja nie "ścina" załamań
+    error_breakpoints = [controller.tank_capacity * k for k in (0.05, 0.1, 0.15, 0.2, 0.25, 0.35)]
+    rainfall_breakpoints = [2, 5, 10, 15, 20, 25]
+
+    error_axis = np.union1d(np.linspace(0, error_max, grid_points),
+                            [b for b in error_breakpoints if 0 < b < error_max])
+    rainfall_axis = np.union1d(np.linspace(0, rainfall_max, grid_points),
+                               [b for b in rainfall_breakpoints if 0 < b < rainfall_max])
+    return error_axis, rainfall_axis
+
+
+def build_control_surface(controller, grid_points: int) -> ControlSurface:
+    error_axis, rainfall_axis = _surface_axes(controller, grid_points)
+    grid_error, grid_rainfall = np.meshgrid(error_axis, rainfall_axis, indexing='ij')
+    values = evaluate_control_system(
+        controller.system,
+        {'uchyb_poziomu_wody': grid_error.ravel(), 'prognoza_opadow': grid_rainfall.ravel()},
+        'ilosc_do_pompowania',
+    )
+    return ControlSurface(error_axis, rainfall_axis, values.reshape(grid_error.shape))
+
+
+def measure_surface_error(controller, surface: ControlSurface, samples: int, seed: int = 0) -> float:
+    # Porównanie z dokładnym wnioskowaniem w losowych (powtarzalnych) punktach
+    rng = np.random.default_rng(seed)
+    errors = rng.uniform(0, surface.error_axis[-1], samples)
+    rainfalls = rng.uniform(0, surface.rainfall_axis[-1], samples)
+
+    max_error = 0.0
+    for level_error, rainfall_mm in zip(errors.tolist(), rainfalls.tolist()):
+        approximate = surface.interpolate(level_error, rainfall_mm)
+        if approximate is None:
+            continue  # W tej komórce i tak liczymy dokładnie
+        try:
+            exact = controller.compute(level_error, rainfall_mm)
+        except Exception:
+            exact = 0.0  # Symulacja nie pompuje, gdy żadna reguła nie zadziała
+        max_error = max(max_error, abs(approximate - exact))
+    return max_error
+
+
+def build_verified_control_surface(controller, max_error: float | None = None) -> ControlSurface | None:
+    # Domyślny próg błędu to ułamek pojemności zbiornika (wyjście skaluje się z pojemnością)
+    if max_error is None:
+        max_error = float(os.getenv("FUZZY_SURFACE_MAX_ERROR", 0.002)) * controller.tank_capacity
+    grid_points = int(os.getenv("FUZZY_SURFACE_GRID_POINTS", 201))
+    samples = int(os.getenv("FUZZY_SURFACE_CHECK_SAMPLES", 200))
+    refinements = int(os.getenv("FUZZY_SURFACE_MAX_REFINEMENTS", 2))
+
+    for _ in range(refinements + 1):
+        surface = build_control_surface(controller, grid_points)
+        surface.max_error = measure_surface_error(controller, surface, samples)
+        if surface.max_error <= max_error:
+            return surface
+        # Za duży błąd - zagęszczamy siatkę w obu osiach
+        grid_points = grid_points * 2 - 1
+    return None
@@ -0,0 +1,180 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.api.fuzzy_control_surface import ControlSurface, build_verified_control_surface
+from app.api.metrics import register_collector, stats_families
+
+_UNSET = object()
+
+
+def _skfuzzy():
+    # skfuzzy (razem ze scipy i networkx) to ok. 0,2 s importu - ładowany przy pierwszym regulatorze,
+    # nie przy starcie procesu
+    import skfuzzy as fuzz
+    from skfuzzy import control as ctrl
+    return fuzz, ctrl
+
+
+# Reguły zależą tylko od pojemności zbiornika i rozdzielczości dziedzin - jeden skompilowany
+# ControlSystem obsługuje wszystkie symulacje dla danej pojemności. ControlSystemSimulation
+# trzyma stan wejść, więc osobna symulacja na wątek.
+class FuzzyController:
+    def __init__(self, tank_capacity: float, resolution: float = 1.0):
+        self.tank_capacity = float(tank_capacity)
+        self.resolution = float(resolution)
+        self.system = self._build_system(self.tank_capacity, self.resolution)
+        self._local = threading.local()
+        self._surface = _UNSET
+        self._surface_lock = threading.Lock()
+
+    @staticmethod
+    def _build_system(tank_capacity: float, resolution: float) -> "ctrl.ControlSystem":
+        fuzz, ctrl = _skfuzzy()
+        # Definicja zmiennych lingwistycznych (wejścia)
+        # Jak bardzo brakuje wody do poziomu minimalnego
+        uchyb_poziomu_wody = ctrl.Antecedent(np.arange(0, tank_capacity * 0.5, resolution), 'uchyb_poziomu_wody')
+        # Prognozowana ilość opadów na dany dzień
+        prognoza_opadow = ctrl.Antecedent(np.arange(0, 51, 1), 'prognoza_opadow')
+
+        # Definicja zmiennej lingwistycznej (wyjście)
+        # Ile wody należy dopompować
+        ilosc_do_pompowania = ctrl.Consequent(np.arange(0, tank_capacity * 0.3, resolution), 'ilosc_do_pompowania')
+
+        # Funkcje przynależności dla uchybu poziomu wody
+        uchyb_poziomu_wody['maly'] = fuzz.trimf(uchyb_poziomu_wody.universe, [0, 0, tank_capacity * 0.1])
+        uchyb_poziomu_wody['sredni'] = fuzz.trimf(uchyb_poziomu_wody.universe, [tank_capacity * 0.05, tank_capacity * 0.15, tank_capacity * 0.25])
+        uchyb_poziomu_wody['duzy'] = fuzz.trimf(uchyb_poziomu_wody.universe, [tank_capacity * 0.2, tank_capacity * 0.35, tank_capacity * 0.5])
+
+        # Funkcje przynależności dla prognozy opadów
+        prognoza_opadow['brak'] = fuzz.trimf(prognoza_opadow.universe, [0, 0, 5])
+        prognoza_opadow['maly'] = fuzz.trimf(prognoza_opadow.universe, [2, 10, 20])
+        prognoza_opadow['duzy'] = fuzz.trimf(prognoza_opadow.universe, [15, 25, 50])
+
+        # Funkcje przynależności dla ilości wody do pompowania
+        ilosc_do_pompowania['nic'] = fuzz.trimf(ilosc_do_pompowania.universe, [0, 0, tank_capacity * 0.01])
+        ilosc_do_pompowania['malo'] = fuzz.trimf(ilosc_do_pompowania.universe, [tank_capacity * 0.005, tank_capacity * 0.05, tank_capacity * 0.1])
+        ilosc_do_pompowania['duzo'] = fuzz.trimf(ilosc_do_pompowania.universe, [tank_capacity * 0.08, tank_capacity * 0.15, tank_capacity * 0.3])
+
+        # Definicja reguł rozmytych
+        # Jeśli brakuje dużo wody i nie ma prognozy opadów, pompuj dużo.
+        regula1 = ctrl.Rule(uchyb_poziomu_wody['duzy'] & prognoza_opadow['brak'], ilosc_do_pompowania['duzo'])
+        # Jeśli brakuje średnio wody i opady są małe, pompuj mało.
+        regula2 = ctrl.Rule(uchyb_poziomu_wody['sredni'] & prognoza_opadow['maly'], ilosc_do_pompowania['malo'])
+        # Jeśli brakuje mało wody, ale prognozowane są duże opady, nie pompuj.
+        regula3 = ctrl.Rule(uchyb_poziomu_wody['maly'] & prognoza_opadow['duzy'], ilosc_do_pompowania['nic'])
+        # Jeśli brakuje mało wody i nie ma opadów, pompuj mało.
+        regula4 = ctrl.Rule(uchyb_poziomu_wody['maly'] & prognoza_opadow['brak'], ilosc_do_pompowania['malo'])
+        # Jeśli brakuje średnio wody i nie ma opadów, pompuj dużo.
+        regula5 = ctrl.Rule(uchyb_poziomu_wody['sredni'] & prognoza_opadow['brak'], ilosc_do_pompowania['duzo'])
+        # Jeśli brakuje dużo wody, ale są małe opady, pompuj mało (bo coś spadnie).
+        regula6 = ctrl.Rule(uchyb_poziomu_wody['duzy'] & prognoza_opadow['maly'], ilosc_do_pompowania['malo'])
+
+        # Stworzenie systemu sterowania
+        return ctrl.ControlSystem([regula1, regula2, regula3, regula4, regula5, regula6])
+
+    def simulation(self) -> "ctrl.ControlSystemSimulation":
+        symulacja_sterowania = getattr(self._local, "simulation", None)
+        if symulacja_sterowania is None:
+            _, ctrl = _skfuzzy()
+            # Bez pamięci podręcznej skfuzzy - po nieudanym wnioskowaniu potrafi zwrócić
+            # wynik poprzedniego wywołania, a ta symulacja żyje dłużej niż jedno żądanie
+            symulacja_sterowania = ctrl.ControlSystemSimulation(self.system, cache=False)
+            self._local.simulation = symulacja_sterowania
+        return symulacja_sterowania
+
+    def compute(self, level_error: float, rainfall_mm: float) -> float:
+        # Pełne wnioskowanie Mamdaniego; wyjątek propaguje się do wywołującego
+        symulacja_sterowania = self.simulation()
+        symulacja_sterowania.input['uchyb_poziomu_wody'] = level_error
+        symulacja_sterowania.input['prognoza_opadow'] = rainfall_mm
+        symulacja_sterowania.compute()
+        return symulacja_sterowania.output['ilosc_do_pompowania']
+
+    def surface(self) -> ControlSurface | None:
+        # Tablica wyjść budowana leniwie raz na regulator; None, gdy nie spełnia progu dokładności
+        if self._surface is _UNSET:
+            with self._surface_lock:
+                if self._surface is _UNSET:
+                    self._surface = build_verified_control_surface(self)
+        return self._surface
+
+    def compute_fast(self, level_error: float, rainfall_mm: float) -> float:
+        surface = self.surface()
+        if surface is not None:
+            value = surface.interpolate(level_error, rainfall_mm)
+            if value is not None:
+                return value
+        return self.compute(level_error, rainfall_mm)
+
+    def __repr__(self):
+        return f"FuzzyController(tank_capacity={self.tank_capacity}, resolution={self.resolution})"
+
+
+_controllers: "OrderedDict[tuple[float, float], FuzzyController]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _max_cached_controllers() -> int:
+    return max(1, int(os.getenv("FUZZY_CONTROLLER_CACHE_SIZE", 32)))
+
+
+def default_resolution() -> float:
+    return float(os.getenv("FUZZY_UNIVERSE_RESOLUTION", 1))
+
+
+def get_fuzzy_controller(tank_capacity: float, resolution: float | None = None) -> FuzzyController:
+    resolution = default_resolution() if resolution is None else float(resolution)
+    key = (float(tank_capacity), resolution)
+
+    with _lock:
+        controller = _controllers.get(key)
+        if controller is not None:
+            _controllers.move_to_end(key)
+            _stats["hits"] += 1
+            return controller
+        _stats["misses"] += 1
+
+    # Budowa poza blokadą - równoległe żądania dla innych zbiorników nie czekają
+    controller = FuzzyController(*key)
+
+    with _lock:
+        # Inny wątek mógł w międzyczasie zbudować ten sam regulator
+        existing = _controllers.get(key)
+        if existing is not None:
+            _controllers.move_to_end(key)
+            return existing
+        _controllers[key] = controller
+        while len(_controllers) > _max_cached_controllers():
+            _controllers.popitem(last=False)
+            _stats["evictions"] += 1
+    return controller
+
+
+def fuzzy_controller_cache_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "size": len(_controllers),
+            "max_size": _max_cached_controllers(),
+        }
+
+
+def clear_fuzzy_controller_cache():
+    with _lock:
+        _controllers.clear()
+        for key in _stats:
+            _stats[key] = 0
+
+
+@register_collector
+def _fuzzy_controller_cache_metrics() -> list[tuple]:
+    return stats_families("fuzzy_controller_cache", fuzzy_controller_cache_stats(), counters={
+        "hits": "Compiled fuzzy controller cache hits.",
+        "misses": "Fuzzy controllers built (cache misses).",
+        "evictions": "Fuzzy controller cache evictions.",
+    }, gauges={"size": "Compiled fuzzy controllers in the cache.",
+               "max_size": "Fuzzy controller cache capacity."})
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.api.metrics import UPSTREAM_ERRORS, histogram_family, register_collector
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> (failure_threshold kolejnych błędów) -> open -> (reset_timeout) -> half_open
+    # W stanie half_open przepuszczamy jedno próbne żądanie; sukces zamyka obwód, błąd otwiera go ponownie.
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_progress = False
+            if self.state == "half_open" and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_progress = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        # Próba zakończona bez wyniku (anulowanie, nieoczekiwany wyjątek) - kolejne żądanie może
+        # spróbować ponownie, zamiast czekać na restart procesu
+        with self._lock:
+            self._trial_in_progress = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+class LatencyHistogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Ostatni kubełek to +Inf
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip([*self.buckets, float("inf")], self.counts):
+                cumulative += count
+                buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+            return {"count": self.count, "sum": round(self.total, 6), "buckets": buckets}
+
+    def raw(self) -> tuple[list[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.total
+
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_breakers: dict[str, CircuitBreaker] = {}
+_histograms: dict[str, LatencyHistogram] = {}
+_registry_lock = threading.Lock()
+
+
+def _timeouts() -> tuple[float, float]:
+    return (float(os.getenv("WEATHER_HTTP_CONNECT_TIMEOUT", 3.05)),
+            float(os.getenv("WEATHER_HTTP_READ_TIMEOUT", 10)))
+
+
+def _build_session() -> requests.Session:
+    retries = Retry(
+        total=int(os.getenv("WEATHER_HTTP_RETRIES", 2)),
+        backoff_factor=float(os.getenv("WEATHER_HTTP_BACKOFF", 0.3)),
+        backoff_max=float(os.getenv("WEATHER_HTTP_BACKOFF_MAX", 5)),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    pool_size = int(os.getenv("WEATHER_HTTP_POOL_SIZE", 10))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    # Jedna sesja na proces - połączenia keep-alive są ponownie używane między żądaniami
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _build_async_client() -> aiohttp.ClientSession:
+    # Połączenia nie trzymają wątków - limit to liczba równoczesnych żądań do dostawcy, nie pula wątków
+    max_connections = int(os.getenv("WEATHER_HTTP_ASYNC_MAX_CONNECTIONS", 200))
+    connect_timeout, read_timeout = _timeouts()
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300),
+        timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+    )
+
+
+def get_async_client() -> aiohttp.ClientSession:
+    # Jedna sesja na pętlę zdarzeń (sesja aiohttp jest związana z pętlą, w której powstała)
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = _build_async_client()
+    return client
+
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+def _retry_delay(response: aiohttp.ClientResponse | None, attempt: int) -> float:
+    # Jak urllib3 Retry: nagłówek Retry-After, a bez niego wykładniczy backoff z górnym limitem
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after is not None and retry_after.isdigit():
+        return float(retry_after)
+    backoff = float(os.getenv("WEATHER_HTTP_BACKOFF", 0.3)) * (2 ** attempt)
+    return min(backoff, float(os.getenv("WEATHER_HTTP_BACKOFF_MAX", 5)))
+
+
+def _host_state(host: str) -> tuple[CircuitBreaker, LatencyHistogram]:
+    with _registry_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(
+                failure_threshold=int(os.getenv("WEATHER_HTTP_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.getenv("WEATHER_HTTP_BREAKER_RESET", 30)),
+            )
+            _histograms[host] = LatencyHistogram()
+        return breaker, _histograms[host]
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    host = urlsplit(url).netloc
+    breaker, histogram = _host_state(host)
+    if not breaker.allow_request():
+        UPSTREAM_ERRORS.inc(host, "circuit_open")
+        raise CircuitOpenError(f"Circuit breaker open for {host}, failing fast.")
+
+    kwargs.setdefault("timeout", _timeouts())
+    started = time.perf_counter()
+    try:
+        response = get_session().get(url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        breaker.record_failure()
+        UPSTREAM_ERRORS.inc(host, "timeout" if isinstance(e, requests.exceptions.Timeout) else "connection")
+        raise
+    except BaseException:
+        breaker.release_trial()
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+    # 5xx po wyczerpaniu ponowień liczy się jako awaria dostawcy, 4xx już nie
+    if response.status_code >= 500:
+        breaker.record_failure()
+        UPSTREAM_ERRORS.inc(host, "http_5xx")
+    else:
+        breaker.record_success()
+    return response
+
+
+async def async_http_get(url: str, **kwargs) -> aiohttp.ClientResponse:
+    # Odpowiednik http_get dla pętli asyncio - ten sam wyłącznik obwodu i histogram dla hosta.
+    # Zwraca odpowiedź z już wczytaną treścią (await response.json() nie czeka na sieć).
+    host = urlsplit(url).netloc
+    breaker, histogram = _host_state(host)
+    if not breaker.allow_request():
+        UPSTREAM_ERRORS.inc(host, "circuit_open")
+        raise CircuitOpenError(f"Circuit breaker open for {host}, failing fast.")
+
+    retries = int(os.getenv("WEATHER_HTTP_RETRIES", 2))
+    client = get_async_client()
+    started = time.perf_counter()
+    try:
+        for attempt in range(retries + 1):
+            try:
+                async with client.get(url, **kwargs) as response:
+                    await response.read()
+            except aiohttp.ClientConnectorError:
+                # Ponowienia błędów połączenia, jak w urllib3 Retry
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(_retry_delay(None, attempt))
+                continue
+            if response.status not in RETRY_STATUSES or attempt == retries:
+                break
+            await asyncio.sleep(_retry_delay(response, attempt))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        breaker.record_failure()
+        UPSTREAM_ERRORS.inc(host, "timeout" if isinstance(e, asyncio.TimeoutError) else "connection")
+        raise
+    except BaseException:
+        # asyncio.CancelledError (klient się rozłączył) i inne wyjątki nie oceniają dostawcy
+        breaker.release_trial()
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+    if response.status >= 500:
+        breaker.record_failure()
+        UPSTREAM_ERRORS.inc(host, "http_5xx")
+    else:
+        breaker.record_success()
+    return response
+
+
+def upstream_stats() -> dict:
+    with _registry_lock:
+        hosts = list(_breakers)
+    return {
+        host: {"circuit": _breakers[host].snapshot(), "latency_seconds": _histograms[host].snapshot()}
+        for host in hosts
+    }
+
+
+@register_collector
+def _upstream_metrics() -> list[tuple]:
+    with _registry_lock:
+        hosts = list(_breakers)
+    latency = [((("host", host),), _histograms[host].buckets, *_histograms[host].raw()) for host in hosts]
+    circuit = [("", (("host", host),), 1 if _breakers[host].snapshot()["state"] == "open" else 0) for host in hosts]
+    return [
+        histogram_family("upstream_request_duration_seconds", "Weather provider request duration including retries.",
+                         latency),
+        ("upstream_circuit_open", "gauge", "1 when the weather provider circuit breaker for the host is open.", circuit),
+    ]
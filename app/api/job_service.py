@@ -0,0 +1,315 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from app.init_db import db
+from app.api.backtest_service import batch_totals, parse_scenarios
+from app.api.simulation_request_service import (SimulationRequestError, archived_rainfall, controller_options,
+                                                parse_controllers, parse_rainfall_series, parse_user_data)
+from app.api.simulation_service import UserData, run_controller_simulation
+from app.api.weather_data_service import fetch_rainfall_forecast
+from app.models.simulation_job import SimulationJob
+
+JOB_KINDS = ("simulation", "batch")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLost(Exception):
+    # Zadanie nie należy już do tego procesu roboczego (wróciło do kolejki po braku bicia serca
+    # i przejął je inny proces albo zostało zakończone) - dalsze liczenie i zapis wyniku nie mają sensu
+    pass
+
+
+def _max_days() -> int:
+    return int(os.getenv("JOB_MAX_DAYS", 36525))
+
+
+def _max_scenarios() -> int:
+    return int(os.getenv("JOB_MAX_SCENARIOS", 100000))
+
+
+def _max_queued() -> int:
+    return int(os.getenv("JOB_MAX_QUEUED", 100))
+
+
+def _validate_job(data: dict) -> str:
+    kind = data.get("kind", "simulation")
+    if kind not in JOB_KINDS:
+        raise SimulationRequestError(f"Unknown job kind '{kind}', expected one of: {', '.join(JOB_KINDS)}", 400)
+    if "rainfall" in data:
+        parse_rainfall_series(data["rainfall"], _max_days())
+    elif "archive" in data:
+        archived_rainfall(data, _max_days())
+    elif "location" not in data:
+        raise SimulationRequestError(
+            "Job needs a 'rainfall' series, an 'archive' range or a 'location' for the forecast.", 400)
+    elif not isinstance(data.get("days", 30), int) or not 0 < data.get("days", 30) <= _max_days():
+        raise SimulationRequestError(f"'days' must be an integer between 1 and {_max_days()}.", 400)
+    parse_controllers(data)
+
+    if kind == "simulation":
+        _job_user_data(data)
+    else:
+        scenarios = data.get("scenarios")
+        if not isinstance(scenarios, list) or not scenarios:
+            raise SimulationRequestError("'scenarios' must be a non-empty list.", 400)
+        if len(scenarios) > _max_scenarios():
+            raise SimulationRequestError(
+                f"Batch has {len(scenarios)} scenarios, the limit is {_max_scenarios()}.", 400)
+        parse_scenarios(scenarios)
+    return kind
+
+
+def _job_user_data(params: dict) -> UserData:
+    # Przy historycznej serii opadów lokalizacja jest tylko etykietą
+    return parse_user_data({"location": "historical", **params})
+
+
+def submit_job(data: dict) -> dict:
+    # Walidacja od razu - błędne parametry to 400 przy zgłoszeniu, a nie nieudane zadanie
+    kind = _validate_job(data)
+
+    queued = SimulationJob.query.filter_by(status="queued").count()
+    if queued >= _max_queued():
+        raise SimulationRequestError(f"Job queue is full ({queued} queued), try again later.", 429)
+
+    job = SimulationJob(id=uuid.uuid4().hex, kind=kind, status="queued", params=data, progress=0.0)
+    try:
+        db.session.add(job)
+        db.session.commit()
+    except Exception as db_error:
+        db.session.rollback()
+        raise SimulationRequestError(f"Database error: {str(db_error)}", 500)
+
+    runner = job_runner()
+    if runner is not None:
+        runner.notify()
+    return job.to_json(include_result=False)
+
+
+def get_job(job_id: str, include_result: bool = True) -> dict:
+    job = db.session.get(SimulationJob, job_id)
+    if job is None:
+        raise SimulationRequestError(f"Job '{job_id}' not found.", 404)
+    return job.to_json(include_result=include_result)
+
+
+def list_jobs(status: str | None = None, limit: int = 50) -> list[dict]:
+    query = SimulationJob.query
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(SimulationJob.created_at.desc()).limit(limit).all()
+    return [job.to_json(include_result=False) for job in jobs]
+
+
+def cancel_job(job_id: str) -> dict:
+    # Zadanie w kolejce anulujemy od razu; uruchomione dostaje flagę, którą proces roboczy
+    # sprawdza przy raportowaniu postępu
+    now = datetime.utcnow()
+    SimulationJob.query.filter_by(id=job_id, status="queued").update(
+        {"status": "cancelled", "cancel_requested": True, "finished_at": now})
+    SimulationJob.query.filter_by(id=job_id, status="running").update({"cancel_requested": True})
+    db.session.commit()
+    return get_job(job_id, include_result=False)
+
+
+class _JobProgress:
+    # Postęp i bicie serca zapisywane do bazy co JOB_PROGRESS_INTERVAL s; przy okazji odczyt flagi anulowania
+    def __init__(self, job_id: str, worker: str, total_units: int):
+        self.job_id = job_id
+        self.worker = worker
+        self.total_units = max(1, total_units)
+        self.done_units = 0
+        self.interval = float(os.getenv("JOB_PROGRESS_INTERVAL", 0.5))
+        self._last_report = time.monotonic()
+
+    def advance(self, units: int = 1):
+        self.done_units += units
+        if time.monotonic() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        self._last_report = time.monotonic()
+        owned = SimulationJob.query.filter_by(id=self.job_id, status="running", worker=self.worker).update({
+            "progress": min(1.0, self.done_units / self.total_units),
+            "heartbeat_at": datetime.utcnow(),
+        })
+        db.session.commit()
+        if not owned:
+            raise JobLost()
+        if db.session.query(SimulationJob.cancel_requested).filter_by(id=self.job_id).scalar():
+            raise JobCancelled()
+
+
+def _job_rainfall(params: dict) -> list[tuple[date, float]]:
+    if "rainfall" in params:
+        return parse_rainfall_series(params["rainfall"], _max_days())
+    if "archive" in params:
+        return archived_rainfall(params, _max_days())
+    rainfall = fetch_rainfall_forecast(str(params["location"]), days=int(params.get("days", 30)))
+    if not rainfall:
+        raise ValueError("Could not retrieve rainfall forecast data.")
+    return rainfall
+
+
+def _run_simulation_job(job_id: str, worker: str, params: dict) -> dict:
+    user_data = _job_user_data(params)
+    controllers = parse_controllers(params)
+    rainfall = _job_rainfall(params)
+    progress = _JobProgress(job_id, worker, len(rainfall) * len(controllers))
+
+    results = {}
+    for name in controllers:
+        results[f"{name}_controller_results"] = run_controller_simulation(
+            name, user_data, rainfall, horizon=None, progress=lambda day, days: progress.advance(),
+            **controller_options(params, name))
+    return results
+
+
+def _run_batch_job(job_id: str, worker: str, params: dict) -> dict:
+    scenarios = parse_scenarios(params["scenarios"])
+    controllers = parse_controllers(params)
+    rainfall = _job_rainfall(params)
+    days = len(rainfall)
+    # PI liczony wektorowo dla wszystkich scenariuszy naraz - jeden przebieg to `days` jednostek postępu
+    units = sum(days if name == "pi" else days * len(scenarios) for name in controllers)
+    progress = _JobProgress(job_id, worker, units)
+
+    return {"scenarios": len(scenarios), "days": days,
+            **batch_totals(scenarios, controllers, rainfall, params, advance=progress.advance)}
+
+
+JOB_HANDLERS = {"simulation": _run_simulation_job, "batch": _run_batch_job}
+
+
+def claim_next_job(worker: str) -> str | None:
+    # Przejęcie zadania to warunkowy UPDATE (status = 'queued'), więc kilka procesów
+    # roboczych na jednej bazie nie uruchomi tego samego zadania dwa razy
+    _requeue_stale_jobs()
+    for job_id, in db.session.query(SimulationJob.id).filter_by(status="queued") \
+            .order_by(SimulationJob.created_at).limit(5):
+        now = datetime.utcnow()
+        claimed = SimulationJob.query.filter_by(id=job_id, status="queued").update(
+            {"status": "running", "worker": worker, "started_at": now, "heartbeat_at": now})
+        db.session.commit()
+        if claimed:
+            return job_id
+    return None
+
+
+def _requeue_stale_jobs():
+    # Zadania procesu roboczego, który przestał bić sercem (np. został zabity), wracają do kolejki
+    stale_before = datetime.utcnow() - timedelta(seconds=float(os.getenv("JOB_STALE_AFTER", 600)))
+    SimulationJob.query.filter(SimulationJob.status == "running", SimulationJob.heartbeat_at < stale_before) \
+        .update({"status": "queued", "worker": None}, synchronize_session=False)
+    db.session.commit()
+
+
+def run_job(job_id: str, worker: str):
+    job = db.session.get(SimulationJob, job_id)
+    kind, params = job.kind, job.params
+    try:
+        result = JOB_HANDLERS[kind](job_id, worker, params)
+        update = {"status": "succeeded", "progress": 1.0, "result": result}
+    except JobLost:
+        db.session.rollback()
+        current_app.logger.warning(f"Job {job_id} is no longer owned by {worker}, result discarded")
+        return
+    except JobCancelled:
+        update = {"status": "cancelled"}
+    except SimulationRequestError as e:
+        update = {"status": "failed", "error": e.message}
+    except Exception as e:
+        current_app.logger.exception(f"Job {job_id} failed")
+        update = {"status": "failed", "error": str(e)}
+
+    db.session.rollback()
+    # Wynik zapisuje tylko proces, który nadal trzyma zadanie (status running i jego worker); anulowanie
+    # zgłoszone po ostatnim raporcie postępu wygrywa z sukcesem
+    owned = SimulationJob.query.filter_by(id=job_id, status="running", worker=worker)
+    finished_at = datetime.utcnow()
+    if update["status"] == "succeeded":
+        written = owned.filter_by(cancel_requested=False).update({**update, "finished_at": finished_at}) \
+            or owned.filter_by(cancel_requested=True).update({"status": "cancelled", "finished_at": finished_at})
+    else:
+        written = owned.update({**update, "finished_at": finished_at})
+    db.session.commit()
+    if not written:
+        current_app.logger.warning(f"Job {job_id} is no longer owned by {worker}, result discarded")
+
+
+class JobRunner:
+    # Pula wątków roboczych w procesie. Wątki biorą zadania z bazy, więc ta sama kolejka może być
+    # obsługiwana przez serwer WWW (JOB_WORKERS) i/lub osobne procesy `python -m app.job_worker`.
+    def __init__(self, app, workers: int, poll_interval: float):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{prefix}:{index}",), name=f"job-worker-{index}",
+                                      daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout: float | None = None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, worker: str):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    job_id = claim_next_job(worker)
+                    if job_id is not None:
+                        run_job(job_id, worker)
+                        continue
+            except Exception:
+                self.app.logger.exception("Job worker error")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+_runner: JobRunner | None = None
+_runner_lock = threading.Lock()
+
+
+def job_runner() -> JobRunner | None:
+    return _runner
+
+
+def ensure_job_workers(app) -> JobRunner | None:
+    # Domyślnie (JOB_WORKERS=0) zadania liczą tylko osobne procesy `python -m app.job_worker` - ciężkie
+    # przebiegi nie konkurują o GIL z żądaniami Dash i API. JOB_WORKERS > 0 włącza wątki w serwerze
+    # (np. lokalnie bez osobnego procesu); startują przy pierwszym żądaniu, nie przy imporcie, więc
+    # proces nadzorcy przeładowania w trybie debug ich nie uruchamia.
+    global _runner
+    if _runner is not None:
+        return _runner
+    workers = int(os.getenv("JOB_WORKERS", 0))
+    if workers <= 0:
+        return None
+    with _runner_lock:
+        if _runner is None:
+            runner = JobRunner(app, workers, float(os.getenv("JOB_POLL_INTERVAL", 1.0)))
+            runner.start()
+            _runner = runner
+    return _runner
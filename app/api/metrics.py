@@ -0,0 +1,223 @@
+import functools
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Metryki procesu w formacie tekstowym Prometheusa (GET /metrics). Pomiar na gorącej ścieżce to
+# perf_counter, bisect i jedna blokada - ok. mikrosekundy na żądanie. Statystyki, które moduły
+# już liczą (cache, histogramy dostawcy pogody), są czytane dopiero przy scrapowaniu (collectors).
+ENABLED = os.getenv("METRICS_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_collectors = []
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            return [("", tuple(zip(self.labelnames, labels)), value) for labels, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DURATION_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def samples(self) -> list[tuple[str, tuple, float]]:
+        with self._lock:
+            snapshot = [(labels, list(counts), count, total) for labels, (counts, count, total) in self._values.items()]
+        samples = []
+        for labels, counts, count, total in snapshot:
+            samples += _histogram_samples(tuple(zip(self.labelnames, labels)), self.buckets, counts, count, total)
+        return samples
+
+
+def _histogram_samples(labels: tuple, buckets, counts, count: int, total: float) -> list[tuple[str, tuple, float]]:
+    # labels - pary (nazwa, wartość); counts - liczności kubełków (ostatni to +Inf), nie skumulowane
+    samples, cumulative = [], 0
+    for bound, bucket_count in zip([*buckets, math.inf], counts):
+        cumulative += bucket_count
+        samples.append(("_bucket", labels + (("le", _format_value(bound)),), cumulative))
+    samples.append(("_count", labels, count))
+    samples.append(("_sum", labels, total))
+    return samples
+
+
+def register_collector(collect):
+    # collect() -> lista (nazwa, typ, opis, [(sufiks, etykiety, wartość)]), etykiety jako pary (nazwa, wartość)
+    _collectors.append(collect)
+    return collect
+
+
+def histogram_family(name: str, help_text: str, labelled_snapshots) -> tuple:
+    # Rodzina histogramu z gotowych liczności - dla modułów, które liczą je same (np. http_session)
+    samples = []
+    for labels, buckets, counts, count, total in labelled_snapshots:
+        samples += _histogram_samples(labels, buckets, counts, count, total)
+    return name, "histogram", help_text, samples
+
+
+def stats_families(prefix: str, stats: dict, counters: dict[str, str], gauges: dict[str, str]) -> list[tuple]:
+    # Słownik stats() modułu jako liczniki ({prefix}_{klucz}_total) i wskaźniki ({prefix}_{klucz})
+    families = [(f"{prefix}_{key}_total", "counter", help_text, [("", (), stats[key])])
+                for key, help_text in counters.items() if key in stats]
+    families += [(f"{prefix}_{key}", "gauge", help_text, [("", (), stats[key])])
+                 for key, help_text in gauges.items() if stats.get(key) is not None]
+    return families
+
+
+class track_in_flight:
+    # Licznik w toku + czas trwania: with track_in_flight(gauge, histogram, *etykiety): ...
+    __slots__ = ("gauge", "histogram", "labels", "started")
+
+    def __init__(self, gauge: Gauge, histogram: Histogram | None, *labels):
+        self.gauge = gauge
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(*self.labels)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        self.gauge.dec(*self.labels)
+
+
+# --- Metryki aplikacji ------------------------------------------------------------------------
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled, by route and status.",
+                        ("method", "endpoint", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "HTTP request duration until the response is built.",
+                          ("method", "endpoint"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled.", ("endpoint",))
+
+SIMULATION_STAGE_DURATION = Histogram(
+    "simulation_stage_duration_seconds",
+    "Duration of /api/simulation stages (forecast, result_cache, controllers, per-controller runs, persist).",
+    ("stage",))
+
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Weather provider request failures by host and kind.",
+                          ("host", "kind"))
+
+DASH_CALLBACK_DURATION = Histogram("dash_callback_duration_seconds", "Dash callback duration.", ("callback",))
+DASH_CALLBACKS_IN_FLIGHT = Gauge("dash_callbacks_in_flight", "Dash callbacks being executed.", ("callback",))
+DASH_CALLBACK_ERRORS = Counter("dash_callback_errors_total", "Dash callbacks that raised an exception.",
+                               ("callback",))
+
+
+def instrument_callback(name: str):
+    # Dekorator callbacku Dash: czas, liczba w toku i wyjątki (PreventUpdate to nie błąd)
+    def decorator(callback):
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            with track_in_flight(DASH_CALLBACKS_IN_FLIGHT, DASH_CALLBACK_DURATION, name):
+                try:
+                    return callback(*args, **kwargs)
+                except Exception as e:
+                    if type(e).__name__ != "PreventUpdate":
+                        DASH_CALLBACK_ERRORS.inc(name)
+                    raise
+        return wrapper
+    return decorator
+
+
+# --- Ekspozycja -------------------------------------------------------------------------------
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    return str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _family_lines(name: str, type_name: str, help_text: str, samples) -> list[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {type_name}"]
+    lines += [f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}" for suffix, labels, value in samples]
+    return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines += _family_lines(metric.name, metric.type_name, metric.help_text, metric.samples())
+    for collect in _collectors:
+        try:
+            families = collect()
+        except Exception:
+            # Błąd jednego źródła nie może zablokować całej ekspozycji
+            continue
+        for name, type_name, help_text, samples in families:
+            lines += _family_lines(name, type_name, help_text, samples)
+    return "\n".join(lines) + "\n"
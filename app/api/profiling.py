@@ -0,0 +1,313 @@
+import contextvars
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import random
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+# Profilowanie wybranych żądań na żywo (domyślnie wyłączone):
+#   PROFILING_MODE=cprofile|sample  - cProfile (pstats) albo próbkowanie stosów (collapsed stacks)
+#   PROFILING_SAMPLE_RATE=0.05      - odsetek pasujących żądań profilowanych losowo
+#   PROFILING_PATHS=/api/simulation - prefiksy ścieżek (po przecinku)
+#   PROFILING_MIN_DURATION_MS=0     - zachowywane tylko profile żądań dłuższych niż próg (wartości odstające)
+#   PROFILING_TOKEN=...             - nagłówek X-Profile-Token wymusza profil żądania; bez tokenu /admin/profiles
+#                                     jest niedostępne (404), zły lub brakujący nagłówek to 403
+# Profil obejmuje wątek żądania i zadania puli wątków uruchomione przez propagate() (regulator rozmyty).
+# Regulatory w puli procesów (SIMULATION_EXECUTOR=process) widać tylko jako oczekiwanie na wynik.
+# Python >= 3.12: cProfile działa na sys.monitoring - jeden profiler na proces (drugi enable() to ValueError),
+# który widzi wszystkie wątki. Profilowane jest wtedy jedno żądanie naraz, kolejne idą bez profilu.
+PROFILING_MODES = ("off", "cprofile", "sample")
+PROFILE_HEADER = "X-Profile-Token"
+
+
+def _mode() -> str:
+    mode = os.getenv("PROFILING_MODE", "off").strip().lower()
+    if mode not in PROFILING_MODES:
+        raise ValueError(f"Unknown PROFILING_MODE '{mode}', expected one of: {', '.join(PROFILING_MODES)}")
+    return mode
+
+
+# Konfiguracja czytana raz przy imporcie - literówka w PROFILING_MODE zatrzymuje start procesu,
+# zamiast zamieniać każde żądanie w błąd 500 (jak DASH_STORE_MODE, APP_MODE)
+MODE = _mode()
+TOKEN = os.getenv("PROFILING_TOKEN", "").strip() or None
+PATHS = tuple(path.strip() for path in os.getenv("PROFILING_PATHS", "/api/simulation").split(",") if path.strip())
+SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+MIN_DURATION_MS = float(os.getenv("PROFILING_MIN_DURATION_MS", 0))
+SAMPLE_INTERVAL = max(float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 5)) / 1000, 0.0005)
+
+
+def enabled() -> bool:
+    return MODE != "off"
+
+
+def admin_enabled() -> bool:
+    # /admin/profiles tylko przy włączonym profilowaniu i ustawionym tokenie
+    return enabled() and TOKEN is not None
+
+
+def authorized(token: str | None) -> bool:
+    if TOKEN is None or token is None:
+        return False
+    return hmac.compare_digest(token.encode(), TOKEN.encode())
+
+
+_current: contextvars.ContextVar["ProfileSession | None"] = contextvars.ContextVar("profile_session", default=None)
+# Wątki z aktywnym cProfile - drugi profiler w tym samym wątku nadpisałby pierwszy
+_profiled_threads = set()
+_profiled_lock = threading.Lock()
+PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12)
+# Zajęty przez żądanie profilowane jedynym profilerem procesu (PROCESS_WIDE_PROFILER)
+_process_profile_lock = threading.Lock()
+
+
+def _short_path(filename: str) -> str:
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    for prefix in (os.getcwd() + os.sep, sysconfig.get_paths()["stdlib"] + os.sep):
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    # Profil jednego żądania: cProfile na każdym uczestniczącym wątku (scalane do jednego pstats; od 3.12
+    # jeden profiler procesu) albo wątek próbkujący stosy zarejestrowanych wątków co PROFILING_SAMPLE_INTERVAL_MS
+    def __init__(self, mode: str, method: str, path: str, forced: bool, process_wide: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.process_wide = process_wide
+        self._process_profiler_started = False
+        self.method = method
+        self.path = path
+        self.forced = forced
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._threads = {}
+        self._stacks = Counter()
+        self._samples = 0
+        self._stopped = threading.Event()
+        self._sampler = None
+        if mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop, args=(SAMPLE_INTERVAL,),
+                                             name=f"profile-sampler-{self.id}", daemon=True)
+            self._sampler.start()
+
+    # --- wątki uczestniczące ---
+
+    def enter_thread(self):
+        thread_id = threading.get_ident()
+        if self.mode == "sample":
+            with self._lock:
+                self._threads[thread_id] = self._threads.get(thread_id, 0) + 1
+            return thread_id, None
+        if self.process_wide:
+            # Jeden profiler obejmuje wszystkie wątki - włącza go tylko pierwszy (wątek żądania)
+            with self._lock:
+                if self._process_profiler_started:
+                    return thread_id, None
+                self._process_profiler_started = True
+        else:
+            with _profiled_lock:
+                if thread_id in _profiled_threads:
+                    return thread_id, None
+                _profiled_threads.add(thread_id)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Profilowanie zajęte przez inne narzędzie (debugger, coverage) - wątek działa bez profilu
+            if not self.process_wide:
+                with _profiled_lock:
+                    _profiled_threads.discard(thread_id)
+            return thread_id, None
+        return thread_id, profiler
+
+    def exit_thread(self, state):
+        thread_id, profiler = state
+        if self.mode == "sample":
+            with self._lock:
+                remaining = self._threads.get(thread_id, 1) - 1
+                if remaining > 0:
+                    self._threads[thread_id] = remaining
+                else:
+                    self._threads.pop(thread_id, None)
+            return
+        if profiler is None:
+            return
+        profiler.disable()
+        if not self.process_wide:
+            with _profiled_lock:
+                _profiled_threads.discard(thread_id)
+        with self._lock:
+            self._profiles.append(profiler)
+
+    def _sample_loop(self, interval: float):
+        while not self._stopped.wait(interval):
+            with self._lock:
+                thread_ids = list(self._threads)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if labels:
+                    stacks.append(";".join(reversed(labels)))
+            with self._lock:
+                self._stacks.update(stacks)
+                self._samples += 1
+
+    # --- wynik ---
+
+    def finish(self, status) -> dict | None:
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        if self._sampler is not None:
+            self._stopped.set()
+            self._sampler.join()
+        with self._lock:
+            profiles, stacks, samples = list(self._profiles), dict(self._stacks), self._samples
+        if self.mode == "cprofile" and not profiles:
+            return None
+
+        entry = {
+            "id": self.id,
+            "mode": self.mode,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "forced": self.forced,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(duration_ms, 2),
+        }
+        if self.mode == "cprofile":
+            stats = pstats.Stats(profiles[0])
+            for profiler in profiles[1:]:
+                stats.add(profiler)
+            entry["threads"] = len(profiles)
+            entry["_data"] = marshal.dumps(stats.stats)
+        else:
+            entry["samples"] = samples
+            entry["_data"] = stacks
+        return entry
+
+
+class ProfileStore:
+    # Ostatnie PROFILING_MAX_PROFILES profili (bufor cykliczny w pamięci procesu)
+    def __init__(self, max_profiles: int):
+        self._profiles = deque(maxlen=max(1, max_profiles))
+        self._lock = threading.Lock()
+
+    def add(self, entry: dict):
+        with self._lock:
+            self._profiles.append(entry)
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            entries = list(self._profiles)
+        return [{key: value for key, value in entry.items() if not key.startswith("_")} for entry in reversed(entries)]
+
+    def get(self, profile_id: str) -> dict | None:
+        with self._lock:
+            return next((entry for entry in self._profiles if entry["id"] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profile_store = ProfileStore(int(os.getenv("PROFILING_MAX_PROFILES", 20)))
+
+
+def start_request(method: str, path: str, token: str | None) -> tuple | None:
+    # Decyzja o profilowaniu żądania; zwraca stan do finish_request albo None (bez narzutu)
+    if MODE == "off":
+        return None
+    forced = authorized(token)
+    if not forced:
+        if not path.startswith(PATHS) or random.random() >= SAMPLE_RATE:
+            return None
+    process_wide = MODE == "cprofile" and PROCESS_WIDE_PROFILER
+    if process_wide and not _process_profile_lock.acquire(blocking=False):
+        # Profiler procesu zajęty przez inne żądanie - to żądanie bez profilu
+        return None
+    session = ProfileSession(MODE, method, path, forced, process_wide)
+    return session, _current.set(session), session.enter_thread()
+
+
+def finish_request(state, status) -> dict | None:
+    session, context_token, thread_state = state
+    try:
+        session.exit_thread(thread_state)
+        _current.reset(context_token)
+        entry = session.finish(status)
+    finally:
+        if session.process_wide:
+            _process_profile_lock.release()
+    if entry is None:
+        return None
+    if not session.forced and entry["duration_ms"] < MIN_DURATION_MS:
+        return None
+    profile_store.add(entry)
+    return entry
+
+
+def propagate(func):
+    # Zadanie dla puli wątków w ramach profilowanego żądania: wątek roboczy dołącza do profilu.
+    # Bez aktywnego profilu zwraca func bez zmian.
+    session = _current.get()
+    if session is None:
+        return func
+
+    def profiled(*args, **kwargs):
+        state = session.enter_thread()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            session.exit_thread(state)
+    return profiled
+
+
+def export_profile(entry: dict, output_format: str | None = None) -> tuple[bytes, str, str]:
+    # (treść, content-type, rozszerzenie): pstats (cprofile, do pstats.Stats/snakeviz), text (top 50
+    # po czasie łącznym), collapsed (sample, do flamegraph.pl / speedscope)
+    output_format = output_format or ("pstats" if entry["mode"] == "cprofile" else "collapsed")
+    if entry["mode"] == "cprofile" and output_format == "pstats":
+        return entry["_data"], "application/octet-stream", "pstats"
+    if entry["mode"] == "cprofile" and output_format == "text":
+        stats = pstats.Stats(_StatsSource(marshal.loads(entry["_data"])), stream=io.StringIO())
+        stats.sort_stats("cumulative").print_stats(50)
+        return stats.stream.getvalue().encode(), "text/plain; charset=utf-8", "txt"
+    if entry["mode"] == "sample" and output_format == "collapsed":
+        lines = [f"{stack} {count}" for stack, count in sorted(entry["_data"].items(), key=lambda item: -item[1])]
+        return ("\n".join(lines) + "\n").encode(), "text/plain; charset=utf-8", "collapsed"
+    raise ValueError(f"Format '{output_format}' is not available for {entry['mode']} profiles.")
+
+
+class _StatsSource:
+    # pstats.Stats przyjmuje obiekt z create_stats() i atrybutem stats
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
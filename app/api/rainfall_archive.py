@@ -0,0 +1,270 @@
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import threading
+from collections.abc import Sequence
+from datetime import date, datetime, timedelta
+from typing import Iterable
+
+import numpy as np
+from flask import current_app
+
+# Kolumny rozpoznawane przez importer (własny format i eksport Visual Crossing)
+DATE_COLUMNS = ("date", "datetime")
+RAINFALL_COLUMNS = ("rainfall_mm", "precip", "rainfall")
+# Opady trzymane jako float32 (7 cyfr znaczących), przy odczycie zaokrąglane do 0.001 mm -
+# rozdzielczość danych dostawcy, więc wartości wracają dokładnie takie, jakie zaimportowano
+STORAGE_DTYPE = np.dtype("<f4")
+READ_DECIMALS = 3
+
+
+class RainfallArchiveError(ValueError):
+    pass
+
+
+class RainfallArchiveNotFound(RainfallArchiveError):
+    pass
+
+
+class RainfallSeries(Sequence):
+    # Wycinek archiwum w formacie prognozy: series[i] -> (data, opad_mm). Daty liczone z indeksu,
+    # więc wieloletnia seria nie buduje listy krotek; rainfall_mm() to gotowa tablica dla symulacji wsadowej.
+    def __init__(self, location: str, start: date, values: np.ndarray):
+        self.location = location
+        self.start = start
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(len(self.values))[index]
+            if indices.step != 1:
+                return [self[i] for i in indices]
+            return RainfallSeries(self.location, self.start + timedelta(days=indices.start),
+                                  self.values[indices.start:indices.stop])
+        index = range(len(self.values))[index]
+        return self.start + timedelta(days=index), float(self.values[index])
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=len(self.values) - 1)
+
+    def rainfall_mm(self) -> np.ndarray:
+        return self.values
+
+
+class RainfallArchive:
+    # Archiwum opadów per lokalizacja: <klucz>.npy (float32, dzień po dniu od daty początkowej,
+    # NaN = brak pomiaru) + <klucz>.json z metadanymi. Odczyt przez np.memmap, wycinek zakresu dat
+    # to przesunięcie o (data - początek).days - O(1) niezależnie od długości archiwum.
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._cache: dict[str, tuple[tuple, dict, np.ndarray]] = {}
+
+    @staticmethod
+    def location_key(location: str) -> str:
+        normalized = location.strip().casefold()
+        slug = re.sub(r"[^a-z0-9]+", "_", normalized).strip("_")[:40] or "location"
+        return f"{slug}-{hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:8]}"
+
+    def _paths(self, location: str) -> tuple[str, str]:
+        key = self.location_key(location)
+        return os.path.join(self.root, f"{key}.npy"), os.path.join(self.root, f"{key}.json")
+
+    def _load(self, location: str) -> tuple[dict, np.ndarray]:
+        data_path, meta_path = self._paths(location)
+        for _ in range(2):
+            try:
+                signature = tuple((os.stat(path).st_mtime_ns, os.stat(path).st_ino) for path in (data_path, meta_path))
+            except FileNotFoundError:
+                raise RainfallArchiveNotFound(f"No rainfall archive for '{location}'.")
+            cached = self._cache.get(data_path)
+            if cached is not None and cached[0] == signature:
+                return cached[1], cached[2]
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            values = np.load(data_path, mmap_mode="r")
+            if len(values) == meta["days"]:
+                self._cache[data_path] = (signature, meta, values)
+                return meta, values
+            # Trafiliśmy między podmianą danych a metadanych - jeszcze jedna próba
+        raise RainfallArchiveError(f"Rainfall archive for '{location}' is being updated, try again.")
+
+    def info(self, location: str) -> dict:
+        meta, values = self._load(location)
+        return {**meta, "missing_days": int(np.isnan(values).sum())}
+
+    def locations(self) -> list[dict]:
+        if not os.path.isdir(self.root):
+            return []
+        archived = []
+        for file_name in sorted(os.listdir(self.root)):
+            if file_name.endswith(".json"):
+                with open(os.path.join(self.root, file_name), encoding="utf-8") as meta_file:
+                    archived.append(json.load(meta_file))
+        return archived
+
+    def series(self, location: str, start: date | None = None, end: date | None = None,
+               fill_missing: float | None = None) -> RainfallSeries:
+        meta, values = self._load(location)
+        archive_start = date.fromisoformat(meta["start"])
+        archive_end = archive_start + timedelta(days=meta["days"] - 1)
+        start = start or archive_start
+        end = end or archive_end
+        if start > end:
+            raise RainfallArchiveError(f"Range start {start} is after its end {end}.")
+        if start < archive_start or end > archive_end:
+            raise RainfallArchiveError(
+                f"Rainfall archive for '{location}' covers {archive_start} to {archive_end}, requested {start} to {end}.")
+
+        offset = (start - archive_start).days
+        window = np.round(values[offset:offset + (end - start).days + 1].astype(np.float64), READ_DECIMALS)
+        missing = np.isnan(window)
+        if missing.any():
+            if fill_missing is None:
+                raise RainfallArchiveError(
+                    f"Rainfall archive for '{location}' has {int(missing.sum())} missing day(s) between {start} and {end}.")
+            window[missing] = fill_missing
+        return RainfallSeries(meta["location"], start, window)
+
+    def import_records(self, location: str, records: Iterable[tuple[date, float]], source: str | None = None) -> dict:
+        # Nowe dni nadpisują istniejące (poza brakami pomiaru - pusta wartość nie kasuje zapisanego
+        # opadu), zakres archiwum rozszerza się o importowane daty
+        records = list(records)
+        if not records:
+            raise RainfallArchiveError("No rainfall records to import.")
+        max_days = int(os.getenv("RAINFALL_ARCHIVE_MAX_DAYS", 73050))
+        data_path, meta_path = self._paths(location)
+
+        with self._lock:
+            try:
+                meta, existing = self._load(location)
+                existing_start = date.fromisoformat(meta["start"])
+            except RainfallArchiveNotFound:
+                meta, existing, existing_start = {}, None, None
+
+            dates = [day for day, _ in records]
+            start, end = min(dates), max(dates)
+            if existing is not None:
+                start = min(start, existing_start)
+                end = max(end, existing_start + timedelta(days=len(existing) - 1))
+            days = (end - start).days + 1
+            if days > max_days:
+                raise RainfallArchiveError(
+                    f"Rainfall archive for '{location}' would span {days} days ({start} to {end}), the limit is {max_days}.")
+
+            values = np.full(days, np.nan, dtype=STORAGE_DTYPE)
+            if existing is not None:
+                offset = (existing_start - start).days
+                values[offset:offset + len(existing)] = existing
+            offsets = np.fromiter(((day - start).days for day in dates), dtype=np.int64, count=len(dates))
+            incoming = np.fromiter((rainfall for _, rainfall in records), dtype=np.float64, count=len(records))
+            written = ~np.isnan(incoming) | np.isnan(values[offsets])
+            values[offsets[written]] = incoming[written]
+
+            meta = {
+                "location": meta.get("location", location.strip()),
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "days": days,
+                "updated_at": datetime.utcnow().isoformat(),
+                "source": source or meta.get("source"),
+            }
+            # Zapis przez plik tymczasowy i os.replace - czytelnicy z otwartym memmapem zachowują starą wersję
+            os.makedirs(self.root, exist_ok=True)
+            with open(f"{data_path}.tmp", "wb") as data_file:
+                np.save(data_file, values)
+            os.replace(f"{data_path}.tmp", data_path)
+            with open(f"{meta_path}.tmp", "w", encoding="utf-8") as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(f"{meta_path}.tmp", meta_path)
+
+        return {**meta, "imported_days": len(records), "missing_days": int(np.isnan(values).sum())}
+
+    def delete(self, location: str) -> bool:
+        data_path, meta_path = self._paths(location)
+        with self._lock:
+            self._cache.pop(data_path, None)
+            removed = False
+            for path in (meta_path, data_path):
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed = True
+        return removed
+
+
+def _column(row: dict, names: tuple[str, ...]):
+    for name in names:
+        if name in row:
+            return row[name]
+    raise RainfallArchiveError(f"Record has none of the columns: {', '.join(names)}")
+
+
+def _record(row: dict) -> tuple[date, float]:
+    try:
+        day = date.fromisoformat(str(_column(row, DATE_COLUMNS)).strip()[:10])
+        raw = _column(row, RAINFALL_COLUMNS)
+        # Pusta wartość to brak pomiaru (NaN), nie zero opadu
+        rainfall = math.nan if raw is None or str(raw).strip() == "" else float(raw)
+    except (TypeError, ValueError) as e:
+        raise RainfallArchiveError(f"Invalid rainfall record {row!r}: {e}")
+    # Dane Visual Crossing: opad bez deszczu (sam śnieg itp.) nie trafia do zbiornika - ta sama
+    # reguła co przy prognozie (weather_data_service._parse_rainfall_forecast)
+    preciptype = row.get("preciptype")
+    if preciptype and "rain" not in preciptype and not math.isnan(rainfall):
+        rainfall = 0.0
+    if rainfall < 0:
+        raise RainfallArchiveError(f"Negative rainfall in record {row!r}.")
+    return day, rainfall
+
+
+def parse_rainfall_csv(text: str) -> list[tuple[date, float]]:
+    reader = csv.DictReader(io.StringIO(text))
+    if reader.fieldnames is None:
+        raise RainfallArchiveError("CSV dump is empty.")
+    reader.fieldnames = [name.strip().casefold() for name in reader.fieldnames]
+    return [_record(row) for row in reader]
+
+
+def parse_rainfall_json(payload) -> list[tuple[date, float]]:
+    # Lista rekordów, {"rainfall": [...]} lub odpowiedź Visual Crossing ({"days": [...]})
+    if isinstance(payload, dict):
+        payload = payload.get("rainfall", payload.get("days"))
+    if not isinstance(payload, list):
+        raise RainfallArchiveError("JSON dump must be a list of {date, rainfall_mm} records.")
+    if not all(isinstance(row, dict) for row in payload):
+        raise RainfallArchiveError("Every JSON rainfall record must be an object.")
+    return [_record(row) for row in payload]
+
+
+def parse_rainfall_dump(text: str, dump_format: str) -> list[tuple[date, float]]:
+    if dump_format == "csv":
+        return parse_rainfall_csv(text)
+    if dump_format == "json":
+        try:
+            return parse_rainfall_json(json.loads(text))
+        except json.JSONDecodeError as e:
+            raise RainfallArchiveError(f"Invalid JSON dump: {e}")
+    raise RainfallArchiveError(f"Unknown dump format '{dump_format}', expected csv or json.")
+
+
+_archives: dict[str, RainfallArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def get_rainfall_archive(root: str | None = None) -> RainfallArchive:
+    # Domyślnie RAINFALL_ARCHIVE_DIR albo <instance>/rainfall_archive (obok lokalnej bazy SQLite)
+    root = os.path.abspath(root or os.getenv("RAINFALL_ARCHIVE_DIR")
+                           or os.path.join(current_app.instance_path, "rainfall_archive"))
+    with _archives_lock:
+        archive = _archives.get(root)
+        if archive is None:
+            archive = _archives[root] = RainfallArchive(root)
+    return archive
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from app.init_db import db
+from app.api.metrics import register_collector, stats_families
+from app.api.tank_controllers import effective_options
+from app.models.simulation_result_cache import SimulationResultCache
+
+# Zmiana dynamiki zbiornika lub regulatorów = nowa wersja, żeby warstwa bazodanowa nie oddawała starych wyników.
+# To jedyny sposób unieważnienia cache: stare klucze przestają trafiać, a ich wiersze w bazie
+# wypadają jako najdawniej użyte (RESULT_CACHE_DB_SIZE)
+RESULT_CACHE_VERSION = 1
+KEY_FIELDS = ("tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size", "initial_water_level")
+
+
+def forecast_digest(forecast) -> str:
+    # "Wersja" prognozy: skrót dat i wartości - nowa prognoza dla miasta to nowy klucz wyników
+    digest = hashlib.sha256()
+    for forecast_date, rainfall_mm in forecast:
+        day = forecast_date.isoformat() if isinstance(forecast_date, date) else str(forecast_date)
+        digest.update(f"{day}={rainfall_mm!r};".encode())
+    return digest.hexdigest()
+
+
+def result_key(user_data, controllers: list[str], options: dict[str, dict], horizon: int | None, forecast) -> str:
+    normalized = {
+        "version": RESULT_CACHE_VERSION,
+        "location": user_data.location.strip().casefold(),
+        **{field: getattr(user_data, field) for field in KEY_FIELDS},
+        "controllers": sorted(controllers),
+        # Wartości domyślne z env (FUZZY_MODE, MPC_HORIZON, ...) rozwiązane - ich zmiana to nowy klucz
+        "options": {name: effective_options(name, options.get(name) or {}) for name in controllers},
+        "horizon": horizon,
+        "forecast": forecast_digest(forecast),
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultCache:
+    # Cache wyników symulacji adresowany treścią (klucz z result_key). Pamięć: LRU ograniczone liczbą
+    # wpisów i łącznym rozmiarem JSON; opcjonalnie tabela simulation_result_cache ograniczona liczbą
+    # wierszy (usuwane najdawniej użyte). Trafienie w bazie wraca do pamięci. Zwracane wyniki są
+    # współdzielone - wywołujący ich nie modyfikują.
+    def __init__(self, max_entries: int, max_bytes: int, db_tier: bool = False, db_max_entries: int = 10000,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.db_tier = db_tier
+        self.db_max_entries = max(1, db_max_entries)
+        self._entries: "OrderedDict[str, tuple[int, dict]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "db_hits": 0, "misses": 0, "evictions": 0, "db_evictions": 0}
+
+    def get(self, key: str) -> dict | None:
+        result = self.get_memory(key)
+        if result is None and self.db_tier:
+            result = self.get_db(key)
+        if result is None:
+            with self._lock:
+                self._stats["misses"] += 1
+        return result
+
+    def get_memory(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def get_db(self, key: str) -> dict | None:
+        # Wymaga kontekstu aplikacji
+        try:
+            row = db.session.get(SimulationResultCache, key)
+            if row is None:
+                return None
+            row.last_used_at = datetime.utcnow()
+            db.session.commit()
+            result = json.loads(row.payload)
+        except Exception:
+            # Jak przy zapisie: błąd bazy (lub uszkodzony wpis) to chybienie, symulacja liczy się od nowa
+            db.session.rollback()
+            return None
+        with self._lock:
+            self._stats["db_hits"] += 1
+            self._store(key, result, row.size)
+        return result
+
+    def put(self, key: str, result: dict):
+        payload = json.dumps(result, separators=(",", ":"))
+        with self._lock:
+            self._store(key, result, len(payload))
+        if self.db_tier:
+            self.put_db(key, payload)
+
+    def put_db(self, key: str, payload: str):
+        now = datetime.utcnow()
+        try:
+            db.session.merge(SimulationResultCache(key=key, payload=payload, size=len(payload), created_at=now,
+                                                   last_used_at=now))
+            db.session.commit()
+            excess = SimulationResultCache.query.count() - self.db_max_entries
+            if excess > 0:
+                oldest = db.session.query(SimulationResultCache.key) \
+                    .order_by(SimulationResultCache.last_used_at).limit(excess).subquery()
+                evicted = SimulationResultCache.query.filter(SimulationResultCache.key.in_(db.select(oldest))) \
+                    .delete(synchronize_session=False)
+                db.session.commit()
+                with self._lock:
+                    self._stats["db_evictions"] += evicted
+        except Exception:
+            # Cache nie może zepsuć odpowiedzi - np. wyścig dwóch procesów o ten sam klucz
+            db.session.rollback()
+
+    def _store(self, key: str, result: dict, size: int):
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[0]
+        self._entries[key] = (size, result)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            evicted_size, _ = self._entries.popitem(last=False)[1]
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "db_tier": self.db_tier,
+                "db_max_entries": self.db_max_entries if self.db_tier else None,
+            }
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+result_cache = ResultCache(
+    enabled=_env_flag("RESULT_CACHE_ENABLED", "true"),
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", 512)),
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    db_tier=_env_flag("RESULT_CACHE_DB", "false"),
+    db_max_entries=int(os.getenv("RESULT_CACHE_DB_SIZE", 10000)),
+)
+
+
+@register_collector
+def _result_cache_metrics() -> list[tuple]:
+    return stats_families("result_cache", result_cache.stats(), counters={
+        "hits": "Simulation result cache hits in memory.",
+        "db_hits": "Simulation result cache hits in the database tier.",
+        "misses": "Simulation result cache misses.",
+        "evictions": "Simulation results evicted from memory.",
+        "db_evictions": "Simulation results evicted from the database tier.",
+    }, gauges={"size": "Simulation results cached in memory.", "bytes": "JSON size of the results cached in memory."})
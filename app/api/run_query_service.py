@@ -0,0 +1,156 @@
+from datetime import date, datetime
+
+from sqlalchemy import Date, cast, func, literal, tuple_
+
+from app.init_db import db
+from app.api.simulation_request_service import SimulationRequestError
+from app.models.simulation_run import SimulationRun, SimulationRunDay
+
+AGGREGATE_PERIODS = ("day", "week", "month")
+AGGREGATED_COLUMNS = ("pumped_up_water", "saved_water", "pumped_out_water")
+MAX_PAGE_SIZE = 1000
+
+
+def _parse_limit(value, default: int) -> int:
+    # Wartość spoza zakresu to błąd żądania, a nie po cichu przycięta strona
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = None
+    if limit is None or not 1 <= limit <= MAX_PAGE_SIZE:
+        raise SimulationRequestError(f"'limit' must be an integer between 1 and {MAX_PAGE_SIZE}.", 400)
+    return limit
+
+
+def _parse_date(value, field: str) -> date | None:
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise SimulationRequestError(f"'{field}' must be an ISO date (YYYY-MM-DD).", 400)
+
+
+def _run_filters(query, args):
+    # Wspólne filtry listy przebiegów i agregatów po wielu przebiegach
+    if args.get("location"):
+        query = query.filter(SimulationRun.location == args["location"])
+    if args.get("controller"):
+        query = query.filter(SimulationRun.controller == args["controller"])
+    created_after = _parse_date(args.get("created_after"), "created_after")
+    if created_after:
+        query = query.filter(SimulationRun.created_at >= created_after)
+    created_before = _parse_date(args.get("created_before"), "created_before")
+    if created_before:
+        query = query.filter(SimulationRun.created_at < created_before)
+    return query
+
+
+def list_runs(args) -> dict:
+    # Stronicowanie po kluczu (created_at, id) malejąco: kursor to ostatni zwrócony przebieg,
+    # więc kolejne strony kosztują tyle samo niezależnie od liczby przebiegów w bazie
+    limit = _parse_limit(args.get("limit"), 50)
+    query = _run_filters(SimulationRun.query, args)
+
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            created_at, run_id = cursor.rsplit("_", 1)
+            cursor_key = (datetime.fromisoformat(created_at), int(run_id))
+        except ValueError:
+            raise SimulationRequestError("Invalid 'cursor'.", 400)
+        query = query.filter(tuple_(SimulationRun.created_at, SimulationRun.id) < tuple_(*cursor_key))
+
+    runs = query.order_by(SimulationRun.created_at.desc(), SimulationRun.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(runs) > limit:
+        runs = runs[:limit]
+        next_cursor = f"{runs[-1].created_at.isoformat()}_{runs[-1].id}"
+    return {"runs": [run.to_json() for run in runs], "next_cursor": next_cursor}
+
+
+def get_run(run_id: int) -> SimulationRun:
+    run = db.session.get(SimulationRun, run_id)
+    if run is None:
+        raise SimulationRequestError(f"Simulation run {run_id} not found.", 404)
+    return run
+
+
+def _day_range(query, args):
+    start = _parse_date(args.get("start"), "start")
+    end = _parse_date(args.get("end"), "end")
+    if start:
+        query = query.filter(SimulationRunDay.date >= start)
+    if end:
+        query = query.filter(SimulationRunDay.date <= end)
+    return query
+
+
+def run_days(run_id: int, args) -> dict:
+    # Wiersze dzienne przebiegu w zakresie dat, stronicowane po dacie (kursor = ostatnia data);
+    # zapytanie to zakres na kluczu głównym (run_id, date)
+    run = get_run(run_id)
+    limit = _parse_limit(args.get("limit"), 366)
+    query = _day_range(SimulationRunDay.query.filter(SimulationRunDay.run_id == run.id), args)
+    after = _parse_date(args.get("cursor"), "cursor")
+    if after:
+        query = query.filter(SimulationRunDay.date > after)
+
+    days = query.order_by(SimulationRunDay.date).limit(limit + 1).all()
+    next_cursor = None
+    if len(days) > limit:
+        days = days[:limit]
+        next_cursor = days[-1].date.isoformat()
+    return {"run_id": run.id, "days": [day.to_json() for day in days], "next_cursor": next_cursor}
+
+
+def _period_expression(period: str):
+    # Początek okresu liczony w bazie - PostgreSQL date_trunc, SQLite funkcje daty na tekście ISO
+    column = SimulationRunDay.date
+    if period == "day":
+        return column
+    if db.engine.dialect.name == "postgresql":
+        return cast(func.date_trunc(period, column), Date)
+    if db.engine.dialect.name == "sqlite":
+        if period == "month":
+            return func.strftime("%Y-%m-01", column)
+        # Poniedziałek tygodnia ISO: data - ((dzień tygodnia + 6) % 7) dni
+        return func.date(column, literal("-") + ((cast(func.strftime("%w", column), db.Integer) + 6) % 7).cast(db.String)
+                         + literal(" days"))
+    raise SimulationRequestError(f"Period '{period}' is not supported for '{db.engine.dialect.name}'.", 400)
+
+
+def aggregate_days(args, run_id: int | None = None) -> dict:
+    # Sumy i średnie (dopompowanie, deszczówka, przelew) oraz poziom wody na dzień/tydzień/miesiąc,
+    # liczone w SQL. Z run_id - jeden przebieg; bez - wszystkie przebiegi spełniające filtry
+    # (location, controller, created_after/before), średnie liczone po dniach wszystkich przebiegów.
+    period = args.get("period", "day")
+    if period not in AGGREGATE_PERIODS:
+        raise SimulationRequestError(f"'period' must be one of: {', '.join(AGGREGATE_PERIODS)}", 400)
+
+    bucket = _period_expression(period).label("period")
+    columns = [bucket, func.count().label("days"), func.count(func.distinct(SimulationRunDay.run_id)).label("runs")]
+    for name in AGGREGATED_COLUMNS:
+        column = getattr(SimulationRunDay, name)
+        columns += [func.sum(column).label(f"total_{name}"), func.avg(column).label(f"mean_{name}")]
+    columns += [func.avg(SimulationRunDay.water_amount).label("mean_water_amount"),
+                func.min(SimulationRunDay.water_amount).label("min_water_amount")]
+
+    query = db.session.query(*columns)
+    if run_id is not None:
+        query = query.filter(SimulationRunDay.run_id == get_run(run_id).id)
+    else:
+        query = _run_filters(query.join(SimulationRun, SimulationRun.id == SimulationRunDay.run_id), args)
+    query = _day_range(query, args).group_by(bucket).order_by(bucket)
+
+    periods = []
+    for row in query:
+        values = row._asdict()
+        period_start = values.pop("period")
+        periods.append({
+            "period_start": period_start.isoformat() if isinstance(period_start, date) else str(period_start),
+            **{key: round(value, 2) if isinstance(value, float) else value for key, value in values.items()},
+        })
+    return {"period": period, "run_id": run_id, "periods": periods}
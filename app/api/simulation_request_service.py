@@ -0,0 +1,472 @@
+import asyncio
+import json
+import os
+import time
+from datetime import date
+from functools import partial
+from typing import Iterator
+
+from flask import current_app
+
+from app.init_db import db
+from app.api.executors import get_process_pool, get_thread_pool
+from app.api.metrics import SIMULATION_STAGE_DURATION
+from app.api.profiling import propagate
+from app.models.user_data import UserData
+from app.models.simulation_run import SimulationRun, SimulationRunDay
+from app.api.async_database import get_group_commit_writer
+from app.api.result_cache import result_cache, result_key
+from app.api.rainfall_archive import (RainfallArchiveError, RainfallArchiveNotFound, RainfallSeries,
+                                      get_rainfall_archive)
+from app.api.weather_data_service import fetch_rainfall_forecast, fetch_rainfall_forecast_async
+from app.api.simulation_service import iter_controller_simulation, run_controller_simulation
+from app.api.tank_controllers import available_controllers, is_cpu_bound
+
+REQUIRED_FIELDS = ["tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size", "location"]
+DEFAULT_CONTROLLERS = ["pi", "fuzzy"]
+PERSISTED_CONTROLLER = "pi"  # Tylko przebiegi PI zapisywane są w simulation_run
+PARAMETER_FIELDS = ("tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size", "initial_water_level")
+EXECUTOR_MODES = ("none", "thread", "process")
+DEFAULT_HORIZON = 30  # Dni symulacji dla prognozy, gdy żądanie nie podaje 'horizon'
+
+
+class SimulationRequestError(Exception):
+    # Błąd z gotowym komunikatem i kodem HTTP - trasa zwraca go jako JSON, Dash pokazuje komunikat
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def parse_user_data(data: dict) -> UserData:
+    if not all(field in data for field in REQUIRED_FIELDS):
+        raise SimulationRequestError(f"Missing one or more required fields: {', '.join(REQUIRED_FIELDS)}", 400)
+
+    try:
+        return UserData(
+            tank_capacity=data["tank_capacity"],
+            min_water_level=data["min_water_level"],
+            daily_water_usage=data["daily_water_usage"],
+            rooftop_size=data["rooftop_size"],
+            location=data["location"],
+            initial_water_level=data.get("initial_water_level")  # Optional
+        )
+    except ValueError as e:
+        raise SimulationRequestError(str(e), 400)
+
+
+def _max_horizon() -> int:
+    return int(os.getenv("SIMULATION_MAX_HORIZON", 36525))
+
+
+def parse_horizon(data: dict, default: int | None = DEFAULT_HORIZON) -> int | None:
+    horizon = data.get("horizon")
+    if horizon is None:
+        return default
+    if isinstance(horizon, bool) or not isinstance(horizon, int) or not 0 < horizon <= _max_horizon():
+        raise SimulationRequestError(f"'horizon' must be an integer between 1 and {_max_horizon()} days.", 400)
+    return horizon
+
+
+def parse_rainfall_series(series, max_days: int | None = None) -> list[tuple[date, float]]:
+    # [{"date": "2020-01-01", "rainfall_mm": 1.2}, ...] - historyczna seria opadów dowolnej długości
+    max_days = _max_horizon() if max_days is None else max_days
+    if not isinstance(series, list) or not series:
+        raise SimulationRequestError("'rainfall' must be a non-empty list of {date, rainfall_mm} objects.", 400)
+    if len(series) > max_days:
+        raise SimulationRequestError(f"'rainfall' has {len(series)} days, the limit is {max_days}.", 400)
+    try:
+        return [(date.fromisoformat(str(day["date"])), float(day["rainfall_mm"])) for day in series]
+    except (KeyError, TypeError, ValueError) as e:
+        raise SimulationRequestError(f"Invalid 'rainfall' entry: {e}", 400)
+
+
+def _parse_archive_date(archive_range: dict, field: str) -> date | None:
+    value = archive_range.get(field)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise SimulationRequestError(f"'archive.{field}' must be an ISO date (YYYY-MM-DD).", 400)
+
+
+def archived_rainfall(data: dict, max_days: int | None = None) -> RainfallSeries:
+    # "archive": {"start": ..., "end": ..., "fill_missing": ...} - opady z lokalnego archiwum dla 'location'
+    # zamiast prognozy; bez start/end cały zakres archiwum
+    archive_range = data.get("archive")
+    if not isinstance(archive_range, dict):
+        raise SimulationRequestError("'archive' must be an object with optional 'start', 'end' and 'fill_missing'.", 400)
+    if "location" not in data:
+        raise SimulationRequestError("Archived rainfall needs a 'location'.", 400)
+    fill_missing = archive_range.get("fill_missing")
+    if fill_missing is not None and (isinstance(fill_missing, bool) or not isinstance(fill_missing, (int, float))):
+        raise SimulationRequestError("'archive.fill_missing' must be a number.", 400)
+
+    try:
+        rainfall = get_rainfall_archive().series(
+            str(data["location"]), _parse_archive_date(archive_range, "start"),
+            _parse_archive_date(archive_range, "end"), fill_missing)
+    except RainfallArchiveNotFound as e:
+        raise SimulationRequestError(str(e), 404)
+    except RainfallArchiveError as e:
+        raise SimulationRequestError(str(e), 400)
+
+    max_days = _max_horizon() if max_days is None else max_days
+    if len(rainfall) > max_days:
+        raise SimulationRequestError(f"Archive range has {len(rainfall)} days, the limit is {max_days}.", 400)
+    return rainfall
+
+
+def run_parameters(user_data: UserData, horizon: int | None, options: dict) -> dict:
+    return {**{field: getattr(user_data, field) for field in PARAMETER_FIELDS}, "horizon": horizon,
+            "options": options}
+
+
+def persist_run(user_data: UserData, name: str, records: list[dict], horizon: int | None, options: dict) -> int:
+    # Przebieg i jego wiersze dzienne: jeden INSERT przebiegu, jeden executemany wierszy, jeden commit.
+    # Każde żądanie to nowy przebieg - wcześniejsze wyniki (też innych użytkowników) zostają nietknięte.
+    try:
+        run = SimulationRun(**SimulationRun.run_values(
+            user_data.location, name, run_parameters(user_data, horizon, options), records))
+        db.session.add(run)
+        db.session.flush()
+        if records:
+            db.session.execute(SimulationRunDay.insert_statement(), SimulationRunDay.insert_parameters(run.id, records))
+        db.session.commit()
+        return run.id
+    except Exception as db_error:
+        db.session.rollback()
+        raise SimulationRequestError(f"Database error: {str(db_error)}", 500)
+
+
+async def persist_run_async(user_data: UserData, name: str, records: list[dict], horizon: int | None,
+                            options: dict) -> int:
+    # Ten sam zapis przez silnik asynchroniczny - czekanie na bazę nie trzyma wątku,
+    # a równoległe żądania dzielą jeden commit (GroupCommitWriter)
+    run_values = SimulationRun.run_values(user_data.location, name, run_parameters(user_data, horizon, options),
+                                          records)
+
+    async def insert_run(connection) -> int:
+        run_id = (await connection.execute(SimulationRun.insert_statement(), run_values)).scalar_one()
+        if records:
+            await connection.execute(SimulationRunDay.insert_statement(),
+                                     SimulationRunDay.insert_parameters(run_id, records))
+        return run_id
+
+    try:
+        return await get_group_commit_writer(db.engine.url).run(insert_run)
+    except Exception as db_error:
+        raise SimulationRequestError(f"Database error: {str(db_error)}", 500)
+
+
+def parse_controllers(data: dict) -> list[str]:
+    # Lista regulatorów z żądania ("controllers": ["pi", "fuzzy", ...]); domyślnie PI i rozmyty
+    controllers = data.get("controllers", DEFAULT_CONTROLLERS)
+    if isinstance(controllers, str):
+        controllers = [controllers]
+    if not isinstance(controllers, list) or not controllers or not all(isinstance(c, str) for c in controllers):
+        raise SimulationRequestError("'controllers' must be a non-empty list of controller names.", 400)
+
+    unknown = [name for name in controllers if name not in available_controllers()]
+    if unknown:
+        raise SimulationRequestError(
+            f"Unknown controller(s): {', '.join(unknown)}; available: {', '.join(available_controllers())}", 400)
+    return list(dict.fromkeys(controllers))
+
+
+def controller_options(data: dict, name: str) -> dict:
+    options = dict((data.get("controller_options") or {}).get(name) or {})
+    if name == "fuzzy":
+        options.setdefault("fuzzy_mode", data.get("fuzzy_mode"))
+    if name == "mpc":
+        # Horyzont predykcji MPC - niezależny od "horizon" (liczby symulowanych dni)
+        options.setdefault("lookahead_days", data.get("lookahead_days"))
+    return options
+
+
+class _StageTimer:
+    # Czasy etapów: zawsze do histogramu simulation_stage_duration_seconds (/metrics),
+    # do słownika timings (nagłówek Server-Timing) tylko gdy go podano
+    def __init__(self, timings: dict | None):
+        self.timings = timings
+
+    def record(self, stage: str, started: float):
+        elapsed = time.perf_counter() - started
+        SIMULATION_STAGE_DURATION.observe(elapsed, stage)
+        if self.timings is not None:
+            self.timings[stage] = elapsed * 1000
+
+    def run(self, stage: str, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(stage, started)
+
+    async def run_async(self, stage: str, func, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.record(stage, started)
+
+
+def _executor_mode() -> str:
+    mode = os.getenv("SIMULATION_EXECUTOR", "thread").strip().lower()
+    if mode not in EXECUTOR_MODES:
+        raise ValueError(f"Unknown SIMULATION_EXECUTOR '{mode}', expected one of: {', '.join(EXECUTOR_MODES)}")
+    return mode
+
+
+# Sprawdzane przy imporcie: błędna konfiguracja zatrzymuje start serwera, zamiast zamieniać każde
+# żądanie w 400 "Data processing error"
+EXECUTOR_MODE = _executor_mode()
+
+
+def _simulate(app, timer: _StageTimer, name: str, user_data: UserData, rainfall_forecast_tuples,
+              horizon: int, options: dict) -> list[dict]:
+    with app.app_context():
+        return timer.run(name, run_controller_simulation, name, user_data, rainfall_forecast_tuples,
+                         horizon=horizon, **options)
+
+
+def _run_controller(app, timer: _StageTimer, name: str, user_data: UserData, rainfall_forecast_tuples,
+                    horizon: int, options: dict, run_ids: dict) -> list[dict]:
+    records = _simulate(app, timer, name, user_data, rainfall_forecast_tuples, horizon, options)
+    if name == PERSISTED_CONTROLLER:
+        # Zapis wyników PI zależy tylko od PI - nie czeka na pozostałe regulatory
+        with app.app_context():
+            run_ids[name] = timer.run("persist", persist_run, user_data, name, records, horizon, options)
+    return records
+
+
+def _time_future(timer: _StageTimer, stage: str, future):
+    started = time.perf_counter()
+    future.add_done_callback(lambda _: timer.record(stage, started))
+
+
+def _run_controllers(user_data: UserData, rainfall_forecast_tuples, controllers: list[str], data: dict,
+                     horizon: int, timer: _StageTimer, run_ids: dict) -> dict[str, list[dict]]:
+    mode = EXECUTOR_MODE
+    app = current_app._get_current_object()
+    options = {name: controller_options(data, name) for name in controllers}
+
+    if mode == "none" or len(controllers) == 1:
+        return {name: _run_controller(app, timer, name, user_data, rainfall_forecast_tuples, horizon, options[name],
+                                      run_ids)
+                for name in controllers}
+
+    # Łańcuch PI -> zapis zostaje w bieżącym wątku (potrzebuje sesji bazy), pozostałe regulatory równolegle
+    inline = PERSISTED_CONTROLLER if PERSISTED_CONTROLLER in controllers else controllers[0]
+    futures = {}
+    for name in controllers:
+        if name == inline:
+            continue
+        if mode == "process" and is_cpu_bound(name):
+            # Regulatory obliczeniowe (GIL) - osobne procesy; czas mierzony po stronie rodzica
+            futures[name] = get_process_pool().submit(run_controller_simulation, name, user_data,
+                                                      rainfall_forecast_tuples, horizon=horizon, **options[name])
+            _time_future(timer, name, futures[name])
+        else:
+            futures[name] = get_thread_pool().submit(propagate(_run_controller), app, timer, name, user_data,
+                                                     rainfall_forecast_tuples, horizon, options[name], run_ids)
+
+    results = {inline: _run_controller(app, timer, inline, user_data, rainfall_forecast_tuples, horizon,
+                                       options[inline], run_ids)}
+    for name, future in futures.items():
+        results[name] = future.result()
+    return {name: results[name] for name in controllers}
+
+
+def _response(controller_results: dict[str, list[dict]], run_ids: dict[str, int]) -> dict:
+    # Wyniki regulatorów i identyfikatory zapisanych przebiegów ({nazwa}_run_id)
+    response = {f"{name}_controller_results": records for name, records in controller_results.items()}
+    response.update({f"{name}_run_id": run_id for name, run_id in run_ids.items()})
+    return response
+
+
+def _result_cache_key(data: dict, user_data: UserData, controllers: list[str], horizon: int,
+                      rainfall_forecast_tuples) -> str | None:
+    # Identyczne żądanie (te same parametry, regulatory z opcjami, horyzont i ta sama prognoza) zwraca
+    # zapamiętaną odpowiedź - bez liczenia regulatorów i bez nowego przebiegu w bazie
+    if not result_cache.enabled or data.get("use_cache", True) is False:
+        return None
+    options = {name: controller_options(data, name) for name in controllers}
+    return result_key(user_data, controllers, options, horizon, rainfall_forecast_tuples)
+
+
+def _with_app_context(app, func, *args):
+    with app.app_context():
+        return func(*args)
+
+
+def run_simulation_request(data: dict, timings: dict | None = None) -> dict:
+    # Wspólna ścieżka dla POST /api/simulation i callbacku Dash - bez pętli HTTP do samego siebie.
+    # Jeśli podano słownik timings, trafiają do niego czasy etapów w milisekundach.
+    timer = _StageTimer(timings)
+    user_data = parse_user_data(data)
+    controllers = parse_controllers(data)
+    horizon = parse_horizon(data)
+
+    try:
+        rainfall_forecast_tuples = timer.run("forecast", fetch_rainfall_forecast, user_data.location, days=horizon)
+        if not rainfall_forecast_tuples:
+            raise SimulationRequestError("Could not retrieve rainfall forecast data.", 500)
+
+        # Regulatory (PI + zapis do bazy) równolegle - czas żądania to najwolniejszy etap
+        cache_key = _result_cache_key(data, user_data, controllers, horizon, rainfall_forecast_tuples)
+        if cache_key is not None:
+            cached = timer.run("result_cache", result_cache.get, cache_key)
+            if cached is not None:
+                return cached
+
+        run_ids = {}
+        controller_results = timer.run(
+            "controllers", _run_controllers, user_data, rainfall_forecast_tuples, controllers, data, horizon, timer,
+            run_ids)
+
+        response = _response(controller_results, run_ids)
+        if cache_key is not None:
+            result_cache.put(cache_key, response)
+        return response
+
+    except SimulationRequestError:
+        raise
+    except ConnectionError as e:
+        raise SimulationRequestError(f"External API connection error: {str(e)}", 503)
+    except ValueError as e:
+        raise SimulationRequestError(f"Data processing error: {str(e)}", 400)
+    except Exception as e:
+        db.session.rollback()  # Ensure rollback on any other unexpected error
+        raise SimulationRequestError(f"An internal server error occurred: {str(e)}", 500)
+
+
+async def _run_controller_async(app, timer: _StageTimer, name: str, user_data: UserData, rainfall_forecast_tuples,
+                                horizon: int, options: dict, run_ids: dict) -> list[dict]:
+    # Obliczenia zawsze poza pętlą zdarzeń; SIMULATION_EXECUTOR=none nie ma tu sensu, bo blokowałby pętlę
+    loop = asyncio.get_running_loop()
+    if EXECUTOR_MODE == "process" and is_cpu_bound(name):
+        records = await timer.run_async(name, loop.run_in_executor, get_process_pool(),
+                                        partial(run_controller_simulation, name, user_data,
+                                                rainfall_forecast_tuples, horizon=horizon, **options))
+    else:
+        records = await loop.run_in_executor(get_thread_pool(), propagate(_simulate), app, timer, name, user_data,
+                                             rainfall_forecast_tuples, horizon, options)
+    if name == PERSISTED_CONTROLLER:
+        run_ids[name] = await timer.run_async("persist", persist_run_async, user_data, name, records, horizon, options)
+    return records
+
+
+async def run_simulation_request_async(data: dict, timings: dict | None = None) -> dict:
+    # Wariant dla serwera ASGI (app/asgi.py): pobranie prognozy i zapis do bazy to await, nie blokujący wątek.
+    # Wymaga kontekstu aplikacji Flask (logowanie, konfiguracja bazy).
+    timer = _StageTimer(timings)
+    user_data = parse_user_data(data)
+    controllers = parse_controllers(data)
+    horizon = parse_horizon(data)
+    app = current_app._get_current_object()
+
+    try:
+        rainfall_forecast_tuples = await timer.run_async(
+            "forecast", fetch_rainfall_forecast_async, user_data.location, days=horizon)
+        if not rainfall_forecast_tuples:
+            raise SimulationRequestError("Could not retrieve rainfall forecast data.", 500)
+
+        loop = asyncio.get_running_loop()
+        cache_key = _result_cache_key(data, user_data, controllers, horizon, rainfall_forecast_tuples)
+        if cache_key is not None:
+            started = time.perf_counter()
+            cached = result_cache.get_memory(cache_key)
+            if cached is None:
+                # Warstwa bazodanowa to zapytanie synchroniczne - poza pętlą zdarzeń
+                cached = (await loop.run_in_executor(get_thread_pool(), _with_app_context, app, result_cache.get,
+                                                     cache_key)
+                          if result_cache.db_tier else result_cache.get(cache_key))
+            timer.record("result_cache", started)
+            if cached is not None:
+                return cached
+
+        run_ids = {}
+        controller_results = await timer.run_async("controllers", asyncio.gather, *[
+            _run_controller_async(app, timer, name, user_data, rainfall_forecast_tuples, horizon,
+                                  controller_options(data, name), run_ids)
+            for name in controllers
+        ])
+        response = _response(dict(zip(controllers, controller_results)), run_ids)
+        if cache_key is not None:
+            if result_cache.db_tier:
+                await loop.run_in_executor(get_thread_pool(), _with_app_context, app, result_cache.put, cache_key,
+                                           response)
+            else:
+                result_cache.put(cache_key, response)
+        return response
+
+    except SimulationRequestError:
+        raise
+    except ConnectionError as e:
+        raise SimulationRequestError(f"External API connection error: {str(e)}", 503)
+    except ValueError as e:
+        raise SimulationRequestError(f"Data processing error: {str(e)}", 400)
+    except Exception as e:
+        raise SimulationRequestError(f"An internal server error occurred: {str(e)}", 500)
+
+
+def _stream_chunk_lines() -> int:
+    return int(os.getenv("SIMULATION_STREAM_CHUNK_LINES", 256))
+
+
+def stream_simulation_request(data: dict) -> Iterator[str]:
+    # POST /api/simulation/stream: symulacja na historycznej serii opadów ('rainfall'), zakresie archiwum
+    # ('archive') lub prognozie ('location'), wynik jako NDJSON - jedna linia na dzień i regulator. Walidacja, pobranie prognozy
+    # i utworzenie regulatorów odbywają się od razu (błąd to zwykła odpowiedź 4xx/5xx); same rekordy
+    # liczone są leniwie, więc pamięć nie rośnie z długością serii. Wyniki nie są zapisywane do bazy.
+    if "rainfall" in data:
+        # Przy historycznej serii opadów lokalizacja jest tylko etykietą
+        user_data = parse_user_data({"location": "historical", **data})
+        horizon = parse_horizon(data, default=None)
+        rainfall = parse_rainfall_series(data["rainfall"])
+    elif "archive" in data:
+        user_data = parse_user_data(data)
+        horizon = parse_horizon(data, default=None)
+        rainfall = archived_rainfall(data)
+    else:
+        user_data = parse_user_data(data)
+        horizon = parse_horizon(data)
+        rainfall = None
+    controllers = parse_controllers(data)
+
+    try:
+        if rainfall is None:
+            rainfall = fetch_rainfall_forecast(user_data.location, days=horizon)
+            if not rainfall:
+                raise SimulationRequestError("Could not retrieve rainfall forecast data.", 500)
+        streams = [iter_controller_simulation(name, user_data, rainfall, horizon, **controller_options(data, name))
+                   for name in controllers]
+    except SimulationRequestError:
+        raise
+    except ConnectionError as e:
+        raise SimulationRequestError(f"External API connection error: {str(e)}", 503)
+    except (TypeError, ValueError) as e:
+        raise SimulationRequestError(f"Data processing error: {str(e)}", 400)
+
+    return _ndjson_lines(controllers, streams, _stream_chunk_lines())
+
+
+def _ndjson_lines(controllers: list[str], streams: list[Iterator[dict]], chunk_lines: int) -> Iterator[str]:
+    # Regulatory idą krok w krok (zip), linie wysyłane paczkami po chunk_lines - w pamięci jest
+    # najwyżej jedna paczka. Błąd w trakcie strumienia (status 200 już wysłany) to ostatnia linia {"error": ...}.
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    chunk = []
+    try:
+        for daily_records in zip(*streams):
+            for name, record in zip(controllers, daily_records):
+                chunk.append(encode({"controller": name, **record}))
+            if len(chunk) >= chunk_lines:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+    except Exception as e:
+        current_app.logger.exception("Simulation stream failed")
+        chunk.append(encode({"error": f"An internal server error occurred: {str(e)}"}))
+    if chunk:
+        yield "\n".join(chunk) + "\n"
@@ -1,10 +1,9 @@
 import os
 import requests
 from datetime import datetime, date, timedelta
+from typing import Callable, Iterator
 from flask import current_app as app
-import numpy as np
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
+from app.api.tank_controllers import TankController, create_controller
 
 class UserData:
     def __init__(self, tank_capacity, min_water_level, daily_water_usage, rooftop_size, location,
@@ -29,155 +28,29 @@ class UserData:
 
 
 
-def run_water_simulation(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]]) -> list[dict]:
+def simulation_days(full_rainfall_forecast: list[tuple[date, float]], horizon: int | None) -> int:
+    # horizon=None - cała seria opadów; inaczej co najwyżej `horizon` pierwszych dni
+    return len(full_rainfall_forecast) if horizon is None else max(0, min(horizon, len(full_rainfall_forecast)))
 
-    tank_capacity = user_data.tank_capacity
-    min_water_level_config = user_data.min_water_level
-    daily_consumption = user_data.daily_water_usage
-    roof_surface = user_data.rooftop_size
-
-
-    max_water_level = tank_capacity * 0.95
-
-    simulation_results = []
-
-    current_water_level = user_data.initial_water_level if user_data.initial_water_level is not None else min_water_level_config
-    current_water_level = max(0, min(current_water_level, max_water_level))
-
-    num_simulation_days = min(30, len(full_rainfall_forecast))
-
-    # Parametry regulatora PI
-    Kp = 0.8  # Wzmocnienie proporcjonalne
-    Ki = 0.1  # Wzmocnienie całkujące
-    integral_error = 0.0 # Błąd całkujący
-
-    for day_index in range(num_simulation_days):
-        forecast_date, daily_rainfall_mm = full_rainfall_forecast[day_index]
-
-        pumped_up_for_reporting = 0.0
-        overflow_for_reporting = 0.0
-        water_consumed_today = daily_consumption
-
-        # 1. Zużycie wody
-        current_water_level -= water_consumed_today
-        current_water_level = max(0, current_water_level)
-
-        # 2. Zbieranie deszczówki
-        rainwater_collected_liters = daily_rainfall_mm * roof_surface
-        current_water_level += rainwater_collected_liters
-
-        # 3. Obsługa przepełnienia
-        if current_water_level > max_water_level:
-            overflow_amount = current_water_level - max_water_level
-            overflow_for_reporting += overflow_amount
-            current_water_level = max_water_level
-
-        # 4. Logika regulatora PI do pompowania wody
-        if current_water_level < min_water_level_config:
-            error = min_water_level_config - current_water_level # Uchyb regulacji
-            integral_error += error # Akumulacja błędu
-
-            # Ilość wody do napompowania wg regulatora PI
-            pi_controlled_pump_amount = Kp * error + Ki * integral_error
-            amount_to_attempt_pumping = max(0, pi_controlled_pump_amount)
-
-            # Rzeczywista ilość napompowanej wody, uwzględniając pojemność zbiornika
-            space_available_in_tank = max_water_level - current_water_level
-            actual_pumped_this_step = min(amount_to_attempt_pumping, space_available_in_tank)
-            actual_pumped_this_step = max(0, actual_pumped_this_step) 
-
-            current_water_level += actual_pumped_this_step
-            pumped_up_for_reporting = actual_pumped_this_step
-
-            # Anti-windup: Korekta błędu całkowania, jeśli nie można było napompować żądanej ilości
-            if amount_to_attempt_pumping > actual_pumped_this_step:
-                unfulfilled_pumping = amount_to_attempt_pumping - actual_pumped_this_step
-                integral_error -= unfulfilled_pumping 
-        else:
-            # Reset błędu całkowania, gdy poziom wody jest wystarczający
-            integral_error = 0.0
-        
-        current_water_level = min(current_water_level, max_water_level)
-
-        daily_result = {
-            "date": forecast_date,
-            "water_amount_eod": round(current_water_level, 2),
-            "rainfall_forecast_mm": round(daily_rainfall_mm, 2),
-            "daily_consumption": round(water_consumed_today, 2),
-            "saved_water_from_rain": round(rainwater_collected_liters, 2),
-            "pumped_up_municipal_water": round(pumped_up_for_reporting, 2),
-            "overflow_water_lost": round(overflow_for_reporting, 2),
-        }
-        simulation_results.append(daily_result)
-
-    return simulation_results
-
-
-
-def run_water_simulation_fuzzy(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]]) -> list[dict]:
 
+def iter_tank_simulation(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]],
+                         controller: TankController, horizon: int | None = None) -> Iterator[dict]:
+    # Wspólne jądro dynamiki zbiornika: zużycie, deszczówka, przelew, a potem regulator.
+    # Rekordy dzienne zwracane leniwie - stan to tylko poziom wody i regulator, więc wieloletnią
+    # serię można przesyłać strumieniowo bez budowania listy wyników.
     tank_capacity = user_data.tank_capacity
     min_water_level_config = user_data.min_water_level
     daily_consumption = user_data.daily_water_usage
     roof_surface = user_data.rooftop_size
 
-
     max_water_level = tank_capacity * 0.95
 
-    simulation_results = []
     current_water_level = user_data.initial_water_level if user_data.initial_water_level is not None else min_water_level_config
     current_water_level = max(0, min(current_water_level, max_water_level))
 
-    # Definicja zmiennych lingwistycznych (wejścia)
-    # Jak bardzo brakuje wody do poziomu minimalnego
-    uchyb_poziomu_wody = ctrl.Antecedent(np.arange(0, tank_capacity * 0.5, 1), 'uchyb_poziomu_wody')
-    # Prognozowana ilość opadów na dany dzień
-    prognoza_opadow = ctrl.Antecedent(np.arange(0, 51, 1), 'prognoza_opadow')
-
-    # Definicja zmiennej lingwistycznej (wyjście)
-    # Ile wody należy dopompować
-    ilosc_do_pompowania = ctrl.Consequent(np.arange(0, tank_capacity * 0.3, 1), 'ilosc_do_pompowania')
-
-    # Funkcje przynależności dla uchybu poziomu wody
-    uchyb_poziomu_wody['maly'] = fuzz.trimf(uchyb_poziomu_wody.universe, [0, 0, tank_capacity * 0.1])
-    uchyb_poziomu_wody['sredni'] = fuzz.trimf(uchyb_poziomu_wody.universe, [tank_capacity * 0.05, tank_capacity * 0.15, tank_capacity * 0.25])
-    uchyb_poziomu_wody['duzy'] = fuzz.trimf(uchyb_poziomu_wody.universe, [tank_capacity * 0.2, tank_capacity * 0.35, tank_capacity * 0.5])
-
-    # Funkcje przynależności dla prognozy opadów
-    prognoza_opadow['brak'] = fuzz.trimf(prognoza_opadow.universe, [0, 0, 5])
-    prognoza_opadow['maly'] = fuzz.trimf(prognoza_opadow.universe, [2, 10, 20])
-    prognoza_opadow['duzy'] = fuzz.trimf(prognoza_opadow.universe, [15, 25, 50])
-
-    # Funkcje przynależności dla ilości wody do pompowania
-    ilosc_do_pompowania['nic'] = fuzz.trimf(ilosc_do_pompowania.universe, [0, 0, tank_capacity * 0.01])
-    ilosc_do_pompowania['malo'] = fuzz.trimf(ilosc_do_pompowania.universe, [tank_capacity * 0.005, tank_capacity * 0.05, tank_capacity * 0.1])
-    ilosc_do_pompowania['duzo'] = fuzz.trimf(ilosc_do_pompowania.universe, [tank_capacity * 0.08, tank_capacity * 0.15, tank_capacity * 0.3])
-
-    # Definicja reguł rozmytych
-    # Jeśli brakuje dużo wody i nie ma prognozy opadów, pompuj dużo.
-    regula1 = ctrl.Rule(uchyb_poziomu_wody['duzy'] & prognoza_opadow['brak'], ilosc_do_pompowania['duzo'])
-    # Jeśli brakuje średnio wody i opady są małe, pompuj mało.
-    regula2 = ctrl.Rule(uchyb_poziomu_wody['sredni'] & prognoza_opadow['maly'], ilosc_do_pompowania['malo'])
-    # Jeśli brakuje mało wody, ale prognozowane są duże opady, nie pompuj.
-    regula3 = ctrl.Rule(uchyb_poziomu_wody['maly'] & prognoza_opadow['duzy'], ilosc_do_pompowania['nic'])
-    # Jeśli brakuje mało wody i nie ma opadów, pompuj mało.
-    regula4 = ctrl.Rule(uchyb_poziomu_wody['maly'] & prognoza_opadow['brak'], ilosc_do_pompowania['malo'])
-    # Jeśli brakuje średnio wody i nie ma opadów, pompuj dużo.
-    regula5 = ctrl.Rule(uchyb_poziomu_wody['sredni'] & prognoza_opadow['brak'], ilosc_do_pompowania['duzo'])
-    # Jeśli brakuje dużo wody, ale są małe opady, pompuj mało (bo coś spadnie).
-    regula6 = ctrl.Rule(uchyb_poziomu_wody['duzy'] & prognoza_opadow['maly'], ilosc_do_pompowania['malo'])
-
-
-    # Stworzenie systemu sterowania
-    system_sterowania = ctrl.ControlSystem([regula1, regula2, regula3, regula4, regula5, regula6])
-    symulacja_sterowania = ctrl.ControlSystemSimulation(system_sterowania)
-
-    num_simulation_days = min(30, len(full_rainfall_forecast))
-
-    for day_index in range(num_simulation_days):
+    for day_index in range(simulation_days(full_rainfall_forecast, horizon)):
         forecast_date, daily_rainfall_mm = full_rainfall_forecast[day_index]
 
-        pumped_up_for_reporting = 0.0
         overflow_for_reporting = 0.0
         water_consumed_today = daily_consumption
 
@@ -195,31 +68,21 @@ def run_water_simulation_fuzzy(user_data: UserData, full_rainfall_forecast: list
             overflow_for_reporting += overflow_amount
             current_water_level = max_water_level
 
-        # 4. Logika regulatora rozmytego do pompowania wody
-        if current_water_level < min_water_level_config:
-            error_poziomu = min_water_level_config - current_water_level
-            symulacja_sterowania.input['uchyb_poziomu_wody'] = error_poziomu
-            symulacja_sterowania.input['prognoza_opadow'] = daily_rainfall_mm
+        # 4. Regulator decyduje, ile wody dopompować
+        amount_to_attempt_pumping = controller.request_pumping(day_index, current_water_level, daily_rainfall_mm)
 
-            try:
-                symulacja_sterowania.compute()
-                fuzzy_controlled_pump_amount = symulacja_sterowania.output['ilosc_do_pompowania']
-            except Exception as e: # Proste obsłużenie błędu, gdyby reguły nie pokryły przypadku
-                app.logger.error(f"Błąd w obliczeniach regulatora rozmytego: {e}, uchyb: {error_poziomu}, opad: {daily_rainfall_mm}")
-                fuzzy_controlled_pump_amount = 0 # W razie błędu nie pompuj
+        # Rzeczywista ilość napompowanej wody, uwzględniając pojemność zbiornika
+        space_available_in_tank = max_water_level - current_water_level
+        actual_pumped_this_step = min(amount_to_attempt_pumping, space_available_in_tank)
+        actual_pumped_this_step = max(0, actual_pumped_this_step)
 
-            amount_to_attempt_pumping = max(0, fuzzy_controlled_pump_amount)
+        current_water_level += actual_pumped_this_step
+        pumped_up_for_reporting = actual_pumped_this_step
+        controller.pumping_applied(amount_to_attempt_pumping, actual_pumped_this_step)
 
-            space_available_in_tank = max_water_level - current_water_level
-            actual_pumped_this_step = min(amount_to_attempt_pumping, space_available_in_tank)
-            actual_pumped_this_step = max(0, actual_pumped_this_step)
-
-            current_water_level += actual_pumped_this_step
-            pumped_up_for_reporting = actual_pumped_this_step
-        
         current_water_level = min(current_water_level, max_water_level)
 
-        daily_result = {
+        yield {
             "date": forecast_date.isoformat() if isinstance(forecast_date, date) else str(forecast_date),
             "water_amount": round(current_water_level, 2),
             "rainfall_amount": round(daily_rainfall_mm, 2),
@@ -228,6 +91,41 @@ def run_water_simulation_fuzzy(user_data: UserData, full_rainfall_forecast: list
             "pumped_up_water": round(pumped_up_for_reporting, 2),
             "pumped_out_water": round(overflow_for_reporting, 2),
         }
+
+
+def simulate_tank(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]],
+                  controller: TankController, horizon: int | None = 30,
+                  progress: Callable[[int, int], None] | None = None) -> list[dict]:
+    # progress(dzień, dni) wołane po każdym dniu, może przerwać symulację wyjątkiem (anulowanie zadania)
+    num_simulation_days = simulation_days(full_rainfall_forecast, horizon)
+    simulation_results = []
+    for daily_result in iter_tank_simulation(user_data, full_rainfall_forecast, controller, horizon):
         simulation_results.append(daily_result)
+        if progress is not None:
+            progress(len(simulation_results), num_simulation_days)
+    return simulation_results
+
+
+def iter_controller_simulation(controller_name: str, user_data: UserData,
+                               full_rainfall_forecast: list[tuple[date, float]], horizon: int | None = None,
+                               **options) -> Iterator[dict]:
+    controller = create_controller(controller_name, user_data, full_rainfall_forecast, **options)
+    return iter_tank_simulation(user_data, full_rainfall_forecast, controller, horizon)
+
+
+def run_controller_simulation(controller_name: str, user_data: UserData,
+                              full_rainfall_forecast: list[tuple[date, float]], horizon: int | None = 30,
+                              progress: Callable[[int, int], None] | None = None, **options) -> list[dict]:
+    controller = create_controller(controller_name, user_data, full_rainfall_forecast, **options)
+    return simulate_tank(user_data, full_rainfall_forecast, controller, horizon=horizon, progress=progress)
+
+
+def run_water_simulation(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]],
+                         horizon: int | None = 30) -> list[dict]:
+    return run_controller_simulation("pi", user_data, full_rainfall_forecast, horizon=horizon)
+
 
-    return simulation_results
\ No newline at end of file
+def run_water_simulation_fuzzy(user_data: UserData, full_rainfall_forecast: list[tuple[date, float]],
+                               fuzzy_mode: str | None = None, horizon: int | None = 30) -> list[dict]:
+    return run_controller_simulation("fuzzy", user_data, full_rainfall_forecast, horizon=horizon,
+                                     fuzzy_mode=fuzzy_mode)
@@ -0,0 +1,169 @@
+import os
+from datetime import date
+
+import numpy as np
+
+from app.api.batch_simulation_service import BatchScenarios, run_water_simulation_batch
+from app.api.executors import get_process_pool, process_pool_workers
+from app.api.simulation_service import UserData, run_water_simulation_fuzzy
+
+SWEEP_PARAMETERS = ("tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size")
+RANKING_KEYS = ("pumped_up_water", "pumped_out_water")
+
+
+def _max_sweep_points() -> int:
+    return int(os.getenv("SWEEP_MAX_POINTS", 20000))
+
+
+def parse_sweep_range(name: str, spec) -> np.ndarray:
+    # Liczba, lista wartości albo {"start": .., "stop": .., "step": ..} (stop włącznie)
+    if isinstance(spec, (int, float)):
+        return np.array([float(spec)])
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f"Range for '{name}' must not be empty.")
+        return np.array([float(v) for v in spec])
+    if isinstance(spec, dict):
+        try:
+            start = float(spec["start"])
+            stop = float(spec["stop"])
+            step = float(spec.get("step", 1))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid range for '{name}': {e}")
+        if step <= 0 or stop < start:
+            raise ValueError(f"Invalid range for '{name}': expected start <= stop and step > 0.")
+        # Mały margines, żeby wartość stop nie wypadła przez błąd zaokrąglenia
+        return np.arange(start, stop + step * 1e-9, step)
+    raise ValueError(f"Range for '{name}' must be a number, a list or an object with start/stop/step.")
+
+
+def build_sweep_grid(data: dict) -> BatchScenarios:
+    axes = [parse_sweep_range(name, data[name]) for name in SWEEP_PARAMETERS]
+    points = int(np.prod([len(axis) for axis in axes]))
+    if points > _max_sweep_points():
+        raise ValueError(f"Sweep has {points} points, the limit is {_max_sweep_points()}.")
+
+    grid = [axis.ravel() for axis in np.meshgrid(*axes, indexing="ij")]
+    tank_capacity, min_water_level, daily_water_usage, rooftop_size = grid
+
+    # Poziom minimalny ponad pojemność zbiornika nie ma sensu fizycznego
+    valid = min_water_level <= tank_capacity
+    if not valid.any():
+        raise ValueError("No valid sweep points: min_water_level exceeds tank_capacity everywhere.")
+
+    # Sortowanie po pojemności - każdy proces buduje regulator rozmyty dla niewielu zbiorników
+    order = np.argsort(tank_capacity[valid], kind="stable")
+    return BatchScenarios(
+        tank_capacity=tank_capacity[valid][order],
+        min_water_level=min_water_level[valid][order],
+        daily_water_usage=daily_water_usage[valid][order],
+        rooftop_size=rooftop_size[valid][order],
+    )
+
+
+def _fuzzy_totals_chunk(parameters: list[tuple[float, float, float, float]],
+                        forecast: list[tuple[date, float]], fuzzy_mode: str) -> list[tuple[float, float, float, float]]:
+    # Sumy z rekordów zaokrąglonych do 0.01 (jak w odpowiedzi /api/simulation); PI sumowany tak samo
+    totals = []
+    for tank_capacity, min_water_level, daily_water_usage, rooftop_size in parameters:
+        user_data = UserData(tank_capacity, min_water_level, daily_water_usage, rooftop_size, location="sweep")
+        records = run_water_simulation_fuzzy(user_data, forecast, fuzzy_mode=fuzzy_mode, horizon=None)
+        totals.append((
+            sum(r["pumped_up_water"] for r in records),
+            sum(r["pumped_out_water"] for r in records),
+            sum(r["saved_water"] for r in records),
+            records[-1]["water_amount"] if records else 0.0,
+        ))
+    return totals
+
+
+def _pi_totals(scenarios: BatchScenarios, rainfall: list[float]) -> np.ndarray:
+    # Wartości dzienne zaokrąglane przed sumowaniem - ta sama podstawa co sumy regulatora rozmytego,
+    # więc rankingi obu regulatorów są porównywalne
+    results = run_water_simulation_batch(scenarios, rainfall)
+    daily = {name: np.round(results[name], 2) for name in ("pumped_up_water", "pumped_out_water", "saved_water")}
+    return np.column_stack([
+        daily["pumped_up_water"].sum(axis=1),
+        daily["pumped_out_water"].sum(axis=1),
+        daily["saved_water"].sum(axis=1),
+        np.round(results["water_amount"][:, -1], 2),
+    ])
+
+
+def _run_fuzzy_sweep(scenarios: BatchScenarios, forecast: list[tuple[date, float]], fuzzy_mode: str) -> np.ndarray:
+    parameters = list(zip(scenarios.tank_capacity.tolist(), scenarios.min_water_level.tolist(),
+                          scenarios.daily_water_usage.tolist(), scenarios.rooftop_size.tolist()))
+    workers = process_pool_workers()
+    if workers <= 1 or len(parameters) < 2:
+        return np.array(_fuzzy_totals_chunk(parameters, forecast, fuzzy_mode)).reshape(-1, 4)
+
+    chunk_size = max(1, -(-len(parameters) // (workers * 4)))
+    chunks = [parameters[i:i + chunk_size] for i in range(0, len(parameters), chunk_size)]
+    executor = get_process_pool()
+    futures = [executor.submit(_fuzzy_totals_chunk, chunk, forecast, fuzzy_mode) for chunk in chunks]
+    totals = []
+    for future in futures:
+        totals.extend(future.result())
+    return np.array(totals).reshape(-1, 4)
+
+
+def parse_sweep_limit(value) -> int:
+    # Długość rankingu: liczba całkowita >= 1 (ujemna wartość w [:limit] po cichu ucinałaby koniec listy)
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("'limit' must be a positive integer.")
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("'limit' must be a positive integer.")
+    if limit < 1:
+        raise ValueError("'limit' must be a positive integer.")
+    return limit
+
+
+def parse_rank_by(value) -> str:
+    if value not in RANKING_KEYS:
+        raise ValueError(f"Unknown rank_by '{value}', expected one of: {', '.join(RANKING_KEYS)}")
+    return value
+
+
+def _ranking(scenarios: BatchScenarios, totals: np.ndarray, rank_by: str, limit: int) -> list[dict]:
+    pumped_up, pumped_out, saved, final_level = totals.T
+    # Sortowanie leksykograficzne: najpierw wybrane kryterium, potem drugie jako rozstrzygające
+    primary, secondary = (pumped_up, pumped_out) if rank_by == "pumped_up_water" else (pumped_out, pumped_up)
+    order = np.lexsort((secondary, primary))[:limit]
+    return [
+        {
+            "rank": rank + 1,
+            "tank_capacity": float(scenarios.tank_capacity[i]),
+            "min_water_level": float(scenarios.min_water_level[i]),
+            "daily_water_usage": float(scenarios.daily_water_usage[i]),
+            "rooftop_size": float(scenarios.rooftop_size[i]),
+            "total_pumped_up_water": round(float(pumped_up[i]), 2),
+            "total_pumped_out_water": round(float(pumped_out[i]), 2),
+            "total_saved_water": round(float(saved[i]), 2),
+            "final_water_amount": round(float(final_level[i]), 2),
+        }
+        for rank, i in enumerate(order.tolist())
+    ]
+
+
+def run_parameter_sweep(scenarios: BatchScenarios, forecast: list[tuple[date, float]], horizon: int,
+                        rank_by: str = "pumped_up_water", limit: int = 20,
+                        fuzzy_mode: str = "surface") -> dict:
+    # rank_by i limit sprawdzone wcześniej (parse_rank_by, parse_sweep_limit) - przed pobraniem prognozy
+    forecast = forecast[:horizon]
+    rainfall = [rainfall_mm for _, rainfall_mm in forecast]
+
+    # PI - cała siatka naraz silnikiem wektorowym
+    pi_totals = _pi_totals(scenarios, rainfall)
+
+    # Rozmyty - punkt po punkcie, rozłożony na pulę procesów
+    fuzzy_totals = _run_fuzzy_sweep(scenarios, forecast, fuzzy_mode)
+
+    return {
+        "points": len(scenarios),
+        "forecast_days": len(forecast),
+        "rank_by": rank_by,
+        "pi_controller_ranking": _ranking(scenarios, pi_totals, rank_by, limit),
+        "fuzzy_controller_ranking": _ranking(scenarios, fuzzy_totals, rank_by, limit),
+    }
@@ -0,0 +1,197 @@
+import os
+from abc import ABC, abstractmethod
+from datetime import date
+
+from flask import current_app as app
+
+from app.api.fuzzy_controller_registry import default_resolution, get_fuzzy_controller
+
+FUZZY_MODES = ("exact", "surface")
+
+_CONTROLLERS: dict[str, type["TankController"]] = {}
+
+
+def register_controller(name: str):
+    # Dekorator rejestrujący regulator pod nazwą używaną w żądaniu ("controllers": [...])
+    def decorator(cls):
+        if name in _CONTROLLERS:
+            raise ValueError(f"Controller '{name}' is already registered.")
+        cls.name = name
+        _CONTROLLERS[name] = cls
+        return cls
+    return decorator
+
+
+def available_controllers() -> list[str]:
+    return list(_CONTROLLERS)
+
+
+def is_cpu_bound(name: str) -> bool:
+    return _CONTROLLERS[name].cpu_bound
+
+
+def effective_options(name: str, options: dict) -> dict:
+    # Opcje regulatora z rozwiązanymi wartościami domyślnymi (FUZZY_MODE, MPC_HORIZON, ...) - klucz cache
+    # wyników musi się zmienić, gdy zmienia się domyślne zachowanie, a nie tylko treść żądania
+    controller_class = _CONTROLLERS.get(name)
+    if controller_class is None:
+        raise ValueError(f"Unknown controller '{name}', expected one of: {', '.join(_CONTROLLERS)}")
+    return controller_class.effective_options(options)
+
+
+def create_controller(name: str, user_data, full_rainfall_forecast: list[tuple[date, float]],
+                      **options) -> "TankController":
+    controller_class = _CONTROLLERS.get(name)
+    if controller_class is None:
+        raise ValueError(f"Unknown controller '{name}', expected one of: {', '.join(_CONTROLLERS)}")
+    return controller_class(user_data, full_rainfall_forecast, **options)
+
+
+class TankController(ABC):
+    # Interfejs regulatora dla wspólnego jądra symulacji (simulate_tank).
+    # request_pumping wołane jest codziennie po zużyciu, deszczu i przelewie; jądro
+    # przycina żądanie do wolnego miejsca i zgłasza wynik przez pumping_applied.
+    # Brak request_pumping w podklasie to błąd przy tworzeniu regulatora, nie w trakcie symulacji.
+    name = None
+    cpu_bound = False  # True - w trybie SIMULATION_EXECUTOR=process regulator liczy się w osobnym procesie
+
+    def __init__(self, user_data, full_rainfall_forecast: list[tuple[date, float]], **options):
+        self.user_data = user_data
+        self.forecast = full_rainfall_forecast
+        self.min_water_level = user_data.min_water_level
+        self.max_water_level = user_data.tank_capacity * 0.95
+
+    @classmethod
+    def effective_options(cls, options: dict) -> dict:
+        return {key: value for key, value in options.items() if value is not None}
+
+    @abstractmethod
+    def request_pumping(self, day_index: int, current_water_level: float, daily_rainfall_mm: float) -> float:
+        ...
+
+    def pumping_applied(self, requested: float, actual: float):
+        pass
+
+
+@register_controller("pi")
+class PIController(TankController):
+    # Parametry regulatora PI
+    Kp = 0.8  # Wzmocnienie proporcjonalne
+    Ki = 0.1  # Wzmocnienie całkujące
+
+    def __init__(self, user_data, full_rainfall_forecast, **options):
+        super().__init__(user_data, full_rainfall_forecast)
+        self.integral_error = 0.0  # Błąd całkujący
+
+    def request_pumping(self, day_index, current_water_level, daily_rainfall_mm):
+        if current_water_level >= self.min_water_level:
+            # Reset błędu całkowania, gdy poziom wody jest wystarczający
+            self.integral_error = 0.0
+            return 0.0
+
+        error = self.min_water_level - current_water_level  # Uchyb regulacji
+        self.integral_error += error  # Akumulacja błędu
+        # Ilość wody do napompowania wg regulatora PI
+        pi_controlled_pump_amount = self.Kp * error + self.Ki * self.integral_error
+        return max(0, pi_controlled_pump_amount)
+
+    def pumping_applied(self, requested, actual):
+        # Anti-windup: Korekta błędu całkowania, jeśli nie można było napompować żądanej ilości
+        if requested > actual:
+            self.integral_error -= requested - actual
+
+
+@register_controller("fuzzy")
+class FuzzyTankController(TankController):
+    cpu_bound = True
+
+    def __init__(self, user_data, full_rainfall_forecast, fuzzy_mode: str | None = None, **options):
+        super().__init__(user_data, full_rainfall_forecast)
+        # "exact" - pełne wnioskowanie co dzień, "surface" - interpolacja z prekomputowanej tablicy
+        fuzzy_mode = _fuzzy_mode(fuzzy_mode)
+        if fuzzy_mode not in FUZZY_MODES:
+            raise ValueError(f"Unknown fuzzy_mode '{fuzzy_mode}', expected one of: {', '.join(FUZZY_MODES)}")
+        # Regulator rozmyty budowany raz na pojemność zbiornika i współdzielony między żądaniami
+        regulator_rozmyty = get_fuzzy_controller(user_data.tank_capacity)
+        self._compute = regulator_rozmyty.compute_fast if fuzzy_mode == "surface" else regulator_rozmyty.compute
+
+    @classmethod
+    def effective_options(cls, options):
+        return {**super().effective_options(options), "fuzzy_mode": _fuzzy_mode(options.get("fuzzy_mode")),
+                "resolution": default_resolution()}
+
+    def request_pumping(self, day_index, current_water_level, daily_rainfall_mm):
+        if current_water_level >= self.min_water_level:
+            return 0.0
+
+        error_poziomu = self.min_water_level - current_water_level
+        try:
+            fuzzy_controlled_pump_amount = self._compute(error_poziomu, daily_rainfall_mm)
+        except Exception as e:  # Proste obsłużenie błędu, gdyby reguły nie pokryły przypadku
+            app.logger.error(f"Błąd w obliczeniach regulatora rozmytego: {e}, uchyb: {error_poziomu}, opad: {daily_rainfall_mm}")
+            fuzzy_controlled_pump_amount = 0  # W razie błędu nie pompuj
+        return max(0, fuzzy_controlled_pump_amount)
+
+
+@register_controller("bang_bang")
+class BangBangController(TankController):
+    # Regulator dwustanowy z histerezą: poniżej minimum dopompowuje do minimum + pasmo
+    def __init__(self, user_data, full_rainfall_forecast, **options):
+        super().__init__(user_data, full_rainfall_forecast)
+        band = _bang_bang_band(options.get("band"))
+        self.target_level = min(self.min_water_level + band * user_data.tank_capacity, self.max_water_level)
+
+    @classmethod
+    def effective_options(cls, options):
+        return {**super().effective_options(options), "band": _bang_bang_band(options.get("band"))}
+
+    def request_pumping(self, day_index, current_water_level, daily_rainfall_mm):
+        if current_water_level >= self.min_water_level:
+            return 0.0
+        return max(0.0, self.target_level - current_water_level)
+
+
+@register_controller("mpc")
+class PredictiveController(TankController):
+    # Prosty regulator predykcyjny (receding horizon): na podstawie prognozy opadów i zużycia
+    # przewiduje poziom na `lookahead_days` dni naprzód bez pompowania i dopompowuje dziś tylko tyle,
+    # ile potrzeba, by w całym horyzoncie predykcji nie spaść poniżej minimum.
+    # "horizon" żądania to długość symulacji, dlatego opcja regulatora ma osobną nazwę.
+    def __init__(self, user_data, full_rainfall_forecast, lookahead_days: int | None = None, **options):
+        super().__init__(user_data, full_rainfall_forecast)
+        if "horizon" in options:
+            raise ValueError("MPC option 'horizon' was renamed to 'lookahead_days'.")
+        lookahead_days = _lookahead_days(lookahead_days)
+        if isinstance(lookahead_days, bool) or not isinstance(lookahead_days, int) or lookahead_days < 1:
+            raise ValueError("'lookahead_days' must be a positive integer.")
+        self.lookahead_days = lookahead_days
+        self.daily_consumption = user_data.daily_water_usage
+        self.roof_surface = user_data.rooftop_size
+
+    @classmethod
+    def effective_options(cls, options):
+        return {**super().effective_options(options), "lookahead_days": _lookahead_days(options.get("lookahead_days"))}
+
+    def request_pumping(self, day_index, current_water_level, daily_rainfall_mm):
+        predicted_level = current_water_level
+        required = self.min_water_level - current_water_level
+        for future_index in range(day_index + 1, min(day_index + 1 + self.lookahead_days, len(self.forecast))):
+            future_rainfall_mm = self.forecast[future_index][1]
+            predicted_level = max(0, predicted_level - self.daily_consumption)
+            predicted_level = min(predicted_level + future_rainfall_mm * self.roof_surface, self.max_water_level)
+            required = max(required, self.min_water_level - predicted_level)
+        return max(0.0, required)
+
+
+# Wartości domyślne opcji - wspólne dla konstruktorów i effective_options
+
+def _fuzzy_mode(fuzzy_mode: str | None) -> str:
+    return fuzzy_mode or os.getenv("FUZZY_MODE", "exact")
+
+
+def _bang_bang_band(band) -> float:
+    return float(os.getenv("BANG_BANG_BAND", 0.1) if band is None else band)
+
+
+def _lookahead_days(lookahead_days):
+    return int(os.getenv("MPC_HORIZON", 3)) if lookahead_days is None else lookahead_days
@@ -1,11 +1,81 @@
+import asyncio
 import os
+import aiohttp
 import requests
 from datetime import datetime, date, timedelta
 from flask import current_app as app
+from app.api.forecast_cache import forecast_cache
+from app.api.http_session import async_http_get, http_get
 
 
+def fetch_rainfall_forecast(location: str, days: int = 30, use_cache: bool = True) -> list[tuple[date, float]]:
+    if not use_cache:
+        return _fetch_rainfall_forecast_uncached(location, days)
 
-def fetch_rainfall_forecast(location: str, days: int = 30) -> list[tuple[date, float]]:
+    # Prognoza zmienia się rzadko - jedno zapytanie do API na miasto w oknie TTL. Dostawca zawsze zwraca
+    # całe swoje okno, więc w cache jest pełna prognoza, a żądania o różny horyzont dostają jej początek
+    rainfall_data = forecast_cache.get_or_fetch(_cache_key(location),
+                                                lambda: _fetch_rainfall_forecast_uncached(location, None))
+    return _forecast_window(rainfall_data, location, days)
+
+
+async def fetch_rainfall_forecast_async(location: str, days: int = 30,
+                                        use_cache: bool = True) -> list[tuple[date, float]]:
+    # Wersja dla pętli asyncio: oczekiwanie na dostawcę nie blokuje wątku
+    if not use_cache:
+        return await _fetch_rainfall_forecast_uncached_async(location, days)
+
+    rainfall_data = await forecast_cache.get_or_fetch_async(
+        _cache_key(location), lambda: _fetch_rainfall_forecast_uncached_async(location, None))
+    return _forecast_window(rainfall_data, location, days)
+
+
+def _cache_key(location: str) -> tuple:
+    return (location.strip().casefold(),)
+
+
+def _forecast_window(rainfall_data: list[tuple[date, float]], location: str, days: int) -> list[tuple[date, float]]:
+    if len(rainfall_data) < days:
+        app.logger.warning(
+            f"Weather API returned only {len(rainfall_data)} days of forecast for {location}, requested {days}.")
+    return list(rainfall_data[:days])
+
+
+def _fetch_rainfall_forecast_uncached(location: str, days: int | None = 30) -> list[tuple[date, float]]:
+    full_url = _forecast_url(location)
+
+    try:
+        response = http_get(full_url)
+        response.raise_for_status()
+        api_data = response.json()
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error fetching weather data for {location}: {e}")
+        raise ConnectionError(f"Could not fetch weather data: {e}")
+    except ValueError as e:
+        app.logger.error(f"Error decoding weather API JSON response: {e}")
+        raise ValueError(f"Invalid JSON response from weather API: {e}")
+
+    return _parse_rainfall_forecast(api_data, location, days)
+
+
+async def _fetch_rainfall_forecast_uncached_async(location: str, days: int | None = 30) -> list[tuple[date, float]]:
+    full_url = _forecast_url(location)
+
+    try:
+        response = await async_http_get(full_url)
+        response.raise_for_status()
+        api_data = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, requests.exceptions.RequestException) as e:  # CircuitOpenError to wyjątek requests
+        app.logger.error(f"Error fetching weather data for {location}: {e}")
+        raise ConnectionError(f"Could not fetch weather data: {e}")
+    except ValueError as e:
+        app.logger.error(f"Error decoding weather API JSON response: {e}")
+        raise ValueError(f"Invalid JSON response from weather API: {e}")
+
+    return _parse_rainfall_forecast(api_data, location, days)
+
+
+def _forecast_url(location: str) -> str:
     base_url = os.getenv("API_BASE_URL")
     api_suffix_key = os.getenv(
         "API_SUFFIX")
@@ -28,24 +98,17 @@ def fetch_rainfall_forecast(location: str, days: int = 30) -> list[tuple[date, f
     full_url = f"{api_base_url_env}{location}{api_suffix_env}"
 
     app.logger.info(f"Fetching weather data from: {full_url}")
+    return full_url
 
-    try:
-        response = requests.get(full_url, timeout=15)
-        response.raise_for_status()
-        api_data = response.json()
-    except requests.exceptions.RequestException as e:
-        app.logger.error(f"Error fetching weather data for {location}: {e}")
-        raise ConnectionError(f"Could not fetch weather data: {e}")
-    except ValueError as e:
-        app.logger.error(f"Error decoding weather API JSON response: {e}")
-        raise ValueError(f"Invalid JSON response from weather API: {e}")
 
+def _parse_rainfall_forecast(api_data: dict, location: str, days: int | None) -> list[tuple[date, float]]:
+    # days=None - całe okno dostawcy (wpis cache)
     rainfall_data = []
     if 'days' not in api_data or not isinstance(api_data['days'], list):
         app.logger.error(f"Unexpected API response structure for {location}. 'days' array missing or not a list.")
         raise ValueError("Weather API response format error: 'days' field is missing or invalid.")
 
-    num_forecast_days = min(days, len(api_data['days']))
+    num_forecast_days = len(api_data['days']) if days is None else min(days, len(api_data['days']))
 
     for i in range(num_forecast_days):
         day_data = api_data['days'][i]
@@ -66,7 +129,7 @@ def fetch_rainfall_forecast(location: str, days: int = 30) -> list[tuple[date, f
         except ValueError as e:
             app.logger.warning(f"Data type error for day data {location} on index {i}: {e}. Using default.")
 
-    if len(rainfall_data) < days:
+    if days is not None and len(rainfall_data) < days:
         app.logger.warning(
             f"Weather API returned only {len(rainfall_data)} days of forecast for {location}, requested {days}.")
 
@@ -0,0 +1,120 @@
+# app/asgi.py
+# Serwer ASGI: POST /api/simulation obsługiwany w pętli asyncio (prognoza i zapis do bazy nie trzymają
+# wątku), wszystkie pozostałe ścieżki (Dash, reszta API) przez adapter WSGI -> ASGI.
+# APP_MODE=api - bez interfejsu Dash (samo API), np. osobne, skalowane poziomo procesy API.
+#
+#   uvicorn app.asgi:app --host 0.0.0.0 --port 5000
+# STARTUP_PREWARM czeka na port z PORT (domyślnie 5000) - przy innym --port ustaw też PORT.
+import os
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app.init_db import app_mode, create_app, create_dash_app
+from app.api.async_database import dispose_async_engine
+from app.api.executors import shutdown_executors
+from app.api.http_session import close_async_client
+from app.api import metrics, profiling
+from app.api.simulation_request_service import SimulationRequestError, run_simulation_request_async
+from app.startup import start_prewarm
+
+ASYNC_ROUTES = {("POST", "/api/simulation")}
+
+
+class SimulationASGIApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http" and (scope["method"], scope["path"]) in ASYNC_ROUTES:
+            await self._simulation(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # uvicorn otwiera port dopiero po starcie lifespan - prewarm w tle czeka na niego
+                start_prewarm(int(os.getenv("PORT", 5000)), dash=app_mode() == "full")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # Klient HTTP i silnik bazy są związane z pętlą - zamykamy je razem z nią
+                await close_async_client()
+                await dispose_async_engine()
+                shutdown_executors()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _simulation(self, scope, receive, send):
+        # Odpowiednik handle_simulation_request z app/controllers/routes.py (razem z metrykami HTTP)
+        started = time.perf_counter()
+        metrics.HTTP_IN_FLIGHT.inc(scope["path"])
+        # Profil wątku pętli obejmuje też współbieżne żądania; obliczenia w puli wątków - tylko tego żądania
+        profile_token = dict(scope["headers"]).get(profiling.PROFILE_HEADER.lower().encode())
+        profile = profiling.start_request(scope["method"], scope["path"],
+                                          profile_token.decode("latin-1") if profile_token else None)
+        status_code = 500
+        try:
+            status_code = await self._handle_simulation(scope, receive, send, started)
+        finally:
+            if profile is not None:
+                profiling.finish_request(profile, status_code)
+            metrics.HTTP_IN_FLIGHT.dec(scope["path"])
+            metrics.HTTP_DURATION.observe(time.perf_counter() - started, scope["method"], scope["path"])
+            metrics.HTTP_REQUESTS.inc(scope["method"], scope["path"], str(status_code))
+
+    async def _handle_simulation(self, scope, receive, send, started: float) -> int:
+        timings = {}
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"").split(b";")[0].strip().decode("latin-1")
+        body = await self._read_body(receive)
+
+        if not (content_type == "application/json" or content_type.endswith("+json")):
+            response_data, status_code = {"error": "Request must be JSON"}, 400
+        else:
+            with self.flask_app.app_context():
+                try:
+                    data = self.flask_app.json.loads(body)
+                    if not isinstance(data, dict):
+                        raise ValueError("JSON body must be an object")
+                except ValueError:
+                    response_data, status_code = {"error": "Request must be JSON"}, 400
+                else:
+                    try:
+                        response_data = await run_simulation_request_async(data, timings=timings)
+                        status_code = 200
+                    except SimulationRequestError as e:
+                        response_data, status_code = {"error": e.message}, e.status_code
+        timings["total"] = (time.perf_counter() - started) * 1000
+
+        payload = self.flask_app.json.dumps(response_data, separators=(",", ":")).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode("latin-1")),
+                (b"server-timing", ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
+        return status_code
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+
+app = SimulationASGIApp(create_app() if app_mode() == "api" else create_dash_app().server)
@@ -1,6 +1,7 @@
-import requests
-
 def fetch_simulation_data(location, tank_capacity, min_water_level, daily_use, roof_area):
+    # Import wewnątrz funkcji - app.init_db importuje callbacki, zanim utworzy db
+    from app.api.simulation_request_service import SimulationRequestError, run_simulation_request
+
     payload = {
         "tank_capacity": tank_capacity,
         "min_water_level": min_water_level,
@@ -8,7 +9,8 @@ def fetch_simulation_data(location, tank_capacity, min_water_level, daily_use, r
         "rooftop_size": roof_area,
         "location": location,
     }
-    response = requests.post("http://localhost:5000/api/simulation", json=payload)
-    if response.status_code != 200:
-        raise Exception("Błąd API: {}".format(response.text))
-    return response.json()
+    # Symulacja w tym samym procesie - bez zapytania HTTP do własnego /api/simulation
+    try:
+        return run_simulation_request(payload)
+    except SimulationRequestError as e:
+        raise Exception("Błąd API: {}".format(e.message))
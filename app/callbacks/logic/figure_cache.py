@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from app.api.metrics import register_collector, stats_families
+
+CONTROLLERS = ("pi", "fuzzy")
+STATIC_TITLES = {
+    "pi": "Poziom wody (Regulator PI)",
+    "fuzzy": "Poziom wody (Regulator rozmyty)",
+}
+# Nazwy funkcji z app.callbacks.logic.charts - moduł (pandas, plotly) importowany przy pierwszym wykresie
+COMPARISON_FIGURES = {
+    "subplots": "generate_comparison_subplots",
+    "average": "generate_average_comparison",
+    "percentage": "generate_percentage_comparison",
+    "difference": "generate_difference_chart",
+}
+
+
+def result_digest(results: dict) -> str:
+    # Skrót samych wyników regulatorów - identyfikatory zapisanych przebiegów są inne przy każdym
+    # uruchomieniu, a wykresy od nich nie zależą
+    payload = {f"{name}_controller_results": results.get(f"{name}_controller_results") for name in CONTROLLERS}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class SimulationFigures:
+    # Ramki i wykresy jednego wyniku symulacji. Ramki powstają przy pierwszym użyciu regulatora,
+    # wykresy przy pierwszym żądaniu danego trybu; trzymane jako słowniki JSON Plotly, więc
+    # kolejne wywołania callbacków nie budują ani nie serializują figur od nowa.
+    def __init__(self, results: dict, digest: str):
+        self.digest = digest
+        self._results = results
+        self._frames = {}
+        self._figures = {}
+        self._lock = threading.Lock()
+        # Budowa figur po jednej - przełączenie trybu w trakcie prewarm czeka na gotową figurę
+        # zamiast budować ją drugi raz
+        self._build_lock = threading.Lock()
+
+    def frames(self, controller: str):
+        with self._lock:
+            frames = self._frames.get(controller)
+            if frames is None:
+                from app.callbacks.logic.process_simulation_data import simulation_frames
+                frames = self._frames[controller] = simulation_frames(
+                    self._results.get(f"{controller}_controller_results"))
+            return frames
+
+    def _figure(self, key, build):
+        figure = self._figures.get(key)
+        if figure is None:
+            with self._build_lock:
+                figure = self._figures.get(key)
+                if figure is None:
+                    figure = self._figures[key] = build().to_plotly_json()
+        return figure
+
+    def chart(self, controller: str, chart_mode: str = "static") -> dict:
+        mode = "animated" if chart_mode == "animated" else "static"
+
+        def build():
+            from app.callbacks.logic import charts
+            df, long_frames = self.frames(controller)
+            if mode == "animated":
+                return charts.generate_animation_chart(df, long_frames["animated"])
+            return charts.generate_static_chart(long_frames["static"], STATIC_TITLES[controller])
+        return self._figure((controller, mode), build)
+
+    def comparison(self, name: str) -> dict:
+        # Porównania zawsze na ramkach statycznych (jak wcześniej w run_simulation)
+        def build():
+            from app.callbacks.logic import charts
+            generate = getattr(charts, COMPARISON_FIGURES[name])
+            return generate(self.frames("pi")[1]["static"], self.frames("fuzzy")[1]["static"])
+        return self._figure(("comparison", name), build)
+
+    def prewarm(self):
+        # Wykresy animowane (klatka na każdy dzień) są najdroższe - budowane w tle po symulacji,
+        # żeby pierwsze przełączenie trybu też było natychmiastowe
+        for controller in CONTROLLERS:
+            self.chart(controller, "animated")
+
+
+class FigureCache:
+    # LRU obiektów SimulationFigures po skrócie wyniku (result_digest) i osobne, dłuższe LRU samych
+    # wyników - wynik jest wielokrotnie mniejszy od figur, więc po wypadnięciu figur lookup odbudowuje
+    # je z zachowanego wyniku zamiast ponownej symulacji
+    def __init__(self, max_entries: int, max_results: int | None = None):
+        self.max_entries = max(1, max_entries)
+        self.max_results = max(self.max_entries, max_results or 0)
+        self._entries: "OrderedDict[str, SimulationFigures]" = OrderedDict()
+        self._results: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "rebuilds": 0}
+
+    def get(self, results: dict, digest: str | None = None) -> SimulationFigures:
+        digest = digest or result_digest(results)
+        with self._lock:
+            figures = self._entries.get(digest)
+            if figures is not None:
+                self._entries.move_to_end(digest)
+                self._touch_results(digest)
+                self._stats["hits"] += 1
+                return figures
+            self._stats["misses"] += 1
+            return self._add(digest, results)
+
+    def lookup(self, digest: str) -> SimulationFigures | None:
+        # Tylko po kluczu (tryb serwerowy Store) - None, gdy nie ma ani figur, ani wyniku
+        with self._lock:
+            figures = self._entries.get(digest)
+            if figures is not None:
+                self._entries.move_to_end(digest)
+                self._touch_results(digest)
+                self._stats["hits"] += 1
+                return figures
+            results = self._results.get(digest)
+            if results is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["rebuilds"] += 1
+            return self._add(digest, results)
+
+    def _add(self, digest: str, results: dict) -> SimulationFigures:
+        figures = self._entries[digest] = SimulationFigures(results, digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+        self._results[digest] = results
+        self._touch_results(digest)
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        return figures
+
+    def _touch_results(self, digest: str):
+        if digest in self._results:
+            self._results.move_to_end(digest)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "size": len(self._entries), "max_entries": self.max_entries,
+                    "results": len(self._results), "max_results": self.max_results}
+
+
+PREWARM = os.getenv("DASH_FIGURE_PREWARM", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+def prewarm_figures(figures: SimulationFigures):
+    if PREWARM:
+        threading.Thread(target=figures.prewarm, name="figure-prewarm", daemon=True).start()
+
+
+figure_cache = FigureCache(max_entries=int(os.getenv("DASH_FIGURE_CACHE_SIZE", 32)),
+                           max_results=int(os.getenv("DASH_RESULT_STORE_SIZE", 512)))
+
+
+@register_collector
+def _figure_cache_metrics() -> list[tuple]:
+    return stats_families("dash_figure_cache", figure_cache.stats(), counters={
+        "hits": "Dash figure cache hits.",
+        "misses": "Dash figure cache misses.",
+        "evictions": "Simulation results evicted from the Dash figure cache.",
+        "rebuilds": "Dash figures rebuilt from a stored simulation result after eviction.",
+    }, gauges={"size": "Simulation results held in the Dash figure cache.",
+               "results": "Raw simulation results kept for rebuilding evicted Dash figures."})
@@ -1,6 +1,16 @@
 import pandas as pd
 
-def process_simulation_data(results, chart_mode='static'):
+translation_map = {
+    'water_amount': 'Poziom wody [L]',
+    'pumped_up_water': 'Wpompowana woda [L]',
+    'pumped_out_water': 'Zużyta woda [L]',
+    'saved_water': 'Zaoszczędzona woda [L]'
+}
+
+
+def simulation_frames(results):
+    # Ramka szeroka i długie dla obu trybów wykresu, liczone raz na wynik: tryb statyczny różni się
+    # tylko znakiem zużytej wody (słupki pod osią)
     df = pd.DataFrame(results)
     df['date'] = pd.to_datetime(df['date'])
 
@@ -10,16 +20,13 @@ def process_simulation_data(results, chart_mode='static'):
         var_name='type',
         value_name='value'
     )
-    if chart_mode == 'static':
-        df_long.loc[df_long['type'] == 'pumped_out_water', 'value'] *= -1
+    df_long['type'] = df_long['type'].map(translation_map)
 
-    translation_map = {
-        'water_amount': 'Poziom wody [L]',
-        'pumped_up_water': 'Wpompowana woda [L]',
-        'pumped_out_water': 'Zużyta woda [L]',
-        'saved_water': 'Zaoszczędzona woda [L]'
-    }
+    df_long_static = df_long.copy()
+    df_long_static.loc[df_long_static['type'] == translation_map['pumped_out_water'], 'value'] *= -1
+    return df, {'static': df_long_static, 'animated': df_long}
 
-    df_long['type'] = df_long['type'].map(translation_map)
 
-    return df, df_long
+def process_simulation_data(results, chart_mode='static'):
+    df, long_frames = simulation_frames(results)
+    return df, long_frames['static' if chart_mode == 'static' else 'animated']
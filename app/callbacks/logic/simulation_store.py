@@ -0,0 +1,34 @@
+import os
+
+from dash.exceptions import PreventUpdate
+
+from app.callbacks.logic.figure_cache import SimulationFigures, figure_cache
+
+# "client" (domyślnie): pełny wynik w dcc.Store przeglądarki - działa przy dowolnej liczbie procesów;
+# "server": Store trzyma tylko klucz wyniku, dane w cache figur procesu - tylko jeden proces albo sticky
+# sessions, inaczej przełączenie wykresu trafia do procesu bez wyniku i nic nie zmienia
+STORE_MODES = ("client", "server")
+STORE_MODE = os.getenv("DASH_STORE_MODE", "client").strip().lower()
+# Dawna nazwa trybu "client"
+if STORE_MODE == "browser":
+    STORE_MODE = "client"
+if STORE_MODE not in STORE_MODES:
+    raise ValueError(f"DASH_STORE_MODE must be one of: {', '.join(STORE_MODES)}")
+
+
+def store_data(figures: SimulationFigures, results: dict) -> dict:
+    if STORE_MODE == "client":
+        return results
+    return {"key": figures.digest}
+
+
+def stored_figures(data: dict) -> SimulationFigures:
+    if "key" not in data:
+        return figure_cache.get(data)
+    figures = figure_cache.lookup(data["key"])
+    if figures is None:
+        # Wynik wypadł też z DASH_RESULT_STORE_SIZE albo zapytanie trafiło do innego procesu - wykresy
+        # zostają bez zmian; przełączenie wykresu nigdy nie symuluje ani nie zapisuje przebiegu ponownie
+        # (kilka procesów bez sticky sessions: DASH_STORE_MODE=client)
+        raise PreventUpdate
+    return figures
@@ -1,10 +1,12 @@
 from dash import Input, Output, State
+from dash.exceptions import PreventUpdate
+
+from app.api.metrics import instrument_callback
 
-from app.callbacks.logic.charts import generate_static_chart, generate_animation_chart, generate_total_comparison, \
-    generate_percentage_comparison, generate_difference_chart, generate_comparison_subplots, generate_average_comparison
 from app.callbacks.logic.charts_block import create_charts_block
 from app.callbacks.logic.fetch_simulation_data import fetch_simulation_data
-from app.callbacks.logic.process_simulation_data import process_simulation_data
+from app.callbacks.logic.figure_cache import figure_cache, prewarm_figures
+from app.callbacks.logic.simulation_store import store_data, stored_figures
 from app.layout.layouts import toast_success_status, toast_error_status
 
 
@@ -22,6 +24,7 @@ def register_simulation_callbacks(app):
         State("slider-roof-area", "value"),
         prevent_initial_call=True,
     )
+    @instrument_callback("run_simulation")
     def run_simulation(n_clicks, location, tank_capacity, min_water_level, daily_use, roof_area):
         if not all([tank_capacity, min_water_level, daily_use, roof_area, location]):
             return toast_error_status("Wypełnij wszystkie pola przed symulacją."), None, None
@@ -29,23 +32,18 @@ def register_simulation_callbacks(app):
         try:
             results = fetch_simulation_data(location, tank_capacity, min_water_level, daily_use, roof_area)
 
-            df, df_long = process_simulation_data(results.get('pi_controller_results'))
-            df_fuzzy, df_fuzzy_long = process_simulation_data(results.get('fuzzy_controller_results'))
-
-            fig_pi = generate_static_chart(df_long, "Poziom wody (Regulator PI)")
-            fig_fuzzy = generate_static_chart(df_fuzzy_long, "Poziom wody (Regulator rozmyty)")
-
-            comp_fig = generate_comparison_subplots(df_long, df_fuzzy_long)
-            comparison_fig = generate_average_comparison(df_long, df_fuzzy_long)
-            comparison_fig_percentage = generate_percentage_comparison(df_long, df_fuzzy_long)
-            comparison_fig_difference = generate_difference_chart(df_long, df_fuzzy_long)
+            # Ramki i wykresy z cache po skrócie wyniku - ta sama symulacja nie buduje ich ponownie
+            figures = figure_cache.get(results)
 
-            chart_block = create_charts_block(fig_pi, df, fig_fuzzy, df_fuzzy, comparison_fig,
-                                              comparison_fig_percentage, comparison_fig_difference, comp_fig)
+            chart_block = create_charts_block(figures.chart("pi"), figures.frames("pi")[0],
+                                              figures.chart("fuzzy"), figures.frames("fuzzy")[0],
+                                              figures.comparison("average"), figures.comparison("percentage"),
+                                              figures.comparison("difference"), figures.comparison("subplots"))
+            prewarm_figures(figures)
             return (
                 toast_success_status("✅ Symulacja zakończona sukcesem."),
                 chart_block,
-                results,
+                store_data(figures, results),
             )
         except Exception as e:
             return toast_error_status(str(e)), None, None
@@ -57,24 +55,14 @@ def register_simulation_callbacks(app):
         Input("chart-mode-fuzzy", "value"),
         State("simulation-data", "data")
     )
+    @instrument_callback("update_chart")
     def update_chart(chart_mode_pi, chart_mode_fuzzy, data):
         if not data:
-            return None
-
-        df_pi, df_pi_long = process_simulation_data(data.get('pi_controller_results'), chart_mode_pi)
-        df_fuzzy, df_fuzzy_long = process_simulation_data(data.get('fuzzy_controller_results'), chart_mode_fuzzy)
-
-        if chart_mode_pi == 'animated':
-            fig = generate_animation_chart(df_pi, df_pi_long)
-        else:
-            fig = generate_static_chart(df_pi_long, "Poziom wody (Regulator PI)")
-
-        if chart_mode_fuzzy == 'animated':
-            fig_fuzzy = generate_animation_chart(df_fuzzy, df_fuzzy_long)
-        else:
-            fig_fuzzy = generate_static_chart(df_fuzzy_long, "Poziom wody (Regulator rozmyty)")
+            raise PreventUpdate
 
-        return fig, fig_fuzzy
+        # Przełączenie trybu to odczyt z cache (skrót wyniku, regulator, tryb)
+        figures = stored_figures(data)
+        return figures.chart("pi", chart_mode_pi), figures.chart("fuzzy", chart_mode_fuzzy)
 
     @app.callback(
         Output("stats-collapse", "is_open"),
@@ -82,6 +70,7 @@ def register_simulation_callbacks(app):
         State("stats-collapse", "is_open"),
         prevent_initial_call=True,
     )
+    @instrument_callback("toggle_stats")
     def toggle_stats(n_clicks, is_open):
         if n_clicks:
             return not is_open
@@ -1,5 +1,7 @@
 from dash import Output, Input, State
 
+from app.api.metrics import instrument_callback
+
 
 def register_slider_callbacks(app):
     # Callback to update data in cards from sliders values
@@ -13,6 +15,7 @@ def register_slider_callbacks(app):
         Input("slider-daily-use", "value"),
         Input("slider-roof-area", "value"),
     )
+    @instrument_callback("update_cards")
     def update_cards(tank, min_level, daily_use, roof_area):
         return f"{tank} L", f"{min_level} L", f"{daily_use} L", f"{roof_area} m²"
 
@@ -24,6 +27,7 @@ def register_slider_callbacks(app):
         Input("slider-tank-capacity", "value"),
         State("slider-min-level", "value")
     )
+    @instrument_callback("update_min_slider_max")
     def update_min_slider_max(tank_capacity, current_min_value):
         # Rezerwa np. 100 L, żeby min level nie był równy pełnej pojemności
         new_max = max(1, tank_capacity - 100)
@@ -1,16 +1,72 @@
-from flask import Blueprint, jsonify, request
+import time as time_module
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
 from datetime import datetime,date,time
 from sqlalchemy.exc import OperationalError
 from app.init_db import db
-from app.models.user_data import UserData
-from app.models.water_balance import WaterBalance
 from app.api.weather_data_service import fetch_rainfall_forecast
-from app.api.simulation_service import run_water_simulation
-from app.api.simulation_service import run_water_simulation_fuzzy
+from app.api.forecast_cache import forecast_cache
+from app.api.result_cache import result_cache
+from app.api.http_session import upstream_stats
+from app.api import metrics, profiling
+from app.api.simulation_request_service import (SimulationRequestError, parse_horizon, run_simulation_request,
+                                                stream_simulation_request)
+from app.api.sweep_service import (SWEEP_PARAMETERS, build_sweep_grid, parse_rank_by, parse_sweep_limit,
+                                   run_parameter_sweep)
+from app.api.job_service import cancel_job, ensure_job_workers, get_job, list_jobs, submit_job
+from app.api.backtest_service import run_backtest
+from app.api.ensemble_service import run_ensemble_request
+from app.api.run_query_service import aggregate_days, get_run, list_runs, run_days
+from app.api.rainfall_archive import (RainfallArchiveError, RainfallArchiveNotFound, get_rainfall_archive,
+                                      parse_rainfall_csv, parse_rainfall_json)
 
 
 routes_bp = Blueprint('routes', __name__)
 
+
+@routes_bp.before_app_request
+def start_job_workers():
+    ensure_job_workers(current_app._get_current_object())
+
+
+@routes_bp.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule
+    g.metrics_started = time_module.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(g.metrics_endpoint)
+
+
+@routes_bp.before_request
+def start_request_profile():
+    g.profile = profiling.start_request(request.method, request.path, request.headers.get(profiling.PROFILE_HEADER))
+
+
+@routes_bp.after_request
+def record_response_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+@routes_bp.teardown_request
+def finish_request_metrics(error=None):
+    # Czas do zbudowania odpowiedzi (strumieniowane treści NDJSON liczone bez wysyłki)
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profiling.finish_request(profile, g.get("metrics_status", 500))
+    endpoint = g.pop("metrics_endpoint", None)
+    if endpoint is None:
+        return
+    metrics.HTTP_IN_FLIGHT.dec(endpoint)
+    metrics.HTTP_DURATION.observe(time_module.perf_counter() - g.pop("metrics_started"), request.method, endpoint)
+    metrics.HTTP_REQUESTS.inc(request.method, endpoint, str(g.pop("metrics_status", 500)))
+
+
+@routes_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled (METRICS_ENABLED=false)."}), 404
+    return Response(metrics.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @routes_bp.route('/connection', methods=['GET'])
 def connection_check():
     db_status = "OK"
@@ -34,104 +90,297 @@ def connection_check():
     return jsonify(response_data), status_code
 
 
+def _profiles_access_error():
+    # Token tylko w nagłówku - parametr zapytania trafiałby do logów serwera i historii przeglądarki
+    if not profiling.admin_enabled():
+        return jsonify({"error": "Profiling admin endpoints require PROFILING_MODE and PROFILING_TOKEN."}), 404
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({"error": "Invalid or missing profiling token."}), 403
+    return None
+
+
+@routes_bp.route('/admin/profiles', methods=['GET'])
+def handle_profile_list():
+    error = _profiles_access_error()
+    if error:
+        return error
+    return jsonify(profiling.profile_store.list()), 200
+
+
+@routes_bp.route('/admin/profiles', methods=['DELETE'])
+def handle_profile_clear():
+    error = _profiles_access_error()
+    if error:
+        return error
+    profiling.profile_store.clear()
+    return "", 204
+
+
+@routes_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def handle_profile_download(profile_id):
+    # ?format=pstats|text (cprofile) albo collapsed (sample)
+    error = _profiles_access_error()
+    if error:
+        return error
+    entry = profiling.profile_store.get(profile_id)
+    if entry is None:
+        return jsonify({"error": f"Profile {profile_id} not found."}), 404
+    try:
+        body, content_type, extension = profiling.export_profile(entry, request.args.get("format"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = Response(body, content_type=content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="profile-{profile_id}.{extension}"'
+    return response
+
+
+@routes_bp.route('/api/forecast/cache', methods=['GET'])
+def forecast_cache_stats():
+    return jsonify(forecast_cache.stats()), 200
+
+
+@routes_bp.route('/api/results/cache', methods=['GET'])
+def result_cache_stats():
+    return jsonify(result_cache.stats()), 200
+
+
+@routes_bp.route('/api/upstream/stats', methods=['GET'])
+def upstream_connection_stats():
+    return jsonify(upstream_stats()), 200
+
+
 @routes_bp.route('/api/simulation', methods=['POST'])
 def handle_simulation_request():
     if not request.is_json:
         return jsonify({"error": "Request must be JSON"}), 400
 
+    timings = {}
+    started = time_module.perf_counter()
+    try:
+        response_data = run_simulation_request(request.get_json(), timings=timings)
+        status_code = 200
+    except SimulationRequestError as e:
+        response_data, status_code = {"error": e.message}, e.status_code
+    timings["total"] = (time_module.perf_counter() - started) * 1000
+
+    response = jsonify(response_data)
+    # Czasy etapów w nagłówku Server-Timing (widoczne w narzędziach przeglądarki)
+    response.headers["Server-Timing"] = ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in timings.items())
+    return response, status_code
+
+
+@routes_bp.route('/api/simulation/stream', methods=['POST'])
+def handle_simulation_stream():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    try:
+        lines = stream_simulation_request(request.get_json())
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+    # Rekordy liczone w trakcie wysyłania - odpowiedź NDJSON bez Content-Length
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+
+@routes_bp.route('/api/sweep', methods=['POST'])
+def handle_sweep_request():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
     data = request.get_json()
-    required_fields = ["tank_capacity", "min_water_level", "daily_water_usage", "rooftop_size", "location"]
+    required_fields = [*SWEEP_PARAMETERS, "location"]
     if not all(field in data for field in required_fields):
         return jsonify({"error": f"Missing one or more required fields: {', '.join(required_fields)}"}), 400
-    
-    try:
-        user_data = UserData(
-            tank_capacity=data["tank_capacity"],
-            min_water_level=data["min_water_level"],
-            daily_water_usage=data["daily_water_usage"],
-            rooftop_size=data["rooftop_size"],
-            location=data["location"],
-            initial_water_level=data.get("initial_water_level")  # Optional
-        )
+
+    try:
+        scenarios = build_sweep_grid(data)
+        limit = parse_sweep_limit(data.get("limit", 20))
+        rank_by = parse_rank_by(data.get("rank_by", "pumped_up_water"))
+        horizon = parse_horizon(data)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
 
     try:
-        rainfall_forecast_tuples = fetch_rainfall_forecast(user_data.location, days=30)
+        # Prognoza pobierana raz dla całej siatki
+        rainfall_forecast_tuples = fetch_rainfall_forecast(str(data["location"]), days=horizon)
         if not rainfall_forecast_tuples:
             return jsonify({"error": "Could not retrieve rainfall forecast data."}), 500
 
-        # Run PI controller simulation
-        pi_simulation_daily_records = run_water_simulation(user_data, rainfall_forecast_tuples)
-        
-        # Run Fuzzy controller simulation
-        fuzzy_simulation_daily_records = run_water_simulation_fuzzy(user_data, rainfall_forecast_tuples)
-        
-        pi_records_for_response_and_db = []
-
-        # Process and save PI controller results to DB
-        try:
-            for day_record_dict in pi_simulation_daily_records:
-                if isinstance(day_record_dict["date"], date):
-                    date_str = day_record_dict["date"].isoformat()
-                else:
-                    # Assuming it's already a string if not a date object
-                    date_str = str(day_record_dict["date"])
-
-                db_dict = {
-                    "date": date_str,
-                    "water_amount": day_record_dict["water_amount_eod"],
-                    "rainfall_amount": day_record_dict["rainfall_forecast_mm"],
-                    "daily_consumption": day_record_dict["daily_consumption"],
-                    "saved_water": day_record_dict["saved_water_from_rain"],
-                    "pumped_up_water": day_record_dict["pumped_up_municipal_water"],
-                    "pumped_out_water": day_record_dict["overflow_water_lost"]
-                }
-
-                existing_record = WaterBalance.query.filter_by(date=date_str).first()
-
-                if existing_record:
-                    for key, value in db_dict.items():
-                        if key != 'date': # Don't try to update the primary key part of a composite or unique constraint
-                            setattr(existing_record, key, value)
-                    db.session.add(existing_record)
-                    pi_records_for_response_and_db.append(existing_record.to_json())
-                else:
-                    new_record = WaterBalance(**db_dict)
-                    db.session.add(new_record)
-                    # We need to flush to get the ID if it's auto-generated and to_json() needs it,
-                    # or ensure to_json() can handle it before commit.
-                    # For simplicity, assuming to_json() works with the current state.
-                    pi_records_for_response_and_db.append(new_record.to_json()) # This might need adjustment if to_json relies on committed state
-
-            db.session.commit()
-            # Re-fetch or ensure to_json() works correctly for newly added records if they were not complete
-            # For this example, we assume `new_record.to_json()` worked with uncommitted data or `to_json` is robust.
-            # A safer approach for new records might be to query them after commit or build JSON from db_dict.
-            # However, to keep changes minimal to the existing structure:
-            # We will use the pi_records_for_response_and_db list as built.
-
-        except Exception as db_error:
-            db.session.rollback()
-            # Log the database error
-            # current_app.logger.error(f"Database error: {str(db_error)}")
-            return jsonify({"error": f"Database error: {str(db_error)}"}), 500
-        
-        # Prepare the final response
-        response_data = {
-            "pi_controller_results": pi_records_for_response_and_db,
-            "fuzzy_controller_results": fuzzy_simulation_daily_records # Already a list of dicts
-        }
-        
+        response_data = run_parameter_sweep(
+            scenarios,
+            rainfall_forecast_tuples,
+            horizon,
+            rank_by=rank_by,
+            limit=limit,
+            fuzzy_mode=data.get("fuzzy_mode", "surface"),
+        )
         return jsonify(response_data), 200
 
     except ConnectionError as e:
-        # current_app.logger.error(f"External API connection error: {str(e)}")
         return jsonify({"error": f"External API connection error: {str(e)}"}), 503
     except ValueError as e:
-        # current_app.logger.error(f"Data processing error: {str(e)}")
         return jsonify({"error": f"Data processing error: {str(e)}"}), 400
     except Exception as e:
-        # current_app.logger.error(f"An internal server error occurred: {str(e)}")
-        db.session.rollback() # Ensure rollback on any other unexpected error
         return jsonify({"error": f"An internal server error occurred: {str(e)}"}), 500
+
+
+@routes_bp.route('/api/jobs', methods=['POST'])
+def handle_job_submission():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    try:
+        job = submit_job(request.get_json())
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+    response = jsonify({**job, "status_url": f"/api/jobs/{job['job_id']}"})
+    response.headers["Location"] = f"/api/jobs/{job['job_id']}"
+    return response, 202
+
+
+@routes_bp.route('/api/jobs', methods=['GET'])
+def handle_job_list():
+    try:
+        limit = min(int(request.args.get("limit", 50)), 500)
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "'limit' must be a positive integer"}), 400
+    return jsonify(list_jobs(request.args.get("status"), limit)), 200
+
+
+@routes_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def handle_job_status(job_id):
+    include_result = request.args.get("include_result", "true").lower() not in ("0", "false", "no")
+    try:
+        return jsonify(get_job(job_id, include_result=include_result)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def handle_job_cancel(job_id):
+    try:
+        return jsonify(cancel_job(job_id)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/rainfall/archive', methods=['GET'])
+def handle_rainfall_archive_list():
+    return jsonify(get_rainfall_archive().locations()), 200
+
+
+@routes_bp.route('/api/rainfall/archive/<location>', methods=['POST'])
+def handle_rainfall_archive_import(location):
+    # Import zrzutu: JSON (lista {date, rainfall_mm}, {"rainfall": [...]} lub odpowiedź Visual Crossing)
+    # albo CSV (Content-Type: text/csv) z kolumnami date/datetime i rainfall_mm/precip
+    try:
+        if request.mimetype == "text/csv":
+            records = parse_rainfall_csv(request.get_data(as_text=True))
+        elif request.is_json:
+            records = parse_rainfall_json(request.get_json())
+        else:
+            return jsonify({"error": "Request must be JSON or text/csv"}), 400
+        return jsonify(get_rainfall_archive().import_records(location, records, source="api")), 200
+    except RainfallArchiveError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@routes_bp.route('/api/rainfall/archive/<location>', methods=['GET'])
+def handle_rainfall_archive_read(location):
+    archive = get_rainfall_archive()
+    try:
+        if "start" not in request.args and "end" not in request.args:
+            return jsonify(archive.info(location)), 200
+        start = date.fromisoformat(request.args["start"]) if "start" in request.args else None
+        end = date.fromisoformat(request.args["end"]) if "end" in request.args else None
+        fill_missing = float(request.args["fill_missing"]) if "fill_missing" in request.args else None
+        rainfall = archive.series(location, start, end, fill_missing)
+    except RainfallArchiveNotFound as e:
+        return jsonify({"error": str(e)}), 404
+    except (RainfallArchiveError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "location": rainfall.location,
+        "start": rainfall.start.isoformat(),
+        "end": rainfall.end.isoformat(),
+        "rainfall": [{"date": day.isoformat(), "rainfall_mm": rainfall_mm} for day, rainfall_mm in rainfall],
+    }), 200
+
+
+@routes_bp.route('/api/rainfall/archive/<location>', methods=['DELETE'])
+def handle_rainfall_archive_delete(location):
+    if not get_rainfall_archive().delete(location):
+        return jsonify({"error": f"No rainfall archive for '{location}'."}), 404
+    return "", 204
+
+
+@routes_bp.route('/api/backtest', methods=['POST'])
+def handle_backtest_request():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    try:
+        return jsonify(run_backtest(request.get_json())), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/ensemble', methods=['POST'])
+def handle_ensemble_request():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    try:
+        return jsonify(run_ensemble_request(request.get_json())), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/runs', methods=['GET'])
+def handle_run_list():
+    # ?location&controller&created_after&created_before&limit&cursor (next_cursor z poprzedniej strony)
+    try:
+        return jsonify(list_runs(request.args)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/runs/aggregate', methods=['GET'])
+def handle_runs_aggregate():
+    # Agregaty po wszystkich przebiegach spełniających filtry listy: ?period=day|week|month&start&end
+    try:
+        return jsonify(aggregate_days(request.args)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/runs/<int:run_id>', methods=['GET'])
+def handle_run_read(run_id):
+    try:
+        return jsonify(get_run(run_id).to_json()), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/runs/<int:run_id>/days', methods=['GET'])
+def handle_run_days(run_id):
+    # ?start&end&limit&cursor
+    try:
+        return jsonify(run_days(run_id, request.args)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
+
+
+@routes_bp.route('/api/runs/<int:run_id>/aggregate', methods=['GET'])
+def handle_run_aggregate(run_id):
+    try:
+        return jsonify(aggregate_days(request.args, run_id=run_id)), 200
+    except SimulationRequestError as e:
+        return jsonify({"error": e.message}), e.status_code
@@ -1,49 +1,84 @@
 # app/init_db.py
-from dash import Dash
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 import os
-import dash_bootstrap_components as dbc
-from app.callbacks.init_callbacks import register_callbacks
-from app.layout.layouts import main_layout
+from app.startup import StartupReport
 
 db = SQLAlchemy()
 
-def create_app():
-    app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Tryb wdrożenia (APP_MODE): full - interfejs Dash i API w jednym procesie, api - samo API (Flask,
+# blueprint, baza) bez Dash, layoutu i callbacków; procesy API skalowane niezależnie od interfejsu
+APP_MODES = ("full", "api")
+
+
+def app_mode() -> str:
+    mode = os.getenv("APP_MODE", "full").strip().lower()
+    if mode not in APP_MODES:
+        raise ValueError(f"Unknown APP_MODE '{mode}', expected one of: {', '.join(APP_MODES)}")
+    return mode
+
+
+def _create_server(report: StartupReport) -> Flask:
+    with report.phase("server"):
+        server = Flask(__name__)
+        server.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///local.db')
+        server.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+        db.init_app(server)
+
+    with report.phase("api"):
+        from app.controllers.routes import routes_bp
+        server.register_blueprint(routes_bp)
 
-    db.init_app(app)
+    with report.phase("database"):
+        with server.app_context():
+            db.create_all()
+            _create_missing_indexes()
 
-    from app.controllers.routes import routes_bp
-    app.register_blueprint(routes_bp)
+    return server
 
-    with app.app_context():
-        db.create_all()
 
+def _create_missing_indexes():
+    # create_all nie dodaje indeksów do istniejących tabel - indeksy dopisane później w modelach
+    # zakładamy tu (checkfirst), bez osobnych migracji
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def create_app():
+    report = StartupReport("create_app")
+    app = _create_server(report)
+    report.finish()
     return app
 
 
 def create_dash_app():
+    report = StartupReport("create_dash_app")
     # Tworzymy Flask server osobno
-    server = Flask(__name__)
-    server.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///local.db')
-    server.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    server = _create_server(report)
 
-    db.init_app(server)
+    # Dash, layout i callbacki importowane dopiero tutaj - create_app (samo API) ich nie ładuje
+    with report.phase("dash"):
+        from dash import Dash
+        import dash_bootstrap_components as dbc
 
-    from app.controllers.routes import routes_bp
-    server.register_blueprint(routes_bp)
+        # Tworzymy Dash na bazie tego Flask
+        app = Dash(__name__, server=server, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.LUX])
+        app.title = "Symulacja zbiornika"
 
-    with server.app_context():
-        db.create_all()
+    with report.phase("callbacks"):
+        from app.callbacks.init_callbacks import register_callbacks
+        register_callbacks(app)
 
-    # Tworzymy Dash na bazie tego Flask
-    app = Dash(__name__, server=server, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.LUX])
-    app.title = "Symulacja zbiornika"
-
-    register_callbacks(app)
-    app.layout = main_layout
+    with report.phase("layout"):
+        from app.layout.layouts import main_layout
+        app.layout = main_layout
 
+    report.finish()
     return app
+
+
+def create_configured_app():
+    # Aplikacja dla serwera (main.py, asgi.py) zgodnie z APP_MODE: Flask (api) albo Dash (full)
+    return create_app() if app_mode() == "api" else create_dash_app()
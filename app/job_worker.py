@@ -0,0 +1,29 @@
+# app/job_worker.py
+# Osobny proces roboczy kolejki zadań (POST /api/jobs) - ciężkie obliczenia nie konkurują
+# z serwerem WWW o GIL. To domyślny sposób obsługi kolejki (serwer ma JOB_WORKERS=0).
+#
+#   python -m app.job_worker
+import os
+import signal
+import threading
+
+from app.init_db import create_app
+from app.api.job_service import JobRunner
+
+
+def main():
+    app = create_app()
+    runner = JobRunner(app, int(os.getenv("JOB_PROCESS_WORKERS", 1)), float(os.getenv("JOB_POLL_INTERVAL", 1.0)))
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    runner.start()
+    app.logger.info(f"Job worker started with {runner.workers} thread(s)")
+    stopping.wait()
+    # Przerwane zadanie wróci do kolejki po JOB_STALE_AFTER (brak bicia serca)
+    runner.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
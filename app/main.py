@@ -1,8 +1,14 @@
 # app/main.py
 import os
-from app.init_db import create_dash_app
+from app.init_db import app_mode, create_configured_app
+from app.startup import start_prewarm
 
-app = create_dash_app()
+# APP_MODE=api - samo API (Flask) bez interfejsu Dash
+app = create_configured_app()
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=int(os.getenv('PORT', 5000)))
\ No newline at end of file
+    port = int(os.getenv('PORT', 5000))
+    # Przy debug=True proces nadrzędny reloadera tylko pilnuje plików - prewarm w procesie, który serwuje
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_prewarm(port, dash=app_mode() == "full")
+    app.run(debug=True, host="0.0.0.0", port=port)
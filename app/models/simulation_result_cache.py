@@ -0,0 +1,13 @@
+from app.init_db import db
+from datetime import datetime
+
+
+class SimulationResultCache(db.Model):
+    # Warstwa bazodanowa cache wyników (app/api/result_cache.py) - wspólna dla procesów i restartów
+    __tablename__ = 'simulation_result_cache'
+
+    key = db.Column(db.String(64), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
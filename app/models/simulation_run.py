@@ -0,0 +1,127 @@
+from app.init_db import db
+from datetime import datetime, date
+from sqlalchemy import insert
+
+DAY_COLUMNS = ("date", "water_amount", "rainfall_amount", "daily_consumption", "saved_water",
+               "pumped_up_water", "pumped_out_water")
+
+_statements = {}
+
+
+class SimulationRun(db.Model):
+    # Jeden przebieg jednego regulatora: parametry wejściowe, zakres dat i sumy (porównania bez
+    # czytania wierszy dziennych). Wyniki dzienne w simulation_run_day, klucz (run_id, date).
+    __tablename__ = 'simulation_run'
+    __table_args__ = (
+        db.Index("ix_simulation_run_location_created", "location", "created_at"),
+        db.Index("ix_simulation_run_controller_created", "controller", "created_at"),
+        # Lista przebiegów miasta i regulatora stronicowana po (created_at, id) - GET /api/runs
+        db.Index("ix_simulation_run_location_controller_created", "location", "controller", "created_at", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(120), nullable=False)
+    controller = db.Column(db.String(32), nullable=False)
+    source = db.Column(db.String(16), nullable=False, default="forecast")
+    parameters = db.Column(db.JSON, nullable=False)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    days = db.Column(db.Integer, nullable=False, default=0)
+    total_pumped_up_water = db.Column(db.Float)
+    total_pumped_out_water = db.Column(db.Float)
+    total_saved_water = db.Column(db.Float)
+    final_water_amount = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def to_json(self):
+        return {
+            "run_id": self.id,
+            "location": self.location,
+            "controller": self.controller,
+            "source": self.source,
+            "parameters": self.parameters,
+            "start_date": self.start_date.isoformat() if self.start_date else None,
+            "end_date": self.end_date.isoformat() if self.end_date else None,
+            "days": self.days,
+            "total_pumped_up_water": self.total_pumped_up_water,
+            "total_pumped_out_water": self.total_pumped_out_water,
+            "total_saved_water": self.total_saved_water,
+            "final_water_amount": self.final_water_amount,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
+    @classmethod
+    def run_values(cls, location: str, controller: str, parameters: dict, records: list[dict],
+                   source: str = "forecast") -> dict:
+        return {
+            "location": location,
+            "controller": controller,
+            "source": source,
+            "parameters": parameters,
+            "start_date": _as_date(records[0]["date"]) if records else None,
+            "end_date": _as_date(records[-1]["date"]) if records else None,
+            "days": len(records),
+            "total_pumped_up_water": round(sum(r["pumped_up_water"] for r in records), 2),
+            "total_pumped_out_water": round(sum(r["pumped_out_water"] for r in records), 2),
+            "total_saved_water": round(sum(r["saved_water"] for r in records), 2),
+            "final_water_amount": records[-1]["water_amount"] if records else None,
+            "created_at": datetime.utcnow(),
+        }
+
+    @classmethod
+    def insert_statement(cls):
+        # INSERT ... RETURNING id - dla silnika asynchronicznego (PostgreSQL, SQLite >= 3.35)
+        statement = _statements.get("run")
+        if statement is None:
+            statement = _statements["run"] = insert(cls.__table__).returning(cls.__table__.c.id)
+        return statement
+
+
+class SimulationRunDay(db.Model):
+    __tablename__ = 'simulation_run_day'
+    __table_args__ = (
+        # Agregaty po wielu przebiegach filtrują zakres dat - klucz główny (run_id, date) zaczyna się od run_id
+        db.Index("ix_simulation_run_day_date_run", "date", "run_id"),
+    )
+
+    run_id = db.Column(db.Integer, db.ForeignKey("simulation_run.id", ondelete="CASCADE"), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    water_amount = db.Column(db.Float)
+    rainfall_amount = db.Column(db.Float)
+    daily_consumption = db.Column(db.Float)
+    saved_water = db.Column(db.Float)
+    pumped_up_water = db.Column(db.Float)
+    pumped_out_water = db.Column(db.Float)
+
+    def to_json(self):
+        return {
+            "date": self.date.isoformat(),
+            "water_amount": self.water_amount,
+            "rainfall_amount": self.rainfall_amount,
+            "daily_consumption": self.daily_consumption,
+            "saved_water": self.saved_water,
+            "pumped_up_water": self.pumped_up_water,
+            "pumped_out_water": self.pumped_out_water,
+        }
+
+    @classmethod
+    def insert_statement(cls):
+        # Wiersze dzienne jako parametry executemany - jedno skompilowane zapytanie (z cache),
+        # SQLAlchemy składa je w wielowierszowe INSERT ... VALUES
+        statement = _statements.get("day")
+        if statement is None:
+            statement = _statements["day"] = insert(cls.__table__)
+        return statement
+
+    @classmethod
+    def insert_parameters(cls, run_id: int, records: list[dict]) -> list[dict]:
+        return [{"run_id": run_id, **{column: record[column] for column in DAY_COLUMNS},
+                 "date": _as_date(record["date"])} for record in records]
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
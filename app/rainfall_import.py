@@ -0,0 +1,34 @@
+# app/rainfall_import.py
+# Import zrzutu opadów (CSV lub JSON) do lokalnego archiwum - bez serwera i bez limitu rozmiaru żądania.
+#
+#   python -m app.rainfall_import Poznań opady_2005_2024.csv
+#   python -m app.rainfall_import Poznań visual_crossing.json --format json
+import argparse
+import json
+import os
+import sys
+
+from app.init_db import create_app
+from app.api.rainfall_archive import RainfallArchiveError, get_rainfall_archive, parse_rainfall_dump
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a rainfall dump into the local rainfall archive.")
+    parser.add_argument("location")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "json"), help="Defaults to the file extension")
+    args = parser.parse_args()
+
+    dump_format = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    app = create_app()
+    with app.app_context(), open(args.path, encoding="utf-8-sig") as dump:
+        try:
+            records = parse_rainfall_dump(dump.read(), dump_format)
+            info = get_rainfall_archive().import_records(args.location, records, source=os.path.basename(args.path))
+        except RainfallArchiveError as e:
+            sys.exit(f"Import failed: {e}")
+    print(json.dumps(info, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
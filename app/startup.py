@@ -0,0 +1,202 @@
+# app/startup.py
+# Start procesu: czasy faz budowy aplikacji (create_app / create_dash_app), lista pakietów ładowanych
+# dopiero przy pierwszym użyciu i opcjonalny prewarm w tle po otwarciu portu.
+#
+#   STARTUP_REPORT=true   - raport faz na stderr po zbudowaniu aplikacji (+ app_startup_* w /metrics zawsze)
+#   STARTUP_PREWARM=true  - po otwarciu portu (PORT) wątek w tle ładuje skfuzzy/pandas/plotly, buduje
+#                           regulator rozmyty dla domyślnego zbiornika i pierwszy wykres
+#
+#   python -m app.startup [--top 25]   - rozkład czasu importu aplikacji wg pakietów (python -X importtime)
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from app.api.metrics import register_collector
+
+REPORT = os.getenv("STARTUP_REPORT", "false").strip().lower() in ("1", "true", "yes", "on")
+PREWARM = os.getenv("STARTUP_PREWARM", "false").strip().lower() in ("1", "true", "yes", "on")
+PREWARM_PORT_WAIT = float(os.getenv("STARTUP_PREWARM_PORT_WAIT", 30))
+
+# Pakiety importowane leniwie (regulator rozmyty, wykresy Dash) - nie powinny być załadowane po starcie
+DEFERRED_MODULES = ("skfuzzy", "scipy", "networkx", "pandas", "plotly.express")
+# Domyślna pojemność zbiornika w formularzu (app/layout/layouts.py)
+PREWARM_TANK_CAPACITY = 1500
+
+
+def _process_age() -> float | None:
+    # Czas od uruchomienia procesu (Linux /proc) - obejmuje start interpretera i importy przed create_*_app
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class StartupReport:
+    # Fazy jednej budowy aplikacji: (nazwa, czas [ms], liczba nowo zaimportowanych modułów)
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.phases = []
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.process_age = None
+        self.prewarm_ms = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started, modules = time.perf_counter(), len(sys.modules)
+        try:
+            yield
+        finally:
+            self.phases.append((name, (time.perf_counter() - started) * 1000, len(sys.modules) - modules))
+
+    def finish(self):
+        global last_report
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        self.process_age = _process_age()
+        last_report = self
+        if REPORT:
+            print("\n".join(self.lines()), file=sys.stderr, flush=True)
+
+    def lines(self) -> list[str]:
+        process = f", process up {self.process_age:.2f} s" if self.process_age is not None else ""
+        lines = [f"startup ({self.kind}): built in {self.total_ms:.0f} ms{process}, {len(sys.modules)} modules"]
+        lines += [f"  {name:<12} {ms:8.1f} ms  +{modules} modules" for name, ms, modules in self.phases]
+        deferred = [name for name in DEFERRED_MODULES if name not in sys.modules]
+        loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+        if deferred:
+            lines.append(f"  deferred until first use: {', '.join(deferred)}")
+        if loaded:
+            lines.append(f"  already loaded: {', '.join(loaded)}")
+        return lines
+
+
+last_report: StartupReport | None = None
+
+
+# --- Prewarm ----------------------------------------------------------------------------------
+
+def prewarm(dash: bool = True):
+    # Wszystko, co start odkłada do pierwszego żądania: skfuzzy i regulator dla domyślnego zbiornika
+    # (z tablicą wyjść w trybie surface), a w aplikacji Dash pandas/plotly i pierwsze wykresy -
+    # plotly.express dociąga większość modułów dopiero przy pierwszej figurze
+    from app.api.fuzzy_controller_registry import get_fuzzy_controller
+    controller = get_fuzzy_controller(PREWARM_TANK_CAPACITY)
+    if os.getenv("FUZZY_MODE", "exact") == "surface":
+        controller.surface()
+    if dash:
+        from app.callbacks.logic.figure_cache import SimulationFigures
+        day = {"date": "2025-01-01", "water_amount": 0.0, "pumped_up_water": 0.0, "pumped_out_water": 0.0,
+               "saved_water": 0.0, "rainfall_amount": 0.0, "daily_consumption": 0.0}
+        # Obiekt spoza figure_cache - syntetyczny wynik nie zajmuje miejsca w LRU
+        figures = SimulationFigures({"pi_controller_results": [day], "fuzzy_controller_results": [day]}, "prewarm")
+        figures.chart("pi", "static")
+        figures.chart("pi", "animated")
+        figures.comparison("subplots")
+
+
+def _wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_prewarm(port: int | None = None, dash: bool = True) -> threading.Thread | None:
+    # Serwery (werkzeug, uvicorn) nie mają zdarzenia "port otwarty" - wątek czeka, aż port przyjmie
+    # połączenie (najwyżej STARTUP_PREWARM_PORT_WAIT s), żeby nie opóźniać startu nasłuchiwania
+    if not PREWARM:
+        return None
+
+    def run():
+        if port is not None:
+            _wait_for_port(port, PREWARM_PORT_WAIT)
+        started = time.perf_counter()
+        try:
+            prewarm(dash=dash)
+        except Exception as e:
+            # Prewarm to tylko optymalizacja - błąd nie może zatrzymać procesu
+            print(f"startup prewarm failed: {e!r}", file=sys.stderr, flush=True)
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if last_report is not None:
+            last_report.prewarm_ms = elapsed_ms
+        if REPORT:
+            print(f"startup prewarm done in {elapsed_ms:.0f} ms", file=sys.stderr, flush=True)
+
+    thread = threading.Thread(target=run, name="startup-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+@register_collector
+def _startup_metrics() -> list[tuple]:
+    report = last_report
+    if report is None:
+        return []
+    families = [
+        ("app_startup_phase_seconds", "gauge", "Duration of application build phases at startup.",
+         [("", (("phase", name),), ms / 1000) for name, ms, _ in report.phases]),
+        ("app_startup_build_seconds", "gauge", "Duration of the whole application build at startup.",
+         [("", (), report.total_ms / 1000)]),
+    ]
+    if report.process_age is not None:
+        families.append(("app_startup_process_seconds", "gauge",
+                         "Process age when the application finished building (interpreter start and imports).",
+                         [("", (), report.process_age)]))
+    if report.prewarm_ms is not None:
+        families.append(("app_startup_prewarm_seconds", "gauge", "Duration of the background prewarm.",
+                         [("", (), report.prewarm_ms / 1000)]))
+    return families
+
+
+# --- Rozkład czasu importu --------------------------------------------------------------------
+
+def import_time_breakdown(module: str = "app.main") -> tuple[float, dict[str, float], set[str]]:
+    # Czas własny modułów z python -X importtime zsumowany wg pakietu najwyższego poziomu [ms];
+    # import w osobnym procesie, bo w bieżącym moduły są już załadowane
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    packages, modules, total = defaultdict(float), set(), 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+        if not name.startswith("  "):
+            total += int(cumulative_us) / 1000
+    return total, dict(packages), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the application by top-level package.")
+    parser.add_argument("--module", default="app.main", help="module to import (app.main builds the Dash app)")
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    total, packages, modules = import_time_breakdown(args.module)
+    print(f"import {args.module}: {total:.0f} ms")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<32} {ms:8.1f} ms  {ms / total * 100 if total else 0:5.1f}%")
+    loaded = [name for name in DEFERRED_MODULES if name in modules]
+    print(f"deferred modules loaded at import: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
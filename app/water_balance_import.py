@@ -0,0 +1,65 @@
+# app/water_balance_import.py
+# Jednorazowe przeniesienie tabeli water_balance (wyniki PI sprzed simulation_run, jeden wiersz na datę,
+# nadpisywany przez każde żądanie) do simulation_run / simulation_run_day. Tabela nie ma lokalizacji ani
+# parametrów wejściowych, więc całość trafia do jednego przebiegu PI ze source = "water_balance";
+# lokalizację podaje operator. Stara tabela zostaje nietknięta (bez narzędzi do migracji).
+#
+#   python -m app.water_balance_import Poznań
+#   python -m app.water_balance_import Poznań --force   - ponowny import mimo istniejącego przebiegu
+import argparse
+import json
+import sys
+
+from sqlalchemy import MetaData, Table, inspect, select
+
+from app.init_db import create_app, db
+from app.models.simulation_run import DAY_COLUMNS, SimulationRun, SimulationRunDay
+
+LEGACY_TABLE = "water_balance"
+LEGACY_SOURCE = "water_balance"
+
+
+def import_water_balance(location: str, force: bool = False) -> dict | None:
+    # None, gdy nie ma czego importować (brak tabeli, pusta tabela albo import już wykonany)
+    if not inspect(db.engine).has_table(LEGACY_TABLE):
+        return None
+    if not force and SimulationRun.query.filter_by(source=LEGACY_SOURCE).first() is not None:
+        return None
+
+    table = Table(LEGACY_TABLE, MetaData(), autoload_with=db.engine)
+    rows = db.session.execute(select(*(table.c[column] for column in DAY_COLUMNS)).order_by(table.c.date))
+    # Kolumny wyników w water_balance dopuszczały NULL - w przebiegu liczymy je jako zero
+    records = [{column: value if column == "date" or value is not None else 0.0
+                for column, value in row._mapping.items()} for row in rows]
+    if not records:
+        return None
+
+    try:
+        run = SimulationRun(**SimulationRun.run_values(location, "pi", {"imported_from": LEGACY_TABLE}, records,
+                                                       source=LEGACY_SOURCE))
+        db.session.add(run)
+        db.session.flush()
+        db.session.execute(SimulationRunDay.insert_statement(), SimulationRunDay.insert_parameters(run.id, records))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return run.to_json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import legacy water_balance rows as a single PI simulation run.")
+    parser.add_argument("location", help="Location the legacy results were simulated for")
+    parser.add_argument("--force", action="store_true", help="Import again even if an imported run exists")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        run = import_water_balance(args.location, args.force)
+    if run is None:
+        sys.exit("Nothing to import: no water_balance rows, or they were already imported (use --force).")
+    print(json.dumps(run, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Synthetic, seeded inputs for the benchmark suite (benchmarks/suite.py): rainfall forecasts,
+# Visual Crossing style API payloads, tank scenarios and a local stub weather provider.
+import json
+import random
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.api.simulation_service import UserData
+
+START = date(2025, 1, 1)
+# Rozkład opadów dziennych [mm] - ok. 40% dni mokrych, pojedyncze ulewy
+RAIN_AMOUNTS = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.4, 1.5, 3.0, 6.5, 12.0, 25.0)
+
+
+def synthetic_forecast(days: int = 30, seed: int = 0, start: date = START) -> list[tuple[date, float]]:
+    rng = random.Random(seed)
+    return [(start + timedelta(days=i), rng.choice(RAIN_AMOUNTS)) for i in range(days)]
+
+
+def visual_crossing_payload(location: str = "bench", days: int = 30, seed: int = 0) -> dict:
+    # Odpowiedź jak z API: część dni bez opadu (precip None), część śnieg (nie zbierany)
+    rng = random.Random(seed)
+    payload_days = []
+    for day, rainfall_mm in synthetic_forecast(days, seed):
+        snow = rainfall_mm > 0 and rng.random() < 0.1
+        payload_days.append({
+            "datetime": day.isoformat(),
+            "tempmax": round(rng.uniform(-5, 30), 1),
+            "tempmin": round(rng.uniform(-10, 15), 1),
+            "precip": rainfall_mm if rainfall_mm > 0 else rng.choice((0.0, None)),
+            "preciptype": (["snow"] if snow else ["rain"]) if rainfall_mm > 0 else None,
+            "humidity": round(rng.uniform(40, 100), 1),
+            "conditions": "Rain" if rainfall_mm > 0 else "Clear",
+        })
+    return {"address": location, "resolvedAddress": location, "timezone": "Europe/Warsaw", "days": payload_days}
+
+
+def user_data(location: str = "bench", **overrides) -> UserData:
+    values = {"tank_capacity": 1000, "min_water_level": 400, "daily_water_usage": 80, "rooftop_size": 5}
+    values.update(overrides)
+    return UserData(location=location, **values)
+
+
+def scenarios(count: int, seed: int = 0) -> list[UserData]:
+    # Siatka realistycznych zbiorników: pojemność 300-10000 L, dach 10-200 m2
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        capacity = rng.choice((300, 500, 1000, 2000, 5000, 10000))
+        result.append(UserData(
+            tank_capacity=capacity,
+            min_water_level=capacity * rng.choice((0.1, 0.2, 0.4)),
+            daily_water_usage=rng.choice((20, 50, 80, 150, 300)),
+            rooftop_size=rng.choice((10, 25, 50, 100, 200)),
+            location="bench",
+        ))
+    return result
+
+
+def request_body(location: str = "bench", **overrides) -> dict:
+    body = {"tank_capacity": 1000, "min_water_level": 400, "daily_water_usage": 80, "rooftop_size": 5,
+            "location": location}
+    body.update(overrides)
+    return body
+
+
+class StubWeatherProvider:
+    # Lokalny serwer HTTP w formacie Visual Crossing: GET /<miasto>?... -> visual_crossing_payload.
+    # Jedna odpowiedź zbudowana z góry dla każdego miasta - mierzony jest klient i parsowanie, nie dostawca.
+    #
+    #   with StubWeatherProvider(days=30) as provider:
+    #       os.environ.update(provider.environ())
+    def __init__(self, days: int = 30):
+        self.days = days
+        self.requests = 0
+        self._body = json.dumps(visual_crossing_payload("stub", days)).encode()
+        self._server = None
+
+    def __enter__(self):
+        provider = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Nagłówki i treść to osobne zapisy - bez tego Nagle + opóźniony ACK dokładają ~40 ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                provider.requests += 1
+                body = provider._body
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/"
+
+    def environ(self) -> dict:
+        return {"API_BASE_URL": self.base_url, "API_SUFFIX": "?unitGroup=metric", "API_KEY": "stub"}
@@ -0,0 +1,186 @@
+# Load test of the ASGI /api/simulation endpoint (app/asgi.py) against a local fake weather
+# provider that answers after an injected delay. Reports throughput, latency percentiles, the
+# peak number of requests in flight at the provider and the server's peak OS thread count.
+#
+#   python -m benchmarks.load_async_simulation [--requests 1000] [--concurrency 300] [--latency 1.0]
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import unquote
+
+import aiohttp
+import uvicorn
+
+
+class FakeWeatherProvider:
+    # Minimalny dostawca w formacie Visual Crossing: /<miasto>?... -> {"days": [...]} po `latency` s
+    def __init__(self, latency: float, days: int = 30):
+        self.latency = latency
+        self.days = days
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.served = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            location = unquote(scope["path"].strip("/"))
+            start = date(2025, 1, 1)
+            payload = json.dumps({
+                "address": location,
+                "days": [
+                    {"datetime": (start + timedelta(days=i)).isoformat(), "precip": float((i * 7) % 11),
+                     "preciptype": ["rain"]}
+                    for i in range(self.days)
+                ],
+            }).encode()
+            await send({"type": "http.response.start", "status": 200,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": payload})
+            self.served += 1
+        finally:
+            self.in_flight -= 1
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_provider(provider: FakeWeatherProvider, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(provider, host="127.0.0.1", port=port, log_level="warning",
+                                           backlog=4096, lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _thread_count(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+async def _wait_until_ready(client: aiohttp.ClientSession, url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with client.get(f"{url}/connection") as response:
+                await response.read()
+            return
+        except aiohttp.ClientConnectionError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time.")
+
+
+async def _run_load(url: str, requests: int, concurrency: int, controllers: list[str], server_pid: int) -> dict:
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as client:
+        await _wait_until_ready(client, url)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, statuses = [], {}
+        peak_threads = 0
+
+        async def one(i: int):
+            body = {"tank_capacity": 1000, "min_water_level": 400, "daily_water_usage": 80, "rooftop_size": 5,
+                    "location": f"city-{i}", "controllers": controllers}  # Różne miasta - bez łączenia w cache
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with client.post(f"{url}/api/simulation", json=body) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while True:
+                peak_threads = max(peak_threads, _thread_count(server_pid) or 0)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_threads())
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "latency_p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "server_peak_threads": peak_threads or None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=1.0, help="Injected provider latency in seconds")
+    parser.add_argument("--controllers", default="pi", help="Comma-separated controllers per request")
+    parser.add_argument("--database-url", help="Defaults to a temporary SQLite file")
+    args = parser.parse_args()
+
+    provider = FakeWeatherProvider(args.latency)
+    provider_port, app_port = _free_port(), _free_port()
+    provider_server = _start_provider(provider, provider_port)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "API_BASE_URL": f"http://127.0.0.1:{provider_port}/",
+            "API_SUFFIX": "?unitGroup=metric",
+            "API_KEY": "fake",
+            "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}",
+            "WEATHER_HTTP_ASYNC_MAX_CONNECTIONS": str(max(args.concurrency, 1)),
+            "WEATHER_HTTP_READ_TIMEOUT": str(args.latency * 10 + 10),
+        }
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.asgi:app", "--host", "127.0.0.1", "--port", str(app_port),
+             "--log-level", "warning", "--backlog", "4096"],
+            env=env,
+        )
+        try:
+            result = asyncio.run(_run_load(f"http://127.0.0.1:{app_port}", args.requests, args.concurrency,
+                                           args.controllers.split(","), server.pid))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            provider_server.should_exit = True
+
+    result["provider_latency_s"] = args.latency
+    result["provider_peak_in_flight"] = provider.peak_in_flight
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
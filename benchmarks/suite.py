@@ -0,0 +1,437 @@
+# Benchmark suite for the hot paths: controller simulations (PI, fuzzy, vectorized PI), forecast
+# parsing and fetching, run persistence, result cache keys and end-to-end POST /api/simulation
+# against a stub weather provider (benchmarks/fixtures.py) and a temporary SQLite database, plus
+# process cold start (importing app.main in a fresh interpreter).
+#
+#   python -m benchmarks.suite list
+#   python -m benchmarks.suite run [-k PATTERN] [--quick] [--output results.json] [--save-baseline NAME]
+#   python -m benchmarks.suite compare BASELINE [--current results.json] [-k PATTERN] [--threshold 0.10]
+#
+# BASELINE is a path or a name under benchmarks/baselines/ (NAME.json). Baselines are machine
+# specific - record one on the machine that runs the comparison, e.g. before a change:
+#   python -m benchmarks.suite run --save-baseline main
+# and after it:
+#   python -m benchmarks.suite compare main
+# baselines/reference.json is a committed full run (1 CPU Linux x86_64, Python 3.11) - useful to see
+# orders of magnitude and which benchmarks exist, not as a regression gate on other machines.
+# compare exits with status 1 when any benchmark's median is slower than the baseline by more
+# than the threshold and by more than the combined spread (IQR) of both runs.
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+SCHEMA_VERSION = 1
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    # setup(context) przygotowuje dane poza pomiarem i zwraca mierzoną funkcję bez argumentów
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+class Context:
+    # Wspólne zasoby benchmarków tworzone przy pierwszym użyciu: aplikacja Flask na tymczasowej bazie
+    # SQLite i lokalny dostawca pogody
+    def __init__(self, workdir: str):
+        self.workdir = workdir
+        self._provider = None
+        self._app = None
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            from benchmarks.fixtures import StubWeatherProvider
+            self._provider = StubWeatherProvider(days=30).__enter__()
+            os.environ.update(self._provider.environ())
+        return self._provider
+
+    @property
+    def app(self):
+        if self._app is None:
+            from app.init_db import create_app
+            self.provider
+            self._app = create_app()
+            self._app.app_context().push()
+        return self._app
+
+    def close(self):
+        if self._provider is not None:
+            self._provider.__exit__(None, None, None)
+
+
+def _prepare_environment(workdir: str):
+    # Przed importem aplikacji: konfiguracja czytana na poziomie modułów (cache, pula wątków)
+    os.environ.update({
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        "JOB_WORKERS": "0",
+        "RAINFALL_ARCHIVE_DIR": os.path.join(workdir, "rainfall_archive"),
+    })
+    os.environ.setdefault("SIMULATION_EXECUTOR", "thread")
+    os.environ.setdefault("FUZZY_MODE", "exact")
+
+
+# --- Symulacje --------------------------------------------------------------------------------
+
+@benchmark("simulation.pi[30d]")
+def _pi_30(context):
+    from app.api.simulation_service import run_water_simulation
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    user, forecast = user_data(), synthetic_forecast(30)
+    return lambda: run_water_simulation(user, forecast, horizon=30)
+
+
+@benchmark("simulation.pi[365d]")
+def _pi_365(context):
+    from app.api.simulation_service import run_water_simulation
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    user, forecast = user_data(), synthetic_forecast(365)
+    return lambda: run_water_simulation(user, forecast, horizon=365)
+
+
+@benchmark("simulation.fuzzy_exact[30d]")
+def _fuzzy_exact_30(context):
+    from app.api.simulation_service import run_water_simulation_fuzzy
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    user, forecast = user_data(), synthetic_forecast(30)
+    run_water_simulation_fuzzy(user, forecast, fuzzy_mode="exact", horizon=30)  # Budowa regulatora poza pomiarem
+    return lambda: run_water_simulation_fuzzy(user, forecast, fuzzy_mode="exact", horizon=30)
+
+
+@benchmark("simulation.fuzzy_surface[30d]")
+def _fuzzy_surface_30(context):
+    from app.api.simulation_service import run_water_simulation_fuzzy
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    user, forecast = user_data(), synthetic_forecast(30)
+    run_water_simulation_fuzzy(user, forecast, fuzzy_mode="surface", horizon=30)
+    return lambda: run_water_simulation_fuzzy(user, forecast, fuzzy_mode="surface", horizon=30)
+
+
+@benchmark("simulation.pi_batch[1000x365d]")
+def _pi_batch(context):
+    from app.api.batch_simulation_service import BatchScenarios, run_water_simulation_batch
+    from benchmarks.fixtures import scenarios, synthetic_forecast
+    batch = BatchScenarios.from_user_data(scenarios(1000))
+    rainfall = [rainfall_mm for _, rainfall_mm in synthetic_forecast(365)]
+    return lambda: run_water_simulation_batch(batch, rainfall)
+
+
+# --- Prognoza ---------------------------------------------------------------------------------
+
+@benchmark("forecast.parse[30d]")
+def _forecast_parse(context):
+    from app.api.weather_data_service import _parse_rainfall_forecast
+    from benchmarks.fixtures import visual_crossing_payload
+    context.app
+    payload = visual_crossing_payload(days=30)
+    return lambda: _parse_rainfall_forecast(payload, "bench", 30)
+
+
+@benchmark("forecast.fetch_uncached[30d]")
+def _forecast_fetch(context):
+    # Klient HTTP (pula połączeń, retry) + dekodowanie JSON + parsowanie, bez cache prognoz
+    from app.api.weather_data_service import fetch_rainfall_forecast
+    context.app
+    return lambda: fetch_rainfall_forecast("bench", days=30, use_cache=False)
+
+
+# --- Zapis i cache ----------------------------------------------------------------------------
+
+@benchmark("persist.run[30d]")
+def _persist_run(context):
+    from app.api.simulation_request_service import persist_run
+    from app.api.simulation_service import run_water_simulation
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    context.app
+    user = user_data()
+    records = run_water_simulation(user, synthetic_forecast(30), horizon=30)
+    return lambda: persist_run(user, "pi", records, 30, {})
+
+
+@benchmark("persist.run[10y]")
+def _persist_run_long(context):
+    # Wieloletni przebieg (np. backtest na archiwum) - koszt executemany wierszy dziennych
+    from app.api.simulation_request_service import persist_run
+    from app.api.simulation_service import run_water_simulation
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    context.app
+    user = user_data()
+    records = run_water_simulation(user, synthetic_forecast(3650), horizon=3650)
+    return lambda: persist_run(user, "pi", records, 3650, {})
+
+
+@benchmark("result_cache.key[30d]")
+def _result_key(context):
+    from app.api.result_cache import result_key
+    from benchmarks.fixtures import synthetic_forecast, user_data
+    user, forecast = user_data(), synthetic_forecast(30)
+    return lambda: result_key(user, ["pi", "fuzzy"], {}, 30, forecast)
+
+
+# --- End-to-end POST /api/simulation ----------------------------------------------------------
+
+def _post(client, body: dict):
+    response = client.post("/api/simulation", json=body)
+    if response.status_code != 200:
+        raise RuntimeError(f"/api/simulation returned {response.status_code}: {response.get_data(as_text=True)}")
+
+
+@benchmark("e2e.simulation[cold]")
+def _e2e_cold(context):
+    # Nowe miasto w każdym wywołaniu: pobranie i parsowanie prognozy, PI + rozmyty, zapis przebiegu
+    from benchmarks.fixtures import request_body
+    client = context.app.test_client()
+    counter = itertools.count()
+    return lambda: _post(client, request_body(f"cold-{next(counter)}", use_cache=False))
+
+
+@benchmark("e2e.simulation[forecast_cached]")
+def _e2e_forecast_cached(context):
+    # Prognoza z cache, wynik liczony od nowa (use_cache: false) i zapisywany
+    from benchmarks.fixtures import request_body
+    client = context.app.test_client()
+    body = request_body("warm", use_cache=False)
+    _post(client, body)
+    return lambda: _post(client, body)
+
+
+@benchmark("e2e.simulation[result_cached]")
+def _e2e_result_cached(context):
+    from benchmarks.fixtures import request_body
+    client = context.app.test_client()
+    body = request_body("warm")
+    _post(client, body)
+    return lambda: _post(client, body)
+
+
+# --- Start procesu ----------------------------------------------------------------------------
+
+
+@benchmark("startup.import[app.main]")
+def _startup_import(context):
+    # Zimny start w nowym interpreterze: importy i create_dash_app (bez serwera i prewarm)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return lambda: subprocess.run([sys.executable, "-c", "import app.main"], cwd=root, check=True,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+# --- Pomiar -----------------------------------------------------------------------------------
+
+def _time_loops(function, loops: int) -> float:
+    started = time.perf_counter()
+    for _ in range(loops):
+        function()
+    return time.perf_counter() - started
+
+
+def measure(function, rounds: int, min_round_time: float, warmup: int = 1) -> dict:
+    # Liczba wywołań na rundę dobierana tak, żeby runda trwała co najmniej min_round_time;
+    # wynik rundy to średni czas wywołania, statystyki po rundach
+    for _ in range(warmup):
+        function()
+    loops = 1
+    while True:
+        elapsed = _time_loops(function, loops)
+        if elapsed >= min_round_time or loops >= 1_000_000:
+            break
+        loops = min(1_000_000, max(loops * 2, int(loops * min_round_time / max(elapsed, 1e-9) * 1.1)))
+
+    samples = [_time_loops(function, loops) / loops * 1000 for _ in range(rounds)]
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 else [samples[0]] * 3
+    return {
+        "median_ms": round(statistics.median(samples), 6),
+        "min_ms": round(min(samples), 6),
+        "max_ms": round(max(samples), 6),
+        "iqr_ms": round(quartiles[2] - quartiles[0], 6),
+        "rounds": rounds,
+        "loops": loops,
+    }
+
+
+def _selected(patterns: list[str] | None) -> list[str]:
+    if not patterns:
+        return list(BENCHMARKS)
+    # Podciąg nazwy albo wzorzec glob (nazwy zawierają [..], więc najpierw zwykłe dopasowanie)
+    return [name for name in BENCHMARKS
+            if any(pattern in name or fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(patterns: list[str] | None = None, quick: bool = False) -> dict:
+    names = _selected(patterns)
+    if not names:
+        raise SystemExit(f"No benchmarks match {patterns}; see 'python -m benchmarks.suite list'.")
+    rounds, min_round_time = (5, 0.05) if quick else (15, 0.2)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        _prepare_environment(workdir)
+        context = Context(workdir)
+        try:
+            for name in names:
+                function = BENCHMARKS[name](context)
+                results[name] = measure(function, rounds, min_round_time)
+                print(f"{name:<36} median {_format_ms(results[name]['median_ms']):>10}  "
+                      f"iqr {_format_ms(results[name]['iqr_ms']):>10}  ({rounds} x {results[name]['loops']})",
+                      file=sys.stderr)
+        finally:
+            context.close()
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "created": datetime.utcnow().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+        },
+        "benchmarks": results,
+    }
+
+
+# --- Porównanie -------------------------------------------------------------------------------
+
+def _format_ms(value: float) -> str:
+    if value < 1:
+        return f"{value * 1000:.1f} us"
+    return f"{value:.2f} ms"
+
+
+def _baseline_path(name_or_path: str) -> str:
+    if os.path.exists(name_or_path):
+        return name_or_path
+    return os.path.join(BASELINE_DIR, f"{name_or_path}.json")
+
+
+def load_results(name_or_path: str) -> dict:
+    path = _baseline_path(name_or_path)
+    try:
+        with open(path) as file:
+            results = json.load(file)
+    except FileNotFoundError:
+        raise SystemExit(f"Baseline not found: {path}")
+    if results.get("schema") != SCHEMA_VERSION:
+        raise SystemExit(f"{path}: unsupported results schema {results.get('schema')!r}")
+    return results
+
+
+def save_results(results: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> tuple[list[dict], bool]:
+    # Porównanie median: wolniej o więcej niż threshold = regresja, szybciej o więcej = poprawa.
+    # Różnica mniejsza niż suma rozrzutów (IQR) obu pomiarów to szum - raportowana, ale nie jest regresją.
+    rows, regressed = [], False
+    for name, result in current["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if previous is None:
+            rows.append({"name": name, "baseline": None, "current": result["median_ms"], "change": None,
+                         "status": "new"})
+            continue
+        ratio = result["median_ms"] / previous["median_ms"] if previous["median_ms"] else float("inf")
+        noise = previous.get("iqr_ms", 0) + result.get("iqr_ms", 0)
+        if ratio > 1 + threshold and result["median_ms"] - previous["median_ms"] <= noise:
+            status = "slower (noisy)"
+        elif ratio > 1 + threshold:
+            status = "REGRESSION"
+            regressed = True
+        elif ratio < 1 / (1 + threshold):
+            status = "improved"
+        else:
+            status = "unchanged"
+        rows.append({"name": name, "baseline": previous["median_ms"], "current": result["median_ms"],
+                     "change": ratio - 1, "status": status})
+    return rows, regressed
+
+
+def print_report(rows: list[dict], baseline: dict, current: dict, threshold: float):
+    print(f"baseline: {baseline['meta'].get('commit')} ({baseline['meta'].get('created')}, "
+          f"{baseline['meta'].get('platform')})")
+    print(f"current:  {current['meta'].get('commit')} ({current['meta'].get('created')}, "
+          f"{current['meta'].get('platform')})")
+    if baseline["meta"].get("platform") != current["meta"].get("platform"):
+        print("warning: results come from different platforms; timings may not be comparable")
+    print(f"threshold: {threshold:.0%} on the median\n")
+    print(f"{'benchmark':<36} {'baseline':>12} {'current':>12} {'change':>9}  status")
+    for row in rows:
+        baseline_ms = _format_ms(row["baseline"]) if row["baseline"] is not None else "-"
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+        print(f"{row['name']:<36} {baseline_ms:>12} {_format_ms(row['current']):>12} {change:>9}  {row['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation, forecast and persistence hot paths.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List benchmark names")
+
+    run_parser = commands.add_parser("run", help="Run benchmarks and print or save the results")
+    run_parser.add_argument("-k", dest="patterns", action="append", help="Run benchmarks matching the pattern")
+    run_parser.add_argument("--quick", action="store_true", help="Fewer and shorter rounds")
+    run_parser.add_argument("--output", help="Write results JSON to this path")
+    run_parser.add_argument("--save-baseline", metavar="NAME", help=f"Write results to {BASELINE_DIR}/NAME.json")
+
+    compare_parser = commands.add_parser("compare", help="Compare results with a baseline")
+    compare_parser.add_argument("baseline", help="Baseline name or results JSON path")
+    compare_parser.add_argument("--current", help="Results JSON to compare; runs the suite when omitted")
+    compare_parser.add_argument("-k", dest="patterns", action="append")
+    compare_parser.add_argument("--quick", action="store_true")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative slowdown of the median reported as a regression (default 0.10)")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in BENCHMARKS:
+            print(name)
+        return
+
+    if args.command == "run":
+        results = run_suite(args.patterns, args.quick)
+        if args.output:
+            save_results(results, args.output)
+        if args.save_baseline:
+            save_results(results, _baseline_path(args.save_baseline))
+        if not args.output and not args.save_baseline:
+            print(json.dumps(results, indent=2, sort_keys=True))
+        return
+
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    else:
+        # Domyślnie te same benchmarki, które są w bazie odniesienia
+        current = run_suite(args.patterns or list(baseline["benchmarks"]), args.quick)
+    rows, regressed = compare(baseline, current, args.threshold)
+    print_report(rows, baseline, current, args.threshold)
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
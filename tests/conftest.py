@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+import pytest
+
+# Konfiguracja czytana na poziomie modułów - ustawiana przed importem aplikacji
+_workdir = tempfile.mkdtemp(prefix="tank-tests-")
+os.environ.update({
+    "JOB_WORKERS": "0",
+    "RAINFALL_ARCHIVE_DIR": os.path.join(_workdir, "rainfall_archive"),
+    "SIMULATION_EXECUTOR": "thread",
+    "METRICS_ENABLED": "false",
+    "PROFILING_MODE": "off",
+})
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Aplikacja API (bez Dash) na osobnej bazie SQLite dla każdego testu
+    monkeypatch.setenv("DATABASE_URL", "sqlite:///" + str(tmp_path / "test.db"))
+    from app.init_db import create_app, db
+    application = create_app()
+    with application.app_context():
+        yield application
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,45 @@
+import pytest
+from dash.exceptions import PreventUpdate
+
+from app.callbacks.logic import simulation_store
+from app.callbacks.logic.figure_cache import FigureCache, result_digest
+
+
+def _results(water: float) -> dict:
+    day = {"date": "2025-01-01", "water_amount": water}
+    return {"pi_controller_results": [day], "fuzzy_controller_results": [day]}
+
+
+def test_lookup_rebuilds_evicted_figures_from_stored_result():
+    cache = FigureCache(max_entries=1, max_results=4)
+    first = cache.get(_results(1.0))
+    cache.get(_results(2.0))
+
+    rebuilt = cache.lookup(first.digest)
+    assert rebuilt is not first and rebuilt.digest == first.digest
+    assert rebuilt._results == _results(1.0)
+    stats = cache.stats()
+    assert (stats["evictions"], stats["rebuilds"], stats["results"]) == (2, 1, 2)
+
+
+def test_lookup_misses_once_result_store_is_full():
+    cache = FigureCache(max_entries=1, max_results=2)
+    digests = [cache.get(_results(float(i))).digest for i in range(3)]
+
+    assert cache.lookup(digests[0]) is None
+    assert cache.lookup(digests[2]) is not None
+
+
+def test_stored_figures_never_resimulates(monkeypatch):
+    monkeypatch.setattr(simulation_store, "figure_cache", FigureCache(max_entries=1, max_results=1))
+
+    with pytest.raises(PreventUpdate):
+        simulation_store.stored_figures({"key": result_digest(_results(1.0))})
+
+
+def test_client_store_mode_is_the_default():
+    # Wiele procesów bez sticky sessions - przeglądarka musi mieć pełny wynik
+    assert simulation_store.STORE_MODE == "client"
+    figures = FigureCache(max_entries=1, max_results=1).get(_results(1.0))
+    assert simulation_store.store_data(figures, _results(1.0)) == _results(1.0)
+    assert simulation_store.stored_figures(_results(1.0)).digest == figures.digest
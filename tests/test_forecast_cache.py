@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+
+from app.api.forecast_cache import ForecastCache
+
+FORECAST = [(date(2025, 1, 1), 2.5)]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_fresh_entry_is_served_from_cache():
+    cache = ForecastCache(ttl=60, max_entries=8)
+    calls = []
+    fetch = lambda: calls.append(1) or FORECAST
+    assert cache.get_or_fetch(("poznań", 30), fetch) == FORECAST
+    assert cache.get_or_fetch(("poznań", 30), fetch) == FORECAST
+    assert len(calls) == 1
+
+
+def test_empty_forecast_is_not_cached():
+    cache = ForecastCache(ttl=60, max_entries=8)
+    responses = [[], FORECAST]
+    fetch = lambda: responses.pop(0)
+    assert cache.get_or_fetch(("poznań", 30), fetch) == []
+    assert cache.get_or_fetch(("poznań", 30), fetch) == FORECAST
+    assert cache.stats()["size"] == 1
+
+
+def test_empty_forecast_falls_back_to_stale_entry():
+    clock = _Clock()
+    cache = ForecastCache(ttl=60, max_entries=8, clock=clock)
+    cache.get_or_fetch(("poznań", 30), lambda: FORECAST)
+    clock.now = 120
+    assert cache.get_or_fetch(("poznań", 30), lambda: []) == FORECAST
+    assert cache.stats()["stale_served"] == 1
+
+
+def test_empty_forecast_is_not_cached_async():
+    cache = ForecastCache(ttl=60, max_entries=8)
+    responses = [[], FORECAST]
+
+    async def fetch():
+        return responses.pop(0)
+
+    async def scenario():
+        return [await cache.get_or_fetch_async(("poznań", 30), fetch) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [[], FORECAST, FORECAST]
+
+
+def test_sync_and_async_requests_share_one_fetch():
+    import threading
+
+    cache = ForecastCache(ttl=60, max_entries=8)
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def fetch():
+        calls.append("sync")
+        started.set()
+        release.wait(5)
+        return FORECAST
+
+    owner = threading.Thread(target=lambda: cache.get_or_fetch(("poznań",), fetch))
+    owner.start()
+    started.wait(5)
+
+    async def fetch_async():
+        calls.append("async")
+        return FORECAST
+
+    async def scenario():
+        waiter = asyncio.ensure_future(cache.get_or_fetch_async(("poznań",), fetch_async))
+        await asyncio.sleep(0.01)
+        release.set()
+        return await waiter
+
+    assert asyncio.run(scenario()) == FORECAST
+    owner.join()
+    assert calls == ["sync"]
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_forecast_is_cached_once_per_location_for_any_horizon(app, monkeypatch):
+    from app.api import weather_data_service
+    from app.api.forecast_cache import forecast_cache
+
+    full_window = [(date(2025, 1, day), float(day)) for day in range(1, 16)]
+    calls = []
+    monkeypatch.setattr(weather_data_service, "_fetch_rainfall_forecast_uncached",
+                        lambda location, days: calls.append(days) or full_window)
+    forecast_cache.invalidate()
+
+    assert weather_data_service.fetch_rainfall_forecast("Poznań", days=5) == full_window[:5]
+    assert weather_data_service.fetch_rainfall_forecast(" poznań ", days=30) == full_window
+    assert calls == [None]
+    forecast_cache.invalidate()
@@ -0,0 +1,59 @@
+import asyncio
+
+from app.api import http_session
+from app.api.http_session import CircuitBreaker
+
+HOST = "breaker.test"
+
+
+class _HangingClient:
+    # Odpowiedź, która nigdy nie przychodzi - żądanie kończy się dopiero anulowaniem
+    def get(self, url, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _half_open_breaker() -> CircuitBreaker:
+    breaker, _ = http_session._host_state(HOST)
+    breaker.state, breaker.opened_at, breaker.consecutive_failures = "open", 0.0, breaker.failure_threshold
+    return breaker
+
+
+def test_cancelled_half_open_trial_releases_the_breaker(monkeypatch):
+    monkeypatch.setattr(http_session, "get_async_client", lambda: _HangingClient())
+    breaker = _half_open_breaker()
+
+    async def scenario():
+        trial = asyncio.ensure_future(http_session.async_http_get(f"http://{HOST}/forecast"))
+        await asyncio.sleep(0.01)
+        assert breaker.snapshot()["state"] == "half_open"
+        trial.cancel()
+        try:
+            await trial
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    # Kolejne żądanie dostaje nową próbę zamiast CircuitOpenError
+    assert breaker.allow_request()
+    breaker.record_success()
+
+
+def test_unexpected_error_in_half_open_trial_releases_the_breaker(monkeypatch):
+    def broken_get(url, **kwargs):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(http_session, "get_session", lambda: type("Session", (), {"get": staticmethod(broken_get)}))
+    breaker = _half_open_breaker()
+
+    try:
+        http_session.http_get(f"http://{HOST}/forecast")
+    except RuntimeError:
+        pass
+    assert breaker.allow_request()
+    breaker.record_success()
@@ -0,0 +1,113 @@
+import threading
+import uuid
+
+from app.init_db import db
+import app.api.job_service as job_service
+from app.api.job_service import _JobProgress, claim_next_job, run_job
+from app.models.simulation_job import SimulationJob
+
+
+def _queue_job() -> str:
+    job = SimulationJob(id=uuid.uuid4().hex, kind="simulation", status="queued", params={}, progress=0.0)
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_claim_next_job_marks_job_running(app):
+    job_id = _queue_job()
+    assert claim_next_job("worker-a") == job_id
+    assert claim_next_job("worker-b") is None
+
+    job = db.session.get(SimulationJob, job_id)
+    assert (job.status, job.worker) == ("running", "worker-a")
+
+
+def test_concurrent_workers_claim_each_job_once(app):
+    job_ids = {_queue_job() for _ in range(5)}
+    claims, lock = [], threading.Lock()
+    start = threading.Barrier(8)
+
+    def worker(index: int):
+        with app.app_context():
+            start.wait()
+            while True:
+                job_id = claim_next_job(f"worker-{index}")
+                if job_id is None:
+                    break
+                with lock:
+                    claims.append((job_id, f"worker-{index}"))
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(job_id for job_id, _ in claims) == sorted(job_ids)
+    db.session.expire_all()
+    for job_id, worker_name in claims:
+        assert db.session.get(SimulationJob, job_id).worker == worker_name
+
+
+def _claimed_job(monkeypatch, handler) -> str:
+    monkeypatch.setitem(job_service.JOB_HANDLERS, "simulation", handler)
+    job_id = _queue_job()
+    assert claim_next_job("worker-a") == job_id
+    return job_id
+
+
+def _reclaim(job_id: str, worker: str):
+    # Zadanie wróciło do kolejki po braku bicia serca i przejął je inny proces
+    SimulationJob.query.filter_by(id=job_id).update({"worker": worker})
+    db.session.commit()
+
+
+def test_run_job_does_not_overwrite_job_reclaimed_by_another_worker(app, monkeypatch):
+    def handler(job_id, worker, params):
+        _reclaim(job_id, "worker-b")
+        return {"total": 1}
+
+    job_id = _claimed_job(monkeypatch, handler)
+    run_job(job_id, "worker-a")
+
+    db.session.expire_all()
+    job = db.session.get(SimulationJob, job_id)
+    assert (job.status, job.worker, job.result, job.finished_at) == ("running", "worker-b", None, None)
+
+
+def test_heartbeat_stops_job_reclaimed_by_another_worker(app, monkeypatch):
+    reached = []
+
+    def handler(job_id, worker, params):
+        _reclaim(job_id, "worker-b")
+        _JobProgress(job_id, worker, 10).report()
+        reached.append(True)
+        return {"total": 1}
+
+    job_id = _claimed_job(monkeypatch, handler)
+    run_job(job_id, "worker-a")
+
+    db.session.expire_all()
+    assert not reached
+    assert db.session.get(SimulationJob, job_id).status == "running"
+
+
+def test_cancel_after_last_heartbeat_wins_over_success(app, monkeypatch):
+    def handler(job_id, worker, params):
+        job_service.cancel_job(job_id)
+        return {"total": 1}
+
+    job_id = _claimed_job(monkeypatch, handler)
+    run_job(job_id, "worker-a")
+
+    db.session.expire_all()
+    job = db.session.get(SimulationJob, job_id)
+    assert (job.status, job.result) == ("cancelled", None)
+    assert job.finished_at is not None
+
+
+def test_web_process_runs_no_job_workers_by_default(app, monkeypatch):
+    monkeypatch.delenv("JOB_WORKERS", raising=False)
+    assert job_service.ensure_job_workers(app) is None
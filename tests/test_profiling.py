@@ -0,0 +1,111 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from app.api import profiling
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_admin_profiles_hidden_without_token(client, monkeypatch):
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", None)
+
+    assert client.get("/admin/profiles").status_code == 404
+    assert client.get("/admin/profiles", headers={profiling.PROFILE_HEADER: ""}).status_code == 404
+
+
+def test_admin_profiles_hidden_when_profiling_is_off(client, monkeypatch):
+    monkeypatch.setattr(profiling, "TOKEN", "s3cret")
+
+    assert client.get("/admin/profiles", headers={profiling.PROFILE_HEADER: "s3cret"}).status_code == 404
+
+
+def test_admin_profiles_require_token_header(client, monkeypatch):
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", "s3cret")
+
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={profiling.PROFILE_HEADER: "wrong"}).status_code == 403
+    assert client.get("/admin/profiles?token=s3cret").status_code == 403
+    assert client.get("/admin/profiles", headers={profiling.PROFILE_HEADER: "s3cret"}).status_code == 200
+
+
+def test_forced_profile_needs_configured_token(monkeypatch):
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", None)
+    assert profiling.start_request("GET", "/connection", "anything") is None
+
+
+def test_unknown_mode_is_rejected(monkeypatch):
+    monkeypatch.setenv("PROFILING_MODE", "cprofil")
+    with pytest.raises(ValueError):
+        profiling._mode()
+
+
+def _stub_forecast(monkeypatch):
+    from app.api import simulation_request_service
+
+    forecast = [(date(2025, 1, 1) + timedelta(days=i), float(i % 4)) for i in range(30)]
+    monkeypatch.setattr(simulation_request_service, "fetch_rainfall_forecast", lambda location, days=30: forecast)
+
+
+SIMULATION = {"location": "Poznań", "tank_capacity": 1000, "min_water_level": 300, "daily_water_usage": 80,
+              "rooftop_size": 10, "controllers": ["pi", "fuzzy"], "use_cache": False}
+
+
+@pytest.mark.parametrize("process_wide", [False, True])
+def test_profiled_simulation_with_thread_executor(client, monkeypatch, process_wide):
+    # Regulator rozmyty w puli wątków dołącza do profilu (propagate) - na 3.12+ bez drugiego profilera
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROCESS_WIDE_PROFILER", process_wide)
+    profiling.profile_store.clear()
+    _stub_forecast(monkeypatch)
+
+    response = client.post("/api/simulation", json=SIMULATION, headers={profiling.PROFILE_HEADER: "s3cret"})
+    assert response.status_code == 200
+    assert len(response.get_json()["fuzzy_controller_results"]) == 30
+    [entry] = profiling.profile_store.list()
+    assert (entry["path"], entry["status"], entry["forced"]) == ("/api/simulation", 200, True)
+    assert not profiling._process_profile_lock.locked()
+
+
+def test_process_wide_profiler_profiles_one_request_at_a_time(monkeypatch):
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROCESS_WIDE_PROFILER", True)
+
+    first = profiling.start_request("POST", "/api/simulation", "s3cret")
+    # Drugie żądanie (inny wątek) w trakcie profilu - bez profilu zamiast błędu
+    second = []
+    worker = threading.Thread(target=lambda: second.append(profiling.start_request("POST", "/api/simulation",
+                                                                                   "s3cret")))
+    worker.start()
+    worker.join()
+    assert first is not None and second == [None]
+
+    profiling.finish_request(first, 200)
+    third = profiling.start_request("POST", "/api/simulation", "s3cret")
+    assert third is not None
+    profiling.finish_request(third, 200)
+
+
+def test_request_runs_unprofiled_when_profiler_is_taken(client, monkeypatch):
+    class TakenProfile:
+        def enable(self):
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr(profiling, "MODE", "cprofile")
+    monkeypatch.setattr(profiling, "TOKEN", "s3cret")
+    monkeypatch.setattr(profiling.cProfile, "Profile", TakenProfile)
+    profiling.profile_store.clear()
+    _stub_forecast(monkeypatch)
+
+    response = client.post("/api/simulation", json=SIMULATION, headers={profiling.PROFILE_HEADER: "s3cret"})
+    assert response.status_code == 200
+    assert profiling.profile_store.list() == []
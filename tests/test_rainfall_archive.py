@@ -0,0 +1,44 @@
+import math
+from datetime import date
+
+import pytest
+
+from app.api.rainfall_archive import (RainfallArchive, RainfallArchiveError, parse_rainfall_csv,
+                                      parse_rainfall_json)
+
+
+def test_blank_value_in_reimport_keeps_existing_measurement(tmp_path):
+    archive = RainfallArchive(str(tmp_path))
+    archive.import_records("Poznań", parse_rainfall_csv("date,rainfall_mm\n2025-01-01,1.5\n2025-01-02,\n"))
+    archive.import_records("Poznań", parse_rainfall_csv("date,rainfall_mm\n2025-01-01,\n2025-01-02,2.25\n"))
+
+    series = archive.series("Poznań")
+    assert list(series) == [(date(2025, 1, 1), 1.5), (date(2025, 1, 2), 2.25)]
+
+
+def test_blank_value_for_new_day_is_missing(tmp_path):
+    archive = RainfallArchive(str(tmp_path))
+    info = archive.import_records("Poznań", parse_rainfall_csv("date,rainfall_mm\n2025-01-01,\n2025-01-02,0.5\n"))
+
+    assert info["missing_days"] == 1
+    with pytest.raises(RainfallArchiveError):
+        archive.series("Poznań")
+
+
+def test_visual_crossing_snow_is_not_rainfall():
+    records = parse_rainfall_json({"days": [
+        {"datetime": "2025-01-01", "precip": 4.0, "preciptype": ["snow"]},
+        {"datetime": "2025-01-02", "precip": 3.0, "preciptype": ["rain", "snow"]},
+        {"datetime": "2025-01-03", "precip": 2.0, "preciptype": None},
+        {"datetime": "2025-01-04", "precip": None, "preciptype": ["snow"]},
+    ]})
+
+    assert records[:3] == [(date(2025, 1, 1), 0.0), (date(2025, 1, 2), 3.0), (date(2025, 1, 3), 2.0)]
+    assert math.isnan(records[3][1])
+
+
+def test_visual_crossing_csv_export_applies_preciptype():
+    records = parse_rainfall_csv("datetime,precip,preciptype\n2025-01-01,4.0,snow\n2025-01-02,3.0,\"rain,snow\"\n"
+                                 "2025-01-03,2.0,\n")
+
+    assert records == [(date(2025, 1, 1), 0.0), (date(2025, 1, 2), 3.0), (date(2025, 1, 3), 2.0)]
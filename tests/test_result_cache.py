@@ -0,0 +1,85 @@
+from datetime import date
+
+from app.api.result_cache import ResultCache, result_key
+from app.api.simulation_service import UserData
+from app.models.simulation_result_cache import SimulationResultCache
+
+FORECAST = [(date(2025, 1, 1), 0.0), (date(2025, 1, 2), 4.5)]
+
+
+def _user_data(**overrides) -> UserData:
+    values = {"tank_capacity": 1000, "min_water_level": 300, "daily_water_usage": 80, "rooftop_size": 10,
+              "location": "Poznań"}
+    values.update(overrides)
+    return UserData(**values)
+
+
+def test_result_key_depends_on_inputs_and_forecast():
+    key = result_key(_user_data(), ["pi", "fuzzy"], {}, 30, FORECAST)
+    assert key == result_key(_user_data(location=" poznań "), ["fuzzy", "pi"], {}, 30, FORECAST)
+    assert key != result_key(_user_data(tank_capacity=1500), ["pi", "fuzzy"], {}, 30, FORECAST)
+    assert key != result_key(_user_data(), ["pi", "fuzzy"], {}, 30, [(date(2025, 1, 1), 0.1), FORECAST[1]])
+    assert key != result_key(_user_data(), ["pi"], {}, 30, FORECAST)
+
+
+
+def test_result_key_resolves_env_defaults(monkeypatch):
+    unset = {"fuzzy": {"fuzzy_mode": None}, "mpc": {"lookahead_days": None}}
+    monkeypatch.setenv("FUZZY_MODE", "exact")
+    monkeypatch.setenv("MPC_HORIZON", "3")
+    key = result_key(_user_data(), ["fuzzy", "mpc"], unset, 30, FORECAST)
+    # Jawna wartość równa domyślnej - ten sam wynik, ten sam klucz
+    assert key == result_key(_user_data(), ["fuzzy", "mpc"],
+                             {"fuzzy": {"fuzzy_mode": "exact"}, "mpc": {"lookahead_days": 3}}, 30, FORECAST)
+
+    monkeypatch.setenv("FUZZY_MODE", "surface")
+    assert result_key(_user_data(), ["fuzzy", "mpc"], unset, 30, FORECAST) != key
+    monkeypatch.setenv("FUZZY_MODE", "exact")
+    monkeypatch.setenv("MPC_HORIZON", "5")
+    assert result_key(_user_data(), ["fuzzy", "mpc"], unset, 30, FORECAST) != key
+
+def test_memory_hit_and_miss():
+    cache = ResultCache(max_entries=2, max_bytes=1 << 20)
+    assert cache.get("a") is None
+    cache.put("a", {"value": 1})
+    assert cache.get("a") == {"value": 1}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2, max_bytes=1 << 20)
+    cache.put("a", {"value": 1})
+    cache.put("b", {"value": 2})
+    cache.get("a")
+    cache.put("c", {"value": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"value": 1}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_db_tier_hit_survives_new_process(app):
+    cache = ResultCache(max_entries=8, max_bytes=1 << 20, db_tier=True)
+    cache.put("a", {"value": 1})
+    assert SimulationResultCache.query.count() == 1
+
+    # Nowa instancja (np. inny proces) - pusta pamięć, trafienie w bazie
+    fresh = ResultCache(max_entries=8, max_bytes=1 << 20, db_tier=True)
+    assert fresh.get("a") == {"value": 1}
+    assert fresh.get("missing") is None
+    stats = fresh.stats()
+    assert (stats["db_hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_db_tier_error_is_a_miss(app):
+    from app.init_db import db
+
+    cache = ResultCache(max_entries=8, max_bytes=1 << 20, db_tier=True)
+    db.session.add(SimulationResultCache(key="broken", payload="{not json", size=9))
+    db.session.commit()
+
+    assert cache.get("broken") is None
+    assert cache.stats()["misses"] == 1
+    # Sesja po rollbacku nadal działa
+    cache.put("a", {"value": 1})
+    assert ResultCache(max_entries=8, max_bytes=1 << 20, db_tier=True).get("a") == {"value": 1}
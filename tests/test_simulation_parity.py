@@ -0,0 +1,92 @@
+import random
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.api.batch_simulation_service import BatchScenarios, batch_scenario_records, run_water_simulation_batch
+from app.api.simulation_service import UserData, run_water_simulation, run_water_simulation_fuzzy
+
+RAIN_AMOUNTS = (0.0, 0.0, 0.0, 0.0, 0.4, 1.5, 3.0, 6.5, 12.0, 25.0, 48.0)
+
+
+def _forecast(days: int, seed: int) -> list[tuple[date, float]]:
+    rng = random.Random(seed)
+    return [(date(2025, 1, 1) + timedelta(days=i), rng.choice(RAIN_AMOUNTS)) for i in range(days)]
+
+
+def _scenarios(count: int, seed: int = 0) -> list[UserData]:
+    rng = random.Random(seed)
+    scenarios = []
+    for _ in range(count):
+        capacity = rng.choice((300, 500, 1000, 1500, 5000, 10000))
+        scenarios.append(UserData(
+            tank_capacity=capacity,
+            min_water_level=capacity * rng.choice((0.1, 0.2, 0.4)),
+            daily_water_usage=rng.choice((20, 50, 80, 150, 300)),
+            rooftop_size=rng.choice((5, 25, 50, 100, 200)),
+            location="test",
+            initial_water_level=rng.choice((None, 0, capacity * 0.5, capacity)),
+        ))
+    return scenarios
+
+
+def test_batch_pi_matches_scalar_pi_exactly():
+    scenarios = _scenarios(200)
+    forecast = _forecast(120, seed=1)
+    results = run_water_simulation_batch(BatchScenarios.from_user_data(scenarios),
+                                         [rainfall_mm for _, rainfall_mm in forecast])
+    dates = [forecast_date for forecast_date, _ in forecast]
+    for index, user_data in enumerate(scenarios):
+        assert batch_scenario_records(results, dates, index) == run_water_simulation(user_data, forecast, horizon=None)
+
+
+def test_batch_pi_accepts_per_scenario_rainfall():
+    scenarios = _scenarios(20, seed=3)
+    forecasts = [_forecast(60, seed=index) for index in range(len(scenarios))]
+    rainfall = np.array([[rainfall_mm for _, rainfall_mm in forecast] for forecast in forecasts])
+    results = run_water_simulation_batch(BatchScenarios.from_user_data(scenarios), rainfall)
+    for index, (user_data, forecast) in enumerate(zip(scenarios, forecasts)):
+        dates = [forecast_date for forecast_date, _ in forecast]
+        assert batch_scenario_records(results, dates, index) == run_water_simulation(user_data, forecast, horizon=None)
+
+
+def _exact_or_zero(controller, level_error: float, rainfall_mm: float) -> float:
+    # Bez aktywnej reguły skfuzzy rzuca wyjątek, a symulacja wtedy nie pompuje
+    try:
+        return controller.compute(level_error, rainfall_mm)
+    except Exception:
+        return 0.0
+
+
+@pytest.mark.parametrize("tank_capacity", [500, 1500, 5000])
+def test_fuzzy_surface_within_tolerance_of_exact_inference(app, tank_capacity):
+    # Gwarancja tablicy wyjść: FUZZY_SURFACE_MAX_ERROR (0,2%) pojemności, sprawdzana na innych
+    # punktach niż te użyte przy jej budowie
+    from app.api.fuzzy_controller_registry import FuzzyController
+    controller = FuzzyController(tank_capacity)
+    surface = controller.surface()
+    assert surface is not None
+    tolerance = 0.002 * tank_capacity
+
+    rng = np.random.default_rng(12345)
+    for level_error, rainfall_mm in zip(rng.uniform(0, surface.error_axis[-1], 300).tolist(),
+                                        rng.uniform(0, surface.rainfall_axis[-1], 300).tolist()):
+        approximate = surface.interpolate(level_error, rainfall_mm)
+        if approximate is not None:
+            assert abs(approximate - _exact_or_zero(controller, level_error, rainfall_mm)) <= tolerance
+
+
+@pytest.mark.parametrize("tank_capacity", [500, 1500, 5000])
+def test_fuzzy_surface_simulation_tracks_exact_simulation(app, tank_capacity):
+    user_data = UserData(tank_capacity=tank_capacity, min_water_level=tank_capacity * 0.3, daily_water_usage=80,
+                         rooftop_size=20, location="test")
+    tolerance = 0.002 * tank_capacity
+    for seed in range(3):
+        forecast = _forecast(90, seed=seed)
+        exact = run_water_simulation_fuzzy(user_data, forecast, fuzzy_mode="exact", horizon=None)
+        surface = run_water_simulation_fuzzy(user_data, forecast, fuzzy_mode="surface", horizon=None)
+        assert [day["date"] for day in exact] == [day["date"] for day in surface]
+        for exact_day, surface_day in zip(exact, surface):
+            for field in ("water_amount", "pumped_up_water", "pumped_out_water"):
+                assert abs(exact_day[field] - surface_day[field]) <= tolerance, (seed, exact_day["date"], field)
@@ -0,0 +1,156 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.init_db import db
+from app.api.run_query_service import aggregate_days, list_runs, run_days
+from app.api.simulation_request_service import SimulationRequestError, persist_run
+from app.api.simulation_service import UserData
+from app.models.simulation_run import SimulationRun, SimulationRunDay
+
+
+def _user_data(location: str = "Poznań") -> UserData:
+    return UserData(tank_capacity=1000, min_water_level=300, daily_water_usage=80, rooftop_size=10, location=location)
+
+
+def _records(days: int, start: date = date(2025, 1, 1)) -> list[dict]:
+    return [{
+        "date": (start + timedelta(days=i)).isoformat(),
+        "water_amount": 300.0 + i,
+        "rainfall_amount": float(i % 3),
+        "daily_consumption": 80.0,
+        "saved_water": float(i % 3) * 10,
+        "pumped_up_water": 5.0,
+        "pumped_out_water": 1.0 if i % 7 == 0 else 0.0,
+    } for i in range(days)]
+
+
+def test_persist_run_stores_run_and_daily_rows(app):
+    records = _records(10)
+    run_id = persist_run(_user_data(), "pi", records, 10, {"pi": {}})
+
+    run = db.session.get(SimulationRun, run_id)
+    assert (run.location, run.controller, run.days) == ("Poznań", "pi", 10)
+    assert (run.start_date, run.end_date) == (date(2025, 1, 1), date(2025, 1, 10))
+    assert run.total_pumped_up_water == 50.0
+    assert run.final_water_amount == 309.0
+    assert run.parameters["tank_capacity"] == 1000 and run.parameters["horizon"] == 10
+
+    days = SimulationRunDay.query.filter_by(run_id=run_id).order_by(SimulationRunDay.date).all()
+    assert [day.to_json() for day in days] == records
+
+
+def test_persist_run_keeps_earlier_runs(app):
+    first = persist_run(_user_data(), "pi", _records(3), 3, {})
+    second = persist_run(_user_data(), "pi", _records(3), 3, {})
+    assert first != second
+    assert SimulationRunDay.query.count() == 6
+
+
+def test_list_runs_keyset_pagination_visits_every_run_once(app):
+    run_ids = [persist_run(_user_data(), "pi", _records(2), 2, {}) for _ in range(7)]
+    # Wspólny created_at dla części przebiegów - kursor musi rozstrzygać remisy po id
+    same_time = datetime(2025, 6, 1, 12, 0, 0)
+    SimulationRun.query.filter(SimulationRun.id.in_(run_ids[2:5])).update({"created_at": same_time})
+    db.session.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = list_runs({"limit": "3", **({"cursor": cursor} if cursor else {})})
+        seen += [run["run_id"] for run in page["runs"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(run_ids)
+    assert len(seen) == len(set(seen))
+
+    expected = sorted(SimulationRun.query.all(), key=lambda run: (run.created_at, run.id), reverse=True)
+    assert seen == [run.id for run in expected]
+
+
+def test_run_days_pagination_by_date(app):
+    run_id = persist_run(_user_data(), "pi", _records(10), 10, {})
+    first = run_days(run_id, {"limit": "4"})
+    assert [day["date"] for day in first["days"]] == ["2025-01-01", "2025-01-02", "2025-01-03", "2025-01-04"]
+    second = run_days(run_id, {"limit": "4", "cursor": first["next_cursor"]})
+    assert second["days"][0]["date"] == "2025-01-05"
+
+
+
+@pytest.mark.parametrize("limit", ["0", "-5", "1001", "abc", "2.5"])
+def test_invalid_limit_is_rejected(app, limit):
+    run_id = persist_run(_user_data(), "pi", _records(3), 3, {})
+    for query in (lambda: list_runs({"limit": limit}), lambda: run_days(run_id, {"limit": limit})):
+        with pytest.raises(SimulationRequestError) as error:
+            query()
+        assert error.value.status_code == 400
+
+
+def test_invalid_limit_returns_400_over_http(app):
+    response = app.test_client().get("/api/runs?limit=5000")
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["error"]
+
+def test_aggregate_week_buckets_start_on_monday(app):
+    # 2025-01-01 to środa: pierwszy tydzień ISO zaczyna się 2024-12-30 i ma 5 dni
+    run_id = persist_run(_user_data(), "pi", _records(14), 14, {})
+    periods = aggregate_days({"period": "week"}, run_id=run_id)["periods"]
+    assert [(period["period_start"], period["days"]) for period in periods] == [
+        ("2024-12-30", 5), ("2025-01-06", 7), ("2025-01-13", 2)]
+    assert periods[1]["total_pumped_up_water"] == 35.0
+    assert periods[1]["runs"] == 1
+
+
+def test_aggregate_month_buckets_across_runs(app):
+    persist_run(_user_data(), "pi", _records(40, start=date(2025, 1, 15)), 40, {})
+    persist_run(_user_data(), "fuzzy", _records(40, start=date(2025, 1, 15)), 40, {})
+    persist_run(_user_data("Kraków"), "pi", _records(40, start=date(2025, 1, 15)), 40, {})
+
+    periods = aggregate_days({"period": "month", "location": "Poznań"})["periods"]
+    assert [(period["period_start"], period["days"], period["runs"]) for period in periods] == [
+        ("2025-01-01", 34, 2), ("2025-02-01", 46, 2)]
+    assert periods[0]["total_pumped_up_water"] == 170.0
+
+
+def test_startup_adds_day_date_index_to_existing_database(app):
+    from sqlalchemy import inspect, text
+    from app.init_db import create_app
+
+    # Baza sprzed indeksu - create_all nie dopisuje indeksów do istniejącej tabeli
+    db.session.execute(text("DROP INDEX ix_simulation_run_day_date_run"))
+    db.session.commit()
+    create_app()
+    indexes = {index["name"]: index["column_names"] for index in inspect(db.engine).get_indexes("simulation_run_day")}
+    assert indexes["ix_simulation_run_day_date_run"] == ["date", "run_id"]
+
+def test_water_balance_rows_import_as_single_run(app):
+    from sqlalchemy import text
+    from app.water_balance_import import import_water_balance
+
+    db.session.execute(text(
+        "CREATE TABLE water_balance (id INTEGER PRIMARY KEY, date DATE NOT NULL UNIQUE, water_amount FLOAT, "
+        "rainfall_amount FLOAT, daily_consumption FLOAT, saved_water FLOAT, pumped_up_water FLOAT, "
+        "pumped_out_water FLOAT)"))
+    records = _records(3)
+    for record in reversed(records):
+        db.session.execute(text(
+            "INSERT INTO water_balance (date, water_amount, rainfall_amount, daily_consumption, saved_water, "
+            "pumped_up_water, pumped_out_water) VALUES (:date, :water_amount, :rainfall_amount, "
+            ":daily_consumption, :saved_water, :pumped_up_water, :pumped_out_water)"), record)
+    db.session.commit()
+
+    run = import_water_balance("Poznań")
+    assert (run["location"], run["controller"], run["source"], run["days"]) == ("Poznań", "pi", "water_balance", 3)
+    assert run["total_pumped_up_water"] == 15.0 and run["final_water_amount"] == 302.0
+    days = SimulationRunDay.query.filter_by(run_id=run["run_id"]).order_by(SimulationRunDay.date).all()
+    assert [day.to_json() for day in days] == records
+
+    # Drugi import nic nie dubluje
+    assert import_water_balance("Poznań") is None
+    assert SimulationRun.query.count() == 1
+
+
+def test_water_balance_import_without_legacy_table(app):
+    from app.water_balance_import import import_water_balance
+
+    assert import_water_balance("Poznań") is None
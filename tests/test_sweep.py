@@ -0,0 +1,51 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from app.api import sweep_service
+from app.api.sweep_service import build_sweep_grid, run_parameter_sweep
+from app.api.simulation_service import UserData, run_water_simulation, run_water_simulation_fuzzy
+
+GRID = {"tank_capacity": [500, 1500], "min_water_level": 200, "daily_water_usage": [50, 120], "rooftop_size": 20}
+
+
+def _forecast(days: int) -> list[tuple[date, float]]:
+    rng = random.Random(3)
+    return [(date(2025, 1, 1) + timedelta(days=i), rng.choice((0.0, 0.0, 2.5, 9.0, 30.0))) for i in range(days)]
+
+
+def _point(entry: dict) -> UserData:
+    return UserData(entry["tank_capacity"], entry["min_water_level"], entry["daily_water_usage"],
+                    entry["rooftop_size"], location="sweep")
+
+
+def test_sweep_uses_horizon_and_rounded_daily_totals_for_both_controllers():
+    forecast = _forecast(40)
+    result = run_parameter_sweep(build_sweep_grid(GRID), forecast, 12, limit=10, fuzzy_mode="exact")
+    assert result["forecast_days"] == 12
+
+    for name, simulate in (("pi", run_water_simulation), ("fuzzy", run_water_simulation_fuzzy)):
+        for entry in result[f"{name}_controller_ranking"]:
+            records = simulate(_point(entry), forecast, horizon=12)
+            assert len(records) == 12
+            assert entry["total_pumped_up_water"] == pytest.approx(sum(r["pumped_up_water"] for r in records))
+            assert entry["final_water_amount"] == records[-1]["water_amount"]
+
+
+def test_sweep_rejects_rank_by_and_limit_before_fetching_forecast(app, monkeypatch):
+    from app.controllers import routes
+
+    def fetch(*args, **kwargs):
+        raise AssertionError("forecast fetched for an invalid request")
+
+    monkeypatch.setattr(routes, "fetch_rainfall_forecast", fetch)
+    client = app.test_client()
+    for extra in ({"rank_by": "saved_water"}, {"limit": 0}, {"horizon": 0}):
+        response = client.post("/api/sweep", json={**GRID, "location": "Poznań", **extra})
+        assert response.status_code == 400
+
+
+def test_rank_by_is_validated():
+    with pytest.raises(ValueError):
+        sweep_service.parse_rank_by("saved_water")
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app.api.simulation_request_service import controller_options
+from app.api.simulation_service import UserData, run_controller_simulation
+from app.api.tank_controllers import TankController, create_controller
+
+
+def _user_data() -> UserData:
+    return UserData(tank_capacity=1000, min_water_level=300, daily_water_usage=100, rooftop_size=1, location="test")
+
+
+def test_controller_without_request_pumping_fails_at_construction():
+    class Incomplete(TankController):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(_user_data(), [])
+
+
+def test_mpc_lookahead_changes_pumping_decision():
+    dry_forecast = [(date(2025, 1, 1) + timedelta(days=i), 0.0) for i in range(20)]
+    short = create_controller("mpc", _user_data(), dry_forecast, lookahead_days=1)
+    long = create_controller("mpc", _user_data(), dry_forecast, lookahead_days=3)
+    # 500 L, zużycie 100 L/dzień, minimum 300 L: jutro wystarczy, za trzy dni już nie
+    assert short.request_pumping(0, 500.0, 0.0) == 0.0
+    assert long.request_pumping(0, 500.0, 0.0) == 100.0
+
+
+def test_mpc_lookahead_is_a_request_option_independent_of_horizon():
+    forecast = [(date(2025, 1, 1) + timedelta(days=i), 40.0 if i % 6 == 5 else 0.0) for i in range(30)]
+    totals = {}
+    for lookahead in (1, 5):
+        options = controller_options({"controller_options": {"mpc": {"lookahead_days": lookahead}}}, "mpc")
+        records = run_controller_simulation("mpc", _user_data(), forecast, horizon=12, **options)
+        assert len(records) == 12
+        totals[lookahead] = sum(record["pumped_up_water"] for record in records)
+    assert totals[1] != totals[5]
+
+    assert controller_options({"lookahead_days": 4}, "mpc") == {"lookahead_days": 4}
+
+
+def test_mpc_rejects_the_old_horizon_option():
+    with pytest.raises(ValueError):
+        create_controller("mpc", _user_data(), [], horizon=3)